@@ -0,0 +1,152 @@
+"""HTTP client for the ACNH API.
+
+One pooled requests.Session per base URL, with timeouts, bounded retries
+with backoff, conditional requests (ETag/If-Modified-Since) and an on-disk
+response cache with a TTL.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from files import write_atomic
+from metrics import metrics
+
+API_BASE_URL = os.environ.get('ACNH_API_URL', "https://acnhapi.com/v1a")
+CACHE_DIR = os.environ.get('ACNH_API_CACHE_DIR',
+                           os.path.join(tempfile.gettempdir(), 'acnh-api-cache'))
+CACHE_TTL = int(os.environ.get('ACNH_API_CACHE_TTL', 3600))
+
+
+class ACNHClient:
+    """Client for one ACNH API base URL.
+
+    Point `base_url` at a local stand-in server to test without acnhapi.com.
+    """
+
+    def __init__(self, base_url=API_BASE_URL, cache_dir=CACHE_DIR, ttl=CACHE_TTL,
+                 timeout=(3.05, 10), retries=3, backoff=0.5, pool_size=4):
+        self.base_url = base_url.rstrip('/')
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.timeout = timeout
+
+        retry = Retry(total=retries,
+                      backoff_factor=backoff,
+                      status_forcelist=(429, 500, 502, 503, 504),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                              max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_json(self, path):
+        """Return the parsed JSON body for `path`; see fetch_json."""
+
+        return self.fetch_json(path)[0]
+
+    def fetch_json(self, path, unless_etag=None):
+        """Return (body, etag): the parsed JSON body for `path` and its ETag
+        (None if upstream sends none).
+
+        A cached response younger than the TTL is served from disk without
+        a request. An older one is revalidated with a conditional request;
+        a 304 only refreshes its timestamp.
+
+        If the current ETag is `unless_etag` (the one the caller last
+        synced from, e.g. CreatureCategory.source_etag), body is None, so
+        callers can skip parsing and syncing entirely. The cache only
+        stores responses; whether they were applied is the caller's record.
+        """
+
+        url = f'{self.base_url}/{path.lstrip("/")}'
+        body_path, meta_path = self._cache_paths(url)
+        meta = self._read_meta(meta_path)
+        if meta and not os.path.exists(body_path):
+            meta = None
+
+        if meta and time.time() - meta['fetched_at'] < self.ttl:
+            return self._cached(body_path, meta, unless_etag)
+
+        headers = {}
+        if meta and meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta and meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        finally:
+            metrics.observe_external('acnhapi', time.perf_counter() - start)
+
+        if response.status_code == 304 and meta:
+            meta['fetched_at'] = time.time()
+            write_atomic(meta_path, json.dumps(meta).encode())
+            return self._cached(body_path, meta, unless_etag)
+
+        response.raise_for_status()
+
+        etag = response.headers.get('ETag')
+        write_atomic(body_path, response.content)
+        write_atomic(meta_path, json.dumps({
+            'etag': etag,
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+        }).encode())
+        if etag is not None and etag == unless_etag:
+            return None, etag
+        return response.json(), etag
+
+    def get_bytes(self, url):
+        """Download `url` (absolute, e.g. an icon) and return the raw body.
+
+        Uses the pooled session and retries but not the response cache;
+        callers keep their own copy of what they download.
+        """
+
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        finally:
+            metrics.observe_external('acnhapi', time.perf_counter() - start)
+        response.raise_for_status()
+        return response.content
+
+    def _cache_paths(self, url):
+        key = hashlib.sha1(url.encode()).hexdigest()
+        return (os.path.join(self.cache_dir, f'{key}.json'),
+                os.path.join(self.cache_dir, f'{key}.meta'))
+
+    def _read_meta(self, meta_path):
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _cached(self, body_path, meta, unless_etag):
+        etag = meta.get('etag')
+        if etag is not None and etag == unless_etag:
+            return None, etag
+        return self._read_body(body_path), etag
+
+    def _read_body(self, body_path):
+        with open(body_path, 'rb') as f:
+            return json.loads(f.read())
+
+_clients = {}
+
+
+def get_client(base_url=API_BASE_URL):
+    """Return the shared client for `base_url`, creating it on first use."""
+
+    if base_url not in _clients:
+        _clients[base_url] = ACNHClient(base_url)
+    return _clients[base_url]
@@ -1,73 +1,146 @@
-from flask import Flask, render_template, request, flash, jsonify, redirect, session, g, abort
-from flask_debugtoolbar import DebugToolbarExtension
-from sqlalchemy.exc import IntegrityError
-import requests
-import os
-
-from models import db, connect_db, User, Fish, User_Fish
-from forms import UserAddForm, LoginForm
+"""ACNH Fish Tracker web app.
+
+create_app() builds the app for a config profile (see config.py); the
+Procfile serves it behind async_api.create_web_app(), or run it alone with
+`gunicorn 'app:create_app()'`. Importing this module only
+defines the views, so scripts and tests pay for no app, engine or
+extension they don't create. Dependencies only some paths need are
+imported where they are used: the debug toolbar (development only),
+WTForms (login, signup and share forms) and the ACNH API client (sync).
+"""
+from flask import Flask, Blueprint, Response, stream_with_context, render_template, request, flash, jsonify, redirect, session, g, abort, send_from_directory, current_app
+from werkzeug.local import LocalProxy
+from sqlalchemy.exc import IntegrityError, OperationalError
+from bisect import bisect_right
+from functools import wraps
+from itertools import islice
+import io
+import time
+
+from config import get_config
+from models import db, connect_db, User, Fish, Collection, CreatureCategory
+from catalog import parse_fish, sync_fish, fish_catalog, caught_ids, collection_items
+from identity import identity_cache
+from passwords import HashingBusy
+from listing import parse_list_args, project, page_json, stream_json
+from search import parse_search_args
+from metrics import metrics
+from fragments import card_grid
+from icons import FILE_NAME, icon_store, sync_icons
+from assets import assets
+from compression import compressor
+from share import find_share, snapshot_etag, snapshot_html, snapshot_json
+from stats import most_caught, parse_limit, user_progress
+from transfer import FORMATS, MIMETYPES, export_user, import_file
 
 CURR_USER_KEY = "curr_user"
-API_BASE_URL = "https://acnhapi.com/v1a"
+WROTE_AT_KEY = "wrote_at"
+
+# Same for every viewer: never read the session, so responses don't vary by cookie.
+PUBLIC_ENDPOINTS = {'views.show_shared_fish', 'views.show_shared_fish_json'}
+
+# Most caught fish listed on the home page
+HOME_MOST_CAUGHT = 5
+
+# Largest collection import accepted over HTTP (bigger ones: python transfer.py import)
+MAX_IMPORT_BYTES = 1024 * 1024
+
+views = Blueprint('views', __name__)
+
+
+def create_app(config=None):
+    """Create the app with config profile `config`: a name from
+    config.CONFIGS or a config class (default: see config.get_config).
+
+    Creates no database connections; each engine's pool opens them on
+    first use, so an app created before gunicorn forks is safe to share.
+    """
+
+    app = Flask(__name__)
+    app.config.from_object(config if isinstance(config, type) else get_config(config))
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'postgresql:///acnhcreatures')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = True
+    connect_db(app)
+    assets.init_app(app)
 
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'hellosecret1')
+    if app.config['METRICS_ENABLED']:
+        metrics.init_app(app)
 
-connect_db(app)
+    if app.config['COMPRESS_ENABLED']:
+        compressor.init_app(app)
 
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
+    if app.config['DEBUG_TB_ENABLED']:
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
 
-debug = DebugToolbarExtension(app)
+    app.register_blueprint(views)
+    return app
 
 ##############################################################################
 ########## API Call ##########
-def get_all_fish():
-    """Make API call for all fish."""
-    response = requests.get(f'{API_BASE_URL}/fish')
-    data = response.json()
-    all_fish = []
-    for d in data:
-        name = d['name']['name-USen']
-        icon = d['icon_uri']
-        catchphrase = d['catch-phrase']
-        fish = {'name': name, 'icon_url': icon, 'catchphrase': catchphrase}
-        all_fish.append(fish)
-    return all_fish
+def get_all_fish(base_url=None, only_if_changed=False):
+    """Make API call for all fish (to api_client.API_BASE_URL by default).
+
+    Returns (fish, etag): the parsed fish and the payload's ETag. With
+    `only_if_changed`, fish is None if the ETag is the one this database's
+    fish were last synced from (see models.CreatureCategory)."""
+    from api_client import API_BASE_URL, get_client
+
+    synced_etag = CreatureCategory.synced_etag('fish') if only_if_changed else None
+    data, etag = get_client(base_url or API_BASE_URL).fetch_json('/fish', unless_etag=synced_etag)
+    if data is None:
+        return None, etag
+    return parse_fish(data), etag
 
 ########## Load Fish Database ##########
-def load_database():
-    """Load all fish from API to database."""
-    all_fish = get_all_fish()
-    for fish in all_fish:
-        name = fish['name']
-        icon = fish['icon_url']
-        catchphrase = fish['catchphrase']
-        new_fish = Fish(name=name, icon_url=icon, catchphrase=catchphrase)
-        db.session.add(new_fish)
-        db.session.commit()
+def load_database(all_fish=None, force=False, source_etag=None):
+    """Sync all fish from API (or `all_fish`, downloaded with ETag
+    `source_etag`) to database, then cache their icons.
+
+    Returns the sync report from catalog.sync_fish with the icons.sync_icons
+    report under 'icons', or None if the API reports no change since the
+    last sync and `force` is not set."""
+    from api_client import get_client
+
+    if all_fish is None:
+        all_fish, source_etag = get_all_fish(only_if_changed=not force)
+        if all_fish is None:
+            return None
+    report = sync_fish(all_fish, source_etag)
+    report['icons'] = sync_icons(Fish.query.order_by(Fish.id).all(), get_client())
+    return report
 
 ##############################################################################
 # User register/login/logout
 
 
-@app.before_request
+@views.before_app_request
 def add_user_to_g():
-    """If we're logged in, add curr user to Flask global."""
+    """If we're logged in, add curr user to Flask global.
 
-    if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+    g.user_id is read from the signed session cookie without a query.
+    g.user is a lazy proxy: the User is only loaded (through the identity
+    cache) when a view or template actually touches it. PUBLIC_ENDPOINTS
+    see everyone as logged out.
+    """
 
-    else:
-        g.user = None
+    g.user_id = None if request.endpoint in PUBLIC_ENDPOINTS else session.get(CURR_USER_KEY)
+    g.user = LocalProxy(load_current_user)
+    # g outlives the request if its app context was pushed beforehand (tests, scripts)
+    g.pop('_user', None)
+
+
+def load_current_user():
+    """Return the logged in User (or None), loading it once per request."""
+
+    if '_user' not in g:
+        g._user = identity_cache.get(g.user_id) if g.user_id else None
+    return g._user
 
 
 def do_login(user):
-    """Log in user."""
+    """Log in user (after committing any change to it, e.g. a rehash)."""
 
+    identity_cache.forget(user.id)
     session[CURR_USER_KEY] = user.id
 
 
@@ -75,9 +148,10 @@ def do_logout():
     """Logout user."""
 
     if CURR_USER_KEY in session:
+        identity_cache.forget(session[CURR_USER_KEY])
         del session[CURR_USER_KEY]
 
-@app.route('/register', methods=["GET", "POST"])
+@views.route('/register', methods=["GET", "POST"])
 def signup():
     """Handle user registration.
 
@@ -87,10 +161,13 @@ def signup():
 
     If there already is a user with that username: flash message
     and re-present form.
-    
-    When user registers, save all fish to user's id in Users_Fish DB as uncaught.
+
+    New users start with no Users_Fish rows: every fish is uncaught
+    until the user catches it.
     """
 
+    from forms import UserAddForm
+
     form = UserAddForm()
 
     if form.validate_on_submit():
@@ -107,19 +184,18 @@ def signup():
             return render_template('users/register.html', form=form)
 
         do_login(user)
-        add_user_to_g()
-        #when user registers, save all uncaught fish to user's id in Users_Fish table as uncaught
-        create_user_uncaught_fish()
         return redirect("/")
 
     else:
         return render_template('users/register.html', form=form)
 
 
-@app.route('/login', methods=["GET", "POST"])
+@views.route('/login', methods=["GET", "POST"])
 def login():
     """Handle user login."""
 
+    from forms import LoginForm
+
     form = LoginForm()
 
     if form.validate_on_submit():
@@ -127,6 +203,8 @@ def login():
                                  form.password.data)
 
         if user:
+            # authenticate may have upgraded the password hash
+            db.session.commit()
             do_login(user)
             flash(f"Hello, {user.username}!", "success")
             return redirect("/")
@@ -136,7 +214,7 @@ def login():
     return render_template('users/login.html', form=form)
 
 
-@app.route('/logout')
+@views.route('/logout')
 def logout():
     """Handle logout of user."""
 
@@ -148,123 +226,464 @@ def logout():
 # Homepage and error pages
 
 
-@app.route('/')
+@views.route('/')
 def show_home():
     """Show homepage."""
 
     if g.user:
-        return render_template('home.html', user=g.user)
+        from forms import ShareForm
+
+        catalog = fish_catalog.get()
+        return render_template('home.html', user=g.user, share_form=ShareForm(),
+                               progress=user_progress(catalog, g.user_id),
+                               most_caught=most_caught(catalog, limit=HOME_MOST_CAUGHT))
 
     else:
         return render_template('home-anon.html')
 
 #error handlers for 404 and 500 below copied 
 # from Julian Nash's Youtube tutorial video: Flask error handling - Python on the web - Learning Flask Ep. 18
-@app.errorhandler(404)
+@views.app_errorhandler(404)
 def not_found(e):
     return render_template('errors/404.html')
 
-@app.errorhandler(500)
+@views.app_errorhandler(500)
 def server_error(e):
-    app.logger.error(f"Server error: {e}, route: {request.url}")
+    current_app.logger.error(f"Server error: {e}, route: {request.url}")
     return render_template('errors/500.html')
 
-@app.errorhandler(403)
+@views.app_errorhandler(403)
 def forbidden(e):
     return render_template('errors/403.html')
 
-@app.errorhandler(405)
+@views.app_errorhandler(405)
 def method_not_allowed(e):
     return render_template('errors/405.html')
 
+@views.app_errorhandler(HashingBusy)
+def hashing_busy(e):
+    return render_template('errors/503.html'), 503, {'Retry-After': '1'}
+
 ##############################################################################
 # Helpers:
 
-def create_user_uncaught_fish():
-    all_fish = Fish.query.all()
-    for f in all_fish:
-        uncaught_fish = User_Fish(user_id=g.user.id, fish_id=f.id, is_caught=False)
-        db.session.add(uncaught_fish)
-        db.session.commit()
-
-def json_all_fish():
-    """Make API call. 
-    Return JSON {'name': name, 'icon_url': icon_url, 'catchphrase': catchphrase }"""
-    all_fish = Fish.query.all()
-    response_json = jsonify(fish=all_fish)
-    return (response_json, 201)
+def json_response(body, etag):
+    """Return pre-encoded JSON `body` with a strong ETag, or 304 if the client has it."""
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+def collection_etag(user_id, icons=None):
+    """ETag for a user's merged collection, or None if there is no such user.
+
+    Changes whenever the user's caught fish, the fish catalog or the
+    deployed release change, and with the sprite sheet of icon manifest
+    `icons` for pages that show it. Costs one primary key lookup on users."""
+    version = User.collection_version_of(user_id)
+    if version is None:
+        return None
+    return format_collection_etag(user_id, version, fish_catalog.get(), current_app.config['RELEASE_ID'],
+                                  icons)
+
+def format_collection_etag(user_id, collection_version, catalog, release_id, icons=None):
+    """ETag of a user's collection at `collection_version`, shown against catalog snapshot `catalog`
+    (and the sprite sheet of icon manifest `icons`, if given)."""
+    etag = f"{user_id}.{collection_version}.{catalog.version}.{release_id}"
+    if icons is not None:
+        etag += f".{icons.sprite}"
+    return etag
+
+def collection_not_modified(etag):
+    """Return a 304 if the client already has `etag` (and no flash is waiting), else None."""
+    if etag and request.if_none_match.contains_weak(etag) and '_flashes' not in session:
+        return private_etag(Response(status=304), etag)
+    return None
+
+def private_etag(response, etag):
+    """Tag a per-user response so browsers revalidate it before reuse."""
+    if etag:
+        response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def public_etag(response, etag):
+    """Tag a response that is the same for every viewer so shared caches can keep it."""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f"public, max-age={current_app.config['SHARE_MAX_AGE']}"
+    return response
+
+def read_only(view):
+    """Serve `view` from the read replica, if there is one.
+
+    Reads stay on the primary for REPLICA_STICKY_SECONDS after the user's
+    last write, and the view is run again on the primary if the replica
+    can't be reached."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if (db.replica_engine() is None
+                or time.time() - session.get(WROTE_AT_KEY, 0) < current_app.config['REPLICA_STICKY_SECONDS']):
+            return view(*args, **kwargs)
+        try:
+            with db.reading():
+                return view(*args, **kwargs)
+        except OperationalError:
+            if not db.replica_failed():
+                raise
+            db.session.rollback()
+            return view(*args, **kwargs)
+    return wrapper
+
+@views.after_app_request
+def remember_writes(response):
+    """Note when a logged-in user last wrote, so read_only views read their writes."""
+    if (request.method not in ('GET', 'HEAD') and response.status_code < 400
+            and CURR_USER_KEY in session and db.replica_engine() is not None):
+        session[WROTE_AT_KEY] = int(time.time())
+    return response
+
+def list_args(allowed_fields):
+    """Parse list query parameters for the current request, or abort with 400."""
+    try:
+        return parse_list_args(request.args, allowed_fields)
+    except ValueError as e:
+        abort(400, description=str(e))
+
+def json_list_response(key, items, args, id_field):
+    """Return one page of `items` if paginated, else stream them all.
+
+    A page holds up to args.limit items; pass one more to know whether
+    there is a next page."""
+    if args.paginated:
+        items = list(items)
+        page = items[:args.limit]
+        next_after = page[-1][id_field] if len(items) > args.limit else None
+        return Response(page_json(key, [project(i, args.fields) for i in page], next_after),
+                        mimetype='application/json')
+    return Response(stream_with_context(stream_json(key, (project(i, args.fields) for i in items))),
+                    mimetype='application/json')
+
+FISH_FIELDS = ('id', 'name', 'icon_url', 'catchphrase')
+USER_FISH_FIELDS = ('user_id', 'fish_id', 'name', 'icon_url', 'catchphrase', 'is_caught')
+MAX_BULK_CHANGES = 500
 
 ##############################################################################
 # API Fish routes:
-@app.route('/api/fish')
+@views.route('/api/fish')
+@read_only
 def show_all_fish_json():
-    """Get name, icon_url, and catchphrase info for all fish from the API.
+    """Get name, icon_url, and catchphrase info for all fish from the in-memory catalog.
+    Supports ?after=<fish_id>&limit= and ?fields=.
     Return JSON {fish: 'name': name, 'icon_url': icon_url, 'catchphrase': catchphrase }."""
-    return json_all_fish()
+    catalog = fish_catalog.get()
+    if not request.args:
+        return json_response(catalog.all_json, catalog.all_etag)
 
-@app.route('/api/fish/<int:fish_id>')
+    args = list_args(FISH_FIELDS)
+    if args.caught is not None:
+        abort(400, description="caught filter is only available on /api/users/<id>/fish")
+
+    ids = catalog.ids
+    start = bisect_right(ids, args.after) if args.after is not None else 0
+    stop = start + args.limit + 1 if args.paginated else len(ids)
+    return json_list_response('fish', (catalog.fish[i] for i in ids[start:stop]), args, 'id')
+
+@views.route('/api/fish/<int:fish_id>')
+@read_only
 def show_one_fish_json(fish_id):
-    """Get more info for one fish in the database.
+    """Get more info for one fish from the in-memory catalog.
     Return JSON {'name': name, 'icon_url': icon_url, 'catchphrase': catchphrase }."""
-    fish = Fish.query.get_or_404(fish_id)
-    return jsonify(fish=fish.serialize())
+    catalog = fish_catalog.get()
+    if fish_id not in catalog.one_json:
+        abort(404)
+    return json_response(*catalog.one_json[fish_id])
+
+def search_args(default_now=False):
+    """Parse search query parameters for the current request, or abort with 400."""
+    try:
+        return parse_search_args(request.args, default_now=default_now)
+    except ValueError as e:
+        abort(400, description=str(e))
+
+@views.route('/api/fish/search')
+def search_fish_json():
+    """Search the catalog by name (?q=) and availability
+    (?hemisphere=north|south&month=&hour= or &now=true).
+    Return JSON {'fish': [{'id', 'name', 'icon_url', 'catchphrase', 'price', 'location'}, ...]}."""
+    return jsonify(fish=fish_catalog.get().search.search(search_args()))
+
+@views.route('/api/users/<int:user_id>/fish/catchable')
+def catchable_fish_json(user_id):
+    """Fish the user hasn't caught yet that can be caught now (server time,
+    or ?month=&hour=) in ?hemisphere=north|south, optionally filtered by ?q=.
+    Return JSON like /api/fish/search."""
+    if g.user_id != user_id:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
 
-@app.route('/api/users/<int:user_id>/fish')
+    args = search_args(default_now=True)
+    catalog = fish_catalog.get()
+    caught = caught_ids(catalog, Collection.bitmap(user_id))
+    return jsonify(fish=catalog.search.search(args, exclude_ids=caught))
+
+@views.route('/api/users/<int:user_id>/fish')
 def get_user_fish_json(user_id):
     """Get all fish belonging to a specific user.
+    Supports ?after=<fish_id>&limit=, ?fields= and ?caught=true|false.
     Return JSON {'name': name, 'icon_url': icon_url, 'catchphrase': catchphrase }."""
-    if g.user.id != user_id:
+    if g.user_id != user_id:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    args = list_args(USER_FISH_FIELDS)
+    etag = collection_etag(user_id)
+    not_modified = collection_not_modified(etag)
+    if not_modified:
+        return not_modified
+
+    catalog = fish_catalog.get()
+    items = collection_items(catalog, user_id, caught_ids(catalog, Collection.bitmap(user_id)),
+                             after=args.after, caught_filter=args.caught)
+    if args.paginated:
+        items = islice(items, args.limit + 1)
+
+    response = json_list_response('fish', items, args, 'fish_id')
+    return private_etag(response, etag)
+
+@views.route('/api/users/<int:user_id>/fish', methods=["PATCH"])
+def edit_many_fish_json(user_id):
+    """Set is_caught for many fish belonging to a specific user in one go.
+    Accepts JSON {"fish": [{"fish_id": fish_id, "is_caught": true|false}, ...]};
+    later entries for the same fish win.
+    Return JSON {fish: [{'user_id', 'fish_id', 'is_caught', 'catchphrase'}, ...]}."""
+    if g.user_id != user_id:
         flash("Access unauthorized.", "danger")
         return redirect("/")
-    
-    all_fish = [fish.serialize() for fish in User_Fish.query.filter_by(user_id=user_id).all()]
 
-    return jsonify(fish=all_fish)
+    changes = (request.get_json(silent=True) or {}).get('fish')
+    if not isinstance(changes, list) or len(changes) > MAX_BULK_CHANGES:
+        abort(400, description=f"fish must be a list of at most {MAX_BULK_CHANGES} changes")
 
-@app.route('/api/users/<int:user_id>/fish/<int:fish_id>', methods=["PATCH"])
+    states = {}
+    for change in changes:
+        if (not isinstance(change, dict)
+                or type(change.get('fish_id')) is not int
+                or not isinstance(change.get('is_caught'), bool)):
+            abort(400, description="each change needs an integer fish_id and a boolean is_caught")
+        states[change['fish_id']] = change['is_caught']
+
+    return jsonify(fish=Collection.set_many(user_id, states))
+
+@views.route('/api/users/<int:user_id>/fish/<int:fish_id>', methods=["PATCH"])
 def edit_fish_json(user_id, fish_id):
-    """Toggle fish is_caught property for one fish belonging to a specific user.
-    Return JSON {'name': name, 'icon_url': icon_url, 'catchphrase': catchphrase }."""
-    fish = User_Fish.query.filter(User_Fish.user_id==user_id, User_Fish.fish_id==fish_id).first()
-    
-    if g.user.id != user_id:
+    """Toggle fish is_caught property for one fish belonging to a specific user,
+    or set it with a JSON body {"is_caught": true|false}.
+    Return JSON {'user_id': user_id, 'fish_id': fish_id, 'is_caught': is_caught, 'catchphrase': catchphrase }."""
+    if g.user_id != user_id:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    if fish.is_caught == False:
-        fish.is_caught = True
-        db.session.commit()
+    is_caught = (request.get_json(silent=True) or {}).get('is_caught')
+    if is_caught is not None and not isinstance(is_caught, bool):
+        abort(400, description="is_caught must be true or false")
 
-    else:
-        fish.is_caught = False
-        db.session.commit()
+    fish = Collection.set_caught(user_id, fish_id, is_caught)
+    if fish is None:
+        abort(404)
 
-    return jsonify(fish=fish.serialize())
+    return jsonify(fish=fish)
 
 ##############################################################################
-# User_Fish views/routes:
+# Stats routes:
+@views.route('/api/stats')
+@read_only
+def show_stats_json():
+    """Most caught fish (?limit=, default 10) from the running catch counts.
+    Return JSON {'most_caught': [{'fish_id', 'name', 'icon_url', 'caught'}, ...], 'total': total}."""
+    try:
+        limit = parse_limit(request.args)
+    except ValueError as e:
+        abort(400, description=str(e))
+
+    catalog = fish_catalog.get()
+    return jsonify(most_caught=most_caught(catalog, limit=limit), total=len(catalog.ids))
+
+@views.route('/api/users/<int:user_id>/stats')
+def get_user_stats_json(user_id):
+    """How many fish a user caught.
+    Return JSON {'user_id': user_id, 'caught': caught, 'total': total}."""
+    if g.user_id != user_id:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
 
-@app.route('/fish')
+    return jsonify(user_id=user_id, **user_progress(fish_catalog.get(), user_id))
+
+##############################################################################
+# Export/import routes:
+@views.route('/api/users/<int:user_id>/fish/export')
+def export_user_fish(user_id):
+    """Download a user's caught and uncaught fish as ?format=csv (name,is_caught;
+    the default) or json ({"fish": [{"fish_id", "name", "is_caught"}]}), streamed."""
+    if g.user_id != user_id:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        abort(400, description="format must be csv or json")
+
+    etag = collection_etag(user_id)
+    not_modified = collection_not_modified(etag)
+    if not_modified:
+        return not_modified
+
+    response = Response(stream_with_context(export_user(fish_catalog.get(), user_id, fmt)),
+                        mimetype=MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="fish-{user_id}.{fmt}"'
+    return private_etag(response, etag)
+
+def read_body(limit, message, chunk_size=64 * 1024):
+    """Read the request body into memory, aborting with 413 as soon as more
+    than `limit` bytes arrive. Content-Length alone is no limit: chunked
+    uploads don't send one."""
+
+    if (request.content_length or 0) > limit:
+        abort(413, description=message.format(limit=limit))
+    chunks, size = [], 0
+    while True:
+        chunk = request.stream.read(min(chunk_size, limit + 1 - size))
+        if not chunk:
+            return io.BytesIO(b''.join(chunks))
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > limit:
+            abort(413, description=message.format(limit=limit))
+
+@views.route('/api/users/<int:user_id>/fish/import', methods=["POST"])
+def import_user_fish(user_id):
+    """Set many fish caught or uncaught from an uploaded CSV (name,is_caught with
+    a header line) or JSON ({"fish": [{"name", "is_caught"}]}) body. Nothing is
+    applied unless every name is a known fish.
+    Return JSON {'rows': fish set, 'changed': true if the collection changed}."""
+    if g.user_id != user_id:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    body = read_body(MAX_IMPORT_BYTES, "imports over {limit} bytes must use python transfer.py import")
+    fmt = 'json' if request.mimetype == 'application/json' else 'csv'
+    try:
+        report = import_file(body, fmt, user_id=user_id)
+    except ValueError as e:
+        abort(400, description=str(e))
+
+    return jsonify(rows=report['rows'], changed=bool(report['changed']))
+
+##############################################################################
+# Collection views/routes:
+
+@views.route('/fish')
+@read_only
 def show_all_fish():
     """Show all user's fish."""
 
-    if not g.user:
+    if not g.user_id:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(g.user.id)
-    all_fish = User_Fish.query.filter(User_Fish.user_id==user.id).all()
-    
-    return render_template('users/index.html', all_fish=all_fish, user=user)
+    # The page's sprite CSS and card fragments follow the icon manifest
+    icons = icon_store.manifest()
+    etag = collection_etag(g.user_id, icons)
+    not_modified = collection_not_modified(etag)
+    if not_modified:
+        return not_modified
+
+    catalog = fish_catalog.get()
+    grid = card_grid(catalog, icons, caught_ids(catalog, Collection.bitmap(g.user_id)))
 
-@app.route('/fish/<int:fish_id>')
+    html = render_template('users/index.html', card_grid=grid, user_id=g.user_id,
+                           sprite_css=icons.css)
+    return private_etag(Response(html), etag)
+
+@views.route('/fish/<int:fish_id>')
+@read_only
 def show_one_fish(fish_id):
     """Show details on one of user's fish."""
 
-    if not g.user:
+    if not g.user_id:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
     fish = Fish.query.get_or_404(fish_id)
+    icon = icon_store.manifest().icons.get(fish.id)
+    icon_src = f"/icons/{icon['icon']}" if icon else fish.icon_url
+
+    return render_template('users/fishdetail.html', fish=fish, icon_src=icon_src)
+
+##############################################################################
+# Shared collection views/routes:
+
+@views.route('/share', methods=["POST"])
+def share_collection():
+    """Share the current user's collection, replacing any old share link."""
 
-    return render_template('users/fishdetail.html', fish=fish)
\ No newline at end of file
+    return update_share(User.share, "Your collection is shared. Anyone with the link can see it.")
+
+@views.route('/share/delete', methods=["POST"])
+def unshare_collection():
+    """Stop sharing the current user's collection."""
+
+    return update_share(User.unshare, "Your collection is no longer shared.")
+
+def update_share(change, message):
+    from forms import ShareForm
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    if ShareForm().validate_on_submit():
+        change(g.user)
+        db.session.commit()
+        identity_cache.forget(g.user_id)
+        flash(message, "success")
+    return redirect("/")
+
+def shared_snapshot(token):
+    """Return (share, catalog, icons, etag) for `token`, or abort with 404."""
+    share = find_share(token)
+    if share is None:
+        abort(404)
+    catalog = fish_catalog.get()
+    icons = icon_store.manifest()
+    return share, catalog, icons, snapshot_etag(share, catalog, icons, current_app.config['RELEASE_ID'])
+
+@views.route('/share/<token>')
+def show_shared_fish(token):
+    """Show a shared collection, read-only."""
+
+    share, catalog, icons, etag = shared_snapshot(token)
+    if request.if_none_match.contains_weak(etag):
+        return public_etag(Response(status=304), etag)
+    return public_etag(Response(snapshot_html(token, share, catalog, icons, etag)), etag)
+
+@views.route('/api/share/<token>')
+def show_shared_fish_json(token):
+    """Get a shared collection.
+    Return JSON {username, caught, total, fish: [{fish_id, name, icon_url, catchphrase, is_caught}]}."""
+
+    share, catalog, icons, etag = shared_snapshot(token)
+    if request.if_none_match.contains_weak(etag):
+        return public_etag(Response(status=304), etag)
+    return public_etag(Response(snapshot_json(token, share, catalog, etag),
+                                mimetype='application/json'), etag)
+
+@views.route('/icons/<name>')
+def icon_file(name):
+    """Serve a cached icon, thumbnail, sprite sheet or sprite stylesheet.
+
+    Names are content hashes, so responses never change and can be cached
+    for good."""
+    if not FILE_NAME.fullmatch(name) or not icon_store.has(name):
+        abort(404)
+    response = send_from_directory(icon_store.root, name)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
\ No newline at end of file
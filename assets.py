@@ -0,0 +1,132 @@
+"""Fingerprinted, precompressed static assets.
+
+`python build_assets.py` copies every file under static/ into static/dist/
+with a content hash in its name (app.js -> app.3f2a1b9c0d4e.js), writes
+gzip and brotli copies of text assets next to it and records the mapping
+in static/dist/manifest.json.
+
+Templates link assets through asset_url('app.js'). Fingerprinted files are
+served from /assets with immutable cache headers, choosing the
+precompressed copy the client accepts. Without a build, asset_url falls
+back to the plain /static URL.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import abort, request, send_from_directory
+
+from files import write_atomic
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+COMPRESSIBLE = ('.js', '.css', '.svg', '.json', '.txt', '.html')
+
+# (Content-Encoding, file suffix), most preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def fingerprint(path, data):
+    """Return `path` with a hash of `data` before its extension."""
+
+    stem, ext = os.path.splitext(path)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Fingerprint and precompress everything in `static_dir` into `dist_dir`.
+
+    Returns the manifest, {logical path: fingerprinted path}. Compressed
+    copies that would not be smaller than the original are skipped.
+    """
+
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(static_dir):
+        dirnames[:] = sorted(d for d in dirnames
+                             if os.path.abspath(os.path.join(dirpath, d)) != os.path.abspath(dist_dir))
+        for filename in sorted(filenames):
+            source = os.path.join(dirpath, filename)
+            logical = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+
+            hashed = fingerprint(logical, data)
+            write_atomic(os.path.join(dist_dir, hashed), data)
+            if logical.endswith(COMPRESSIBLE):
+                for suffix, compressed in _compress(data):
+                    if len(compressed) < len(data):
+                        write_atomic(os.path.join(dist_dir, hashed + suffix), compressed)
+            manifest[logical] = hashed
+
+    write_atomic(os.path.join(dist_dir, 'manifest.json'),
+                 json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def _compress(data):
+    yield '.gz', gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield '.br', brotli.compress(data, quality=11)
+
+
+class Assets:
+    """Resolve and serve the assets listed in a build manifest."""
+
+    def __init__(self, dist_dir=DIST_DIR):
+        self.dist_dir = dist_dir
+        self.manifest = {}
+        self.files = set()
+        self.variants = set()
+
+    def init_app(self, app):
+        """Load the manifest, add asset_url() to templates and serve /assets."""
+
+        self.load()
+        app.add_template_global(self.url, 'asset_url')
+        app.add_url_rule('/assets/<path:name>', 'asset', self.send)
+
+    def load(self):
+        try:
+            with open(os.path.join(self.dist_dir, 'manifest.json')) as f:
+                self.manifest = json.load(f)
+        except OSError:
+            self.manifest = {}
+        self.files = set(self.manifest.values())
+        self.variants = {name + suffix for name in self.files for _, suffix in ENCODINGS
+                         if os.path.exists(os.path.join(self.dist_dir, name + suffix))}
+
+    def url(self, path):
+        """URL for the static file `path`, fingerprinted if it was built."""
+
+        hashed = self.manifest.get(path)
+        return f'/assets/{hashed}' if hashed else f'/static/{path}'
+
+    def send(self, name):
+        if name not in self.files:
+            abort(404)
+
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        encoding = next((encoding for encoding, suffix in ENCODINGS
+                         if name + suffix in self.variants and request.accept_encodings[encoding]),
+                        None)
+        if encoding:
+            suffix = dict(ENCODINGS)[encoding]
+            response = send_from_directory(self.dist_dir, name + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+        else:
+            response = send_from_directory(self.dist_dir, name, mimetype=mimetype)
+
+        if any(name + suffix in self.variants for _, suffix in ENCODINGS):
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+
+
+assets = Assets()
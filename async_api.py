@@ -0,0 +1,453 @@
+"""Async tier for the hot JSON API routes.
+
+Serves GET /api/fish, /api/fish/<id> and /api/users/<id>/fish and the
+PATCH /api/users/<id>/fish/<fish_id> toggle from one event loop per
+process (Starlette on asyncpg), so a request waiting on Postgres holds a
+coroutine instead of a gunicorn thread and a pooled connection. Run it
+as the web process, which passes every other path on to the Flask app
+(see create_web_app and the Procfile):
+
+    gunicorn 'async_api:create_web_app()' --worker-class uvicorn.workers.UvicornWorker
+
+or on its own, behind a proxy that routes those paths here:
+
+    uvicorn --factory async_api:create_async_app --workers 2
+
+Everything but the I/O is shared with app.py: the config profiles, the
+models and their SQL (compiled once for asyncpg), the catalog snapshot
+and its pre-encoded JSON, the list arguments and the signed Flask
+session cookie. Bodies and ETags match the Flask routes, so clients can
+move between tiers without refetching, and a user logged in through the
+Flask app is logged in here. Errors are plain text with a real status
+code rather than the Flask app's HTML pages, and responses are gzipped
+(COMPRESS_* settings) but never brotli-compressed.
+
+The replica (see models.Database) is not used: none of these routes
+reads it in the Flask app either. A toggle still stamps the session's
+write time, so the user's next reads on the Flask app stay on the primary.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from bisect import bisect_right
+from itertools import islice
+
+import asyncpg
+from a2wsgi import WSGIMiddleware
+from itsdangerous import BadSignature
+from sqlalchemy import Text, bindparam, cast, select
+from sqlalchemy.dialects import postgresql
+from starlette.applications import Starlette
+from starlette.datastructures import MutableHeaders
+from starlette.exceptions import HTTPException
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import RedirectResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route, request_response
+
+from app import (create_app, format_collection_etag, CURR_USER_KEY, WROTE_AT_KEY,
+                 FISH_FIELDS, USER_FISH_FIELDS)
+from catalog import build_snapshot, caught_ids, collection_items
+from listing import encode, page_json, parse_list_args, project, stream_json
+from models import CatalogVersion, Collection, Creature, Fish, User, SET_CAUGHT_SQL
+
+JSON = 'application/json'
+
+##############################################################################
+# SQL
+
+_DIALECT = postgresql.dialect(paramstyle='numeric')
+
+
+class Query:
+    """A SQLAlchemy statement compiled once into asyncpg's $1, $2, ... style.
+
+    Run it with keyword parameters named like the statement's bind
+    parameters; literals in the statement keep their compiled values.
+    """
+
+    def __init__(self, statement):
+        compiled = statement.compile(dialect=_DIALECT)
+        self.sql = re.sub(r'(?<!:):(\d+)', r'$\1', str(compiled))
+        self.names = compiled.positiontup
+        self.defaults = compiled.params
+
+    def args(self, params):
+        values = dict(self.defaults, **params)
+        return [values[name] for name in self.names]
+
+    async def fetch(self, conn, **params):
+        return await conn.fetch(self.sql, *self.args(params))
+
+    async def fetchrow(self, conn, **params):
+        return await conn.fetchrow(self.sql, *self.args(params))
+
+    async def fetchval(self, conn, **params):
+        return await conn.fetchval(self.sql, *self.args(params))
+
+
+CATALOG_VERSION = Query(select([CatalogVersion.version]).where(CatalogVersion.id == 1))
+
+CATALOG_ROWS = Query(select([Creature.__table__])
+                     .where(Creature.category == 'fish')
+                     .order_by(Creature.id))
+
+# The user's collection version (for the ETag) and caught bitmap in one
+# round trip; no row if there is no such user.
+USER_COLLECTION = Query(
+    select([User.collection_version, cast(Collection.caught, Text).label('caught')])
+    .select_from(User.__table__.outerjoin(
+        Collection.__table__,
+        (Collection.user_id == User.id) & (Collection.category == 'fish')))
+    .where(User.id == bindparam('user_id')))
+
+SET_CAUGHT = Query(SET_CAUGHT_SQL)
+
+##############################################################################
+# In-memory catalog
+
+
+class AsyncFishCatalog:
+    """catalog.FishCatalog for the event loop: the same CatalogSnapshot,
+    loaded through asyncpg.
+
+    Polls CatalogVersion at most once every `poll_interval` seconds. This
+    tier never writes the catalog, so it has no commits to listen for.
+    Create it inside the loop that will use it.
+    """
+
+    def __init__(self, poll_interval=5):
+        self.poll_interval = poll_interval
+        self._snapshot = None
+        self._checked_at = None
+        self._reload = False
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        """Reload on next use, even if the version looks unchanged."""
+
+        self._reload = True
+        self._checked_at = None
+
+    async def get(self, pool):
+        """Return the current CatalogSnapshot, reloading it if stale."""
+
+        if self._stale():
+            async with self._lock:
+                if self._stale():
+                    await self._refresh(pool)
+        return self._snapshot
+
+    def _stale(self):
+        return self._checked_at is None or time.monotonic() - self._checked_at >= self.poll_interval
+
+    async def _refresh(self, pool):
+        reload, self._reload = self._reload, False
+        async with pool.acquire() as conn:
+            version = await CATALOG_VERSION.fetchval(conn) or 0
+            if reload or self._snapshot is None or version != self._snapshot.version:
+                rows = await CATALOG_ROWS.fetch(conn)
+                self._snapshot = build_snapshot(version, [Fish(**row) for row in rows])
+        self._checked_at = time.monotonic()
+
+##############################################################################
+# Sessions and HTTP helpers
+
+
+def read_session(request):
+    """The Flask session (see app.py) in the request's cookie, or {} if
+    there is none or its signature doesn't check out."""
+
+    state = request.app.state
+    cookie = request.cookies.get(state.session_cookie)
+    if not cookie:
+        return {}
+    try:
+        return state.sessions.loads(cookie, max_age=state.session_max_age)
+    except BadSignature:
+        return {}
+
+
+def stamp_write(request, response, session):
+    """Set the session's write time on `response`, as app.remember_writes
+    does, when there is a replica for the Flask app to keep the user off."""
+
+    state = request.app.state
+    if not state.config['SQLALCHEMY_BINDS']:
+        return
+    session = dict(session, **{WROTE_AT_KEY: int(time.time())})
+    max_age = state.session_max_age if session.get('_permanent') else None
+    response.set_cookie(state.session_cookie, state.sessions.dumps(session),
+                        max_age=max_age, **state.cookie_options)
+
+
+def logged_in_as(request, user_id):
+    """The session if it belongs to user `user_id`, else None."""
+
+    session = read_session(request)
+    return session if session.get(CURR_USER_KEY) == user_id else None
+
+
+def unauthorized():
+    """Where the Flask routes send other users (without the flash message)."""
+
+    return RedirectResponse('/', status_code=302)
+
+
+def etag_matches(request, etag):
+    """Whether If-None-Match lists `etag` (weak comparison) or is *."""
+
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag.strip('"') == etag:
+            return True
+    return False
+
+
+def json_response(request, body, etag):
+    """Pre-encoded JSON `body` with a strong ETag, or 304 if the client has it."""
+
+    headers = {'ETag': f'"{etag}"'}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=JSON, headers=headers)
+
+
+def private_headers(etag):
+    headers = {'Cache-Control': 'private, no-cache', 'Vary': 'Cookie'}
+    if etag:
+        headers['ETag'] = f'"{etag}"'
+    return headers
+
+
+def list_args(request, allowed_fields):
+    """Parse list query parameters, or raise a 400."""
+
+    try:
+        return parse_list_args(request.query_params, allowed_fields)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+def json_list_response(key, items, args, id_field, headers=None):
+    """One page of `items` if paginated (pass args.limit + 1 of them), else
+    all of them, streamed like the Flask tier's."""
+
+    if not args.paginated:
+        return StreamingResponse(iterate(stream_json(key, (project(i, args.fields) for i in items))),
+                                 media_type=JSON, headers=headers)
+
+    items = list(items)
+    page = items[:args.limit]
+    next_after = page[-1][id_field] if len(items) > args.limit else None
+    return Response(page_json(key, [project(i, args.fields) for i in page], next_after),
+                    media_type=JSON, headers=headers)
+
+
+async def iterate(chunks):
+    """Yield from the sync iterator `chunks` on the event loop. Only for
+    in-memory work: anything that blocks must go to a thread instead."""
+
+    for chunk in chunks:
+        yield chunk
+
+
+async def json_body(request):
+    """The request's JSON object, or {} (like request.get_json(silent=True) or {})."""
+
+    if request.headers.get('content-type', '').split(';')[0].strip() != JSON:
+        return {}
+    try:
+        body = json.loads(await request.body())
+    except ValueError:
+        return {}
+    return body if isinstance(body, dict) else {}
+
+##############################################################################
+# Routes (see the routes of the same paths in app.py)
+
+
+async def show_all_fish_json(request):
+    state = request.app.state
+    catalog = await state.catalog.get(state.pool)
+    if not request.query_params:
+        return json_response(request, catalog.all_json, catalog.all_etag)
+
+    args = list_args(request, FISH_FIELDS)
+    if args.caught is not None:
+        raise HTTPException(400, "caught filter is only available on /api/users/<id>/fish")
+
+    ids = catalog.ids
+    start = bisect_right(ids, args.after) if args.after is not None else 0
+    stop = start + args.limit + 1 if args.paginated else len(ids)
+    return json_list_response('fish', (catalog.fish[i] for i in ids[start:stop]), args, 'id')
+
+
+async def show_one_fish_json(request):
+    state = request.app.state
+    catalog = await state.catalog.get(state.pool)
+    fish_id = request.path_params['fish_id']
+    if fish_id not in catalog.one_json:
+        raise HTTPException(404)
+    return json_response(request, *catalog.one_json[fish_id])
+
+
+async def get_user_fish_json(request):
+    state = request.app.state
+    user_id = request.path_params['user_id']
+    session = logged_in_as(request, user_id)
+    if session is None:
+        return unauthorized()
+
+    args = list_args(request, USER_FISH_FIELDS)
+    catalog = await state.catalog.get(state.pool)
+    async with state.pool.acquire() as conn:
+        row = await USER_COLLECTION.fetchrow(conn, user_id=user_id)
+
+    etag = None
+    if row is not None:
+        etag = format_collection_etag(user_id, row['collection_version'], catalog,
+                                      state.config['RELEASE_ID'])
+    if etag and etag_matches(request, etag) and '_flashes' not in session:
+        return Response(status_code=304, headers=private_headers(etag))
+
+    bits = (row and row['caught']) or ''
+    items = collection_items(catalog, user_id, caught_ids(catalog, bits),
+                             after=args.after, caught_filter=args.caught)
+    if args.paginated:
+        items = islice(items, args.limit + 1)
+    return json_list_response('fish', items, args, 'fish_id', headers=private_headers(etag))
+
+
+async def edit_fish_json(request):
+    state = request.app.state
+    user_id = request.path_params['user_id']
+    fish_id = request.path_params['fish_id']
+    session = logged_in_as(request, user_id)
+    if session is None:
+        return unauthorized()
+
+    is_caught = (await json_body(request)).get('is_caught')
+    if is_caught is not None and not isinstance(is_caught, bool):
+        raise HTTPException(400, "is_caught must be true or false")
+
+    async with state.pool.acquire() as conn:
+        row = await SET_CAUGHT.fetchrow(conn, user_id=user_id, fish_id=fish_id,
+                                        category='fish', state=is_caught)
+    fish = Collection.caught_change(user_id, fish_id, is_caught, row)
+    if fish is None:
+        raise HTTPException(404)
+
+    response = Response(encode({'fish': fish}), media_type=JSON)
+    stamp_write(request, response, session)
+    return response
+
+
+ROUTES = [
+    ('/api/fish', show_all_fish_json, 'GET'),
+    ('/api/fish/{fish_id:int}', show_one_fish_json, 'GET'),
+    ('/api/users/{user_id:int}/fish', get_user_fish_json, 'GET'),
+    ('/api/users/{user_id:int}/fish/{fish_id:int}', edit_fish_json, 'PATCH'),
+]
+
+
+class GZip:
+    """GZipMiddleware that weakens the ETag of the responses it compresses,
+    as compression.py does on the Flask app, so one ETag always names the
+    same bytes on both tiers."""
+
+    def __init__(self, app, **options):
+        self.app = GZipMiddleware(app, **options)
+
+    async def __call__(self, scope, receive, send):
+        async def send_weak_etag(message):
+            if message['type'] == 'http.response.start':
+                headers = MutableHeaders(raw=message['headers'])
+                etag = headers.get('etag')
+                if headers.get('content-encoding') == 'gzip' and etag and not etag.startswith('W/'):
+                    headers['etag'] = f'W/{etag}'
+            await send(message)
+
+        await self.app(scope, receive, send_weak_etag)
+
+
+def api_routes(settings):
+    """ROUTES, each gzipped on its own when COMPRESS_ENABLED, so requests
+    passed on to the Flask app are left to its own compression."""
+
+    routes = []
+    for path, endpoint, method in ROUTES:
+        app = request_response(endpoint)
+        if settings['COMPRESS_ENABLED']:
+            # gzip only: brotli (see compression.py) is left to the Flask app
+            app = GZip(app, minimum_size=settings['COMPRESS_MIN_SIZE'],
+                       compresslevel=settings['COMPRESS_LEVEL'])
+        routes.append(Route(path, app, methods=[method]))
+    return routes
+
+##############################################################################
+# App
+
+
+def create_async_app(config=None, fallback=False):
+    """Create the async API app with config profile `config` (see app.create_app).
+
+    With `fallback`, every request the async routes don't take (other
+    paths, or other methods on their paths) goes to the Flask app, run on
+    WEB_THREADS threads. The Flask app is kept as `flask_app`.
+
+    Like create_app, opens no connections: the asyncpg pool is created
+    when the server starts the app, inside its event loop.
+    """
+
+    flask_app = create_app(config)
+    settings = flask_app.config
+    sessions = flask_app.session_interface
+
+    async def start():
+        state.pool = await asyncpg.create_pool(
+            settings['SQLALCHEMY_DATABASE_URI'],
+            min_size=1,
+            max_size=settings['ASYNC_DB_POOL_SIZE'],
+            server_settings={'statement_timeout': str(settings['DB_STATEMENT_TIMEOUT'])})
+        state.catalog = AsyncFishCatalog(
+            poll_interval=float(os.environ.get('CATALOG_POLL_INTERVAL', 5)))
+
+    async def stop():
+        await state.pool.close()
+
+    routes = api_routes(settings)
+    if fallback:
+        routes.append(Mount('/', app=WSGIMiddleware(flask_app,
+                                                    workers=int(os.environ.get('WEB_THREADS', 1)))))
+
+    app = Starlette(routes=routes, on_startup=[start], on_shutdown=[stop])
+    app.flask_app = flask_app
+    state = app.state
+    state.config = settings
+    state.sessions = sessions.get_signing_serializer(flask_app)
+    state.session_cookie = flask_app.session_cookie_name
+    state.session_max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+    state.cookie_options = {
+        'domain': sessions.get_cookie_domain(flask_app),
+        'path': sessions.get_cookie_path(flask_app),
+        'httponly': sessions.get_cookie_httponly(flask_app),
+        'secure': sessions.get_cookie_secure(flask_app),
+        'samesite': sessions.get_cookie_samesite(flask_app),
+    }
+    return app
+
+
+def create_web_app(config=None):
+    """The web process (see Procfile): the async routes, with everything
+    else served by the Flask app."""
+
+    return create_async_app(config, fallback=True)
@@ -0,0 +1,254 @@
+"""Throughput benchmark: the sync deployment vs the async API tier.
+
+Seeds a synthetic dataset (see bench_routes.py), then serves it twice
+over real sockets: the Flask app under gunicorn (gunicorn.conf.py, with
+--threads per worker) and async_api.py under uvicorn, each with
+--workers processes. Each API route is driven by --connections
+concurrent keep-alive connections for --duration seconds, each
+connection logged in as its own user. Writes requests/sec and latency
+percentiles per tier and route to a JSON file.
+
+Run like:
+
+    createdb acnh-bench
+    python benchmarks/bench_async.py --users 10000 --connections 200
+    python benchmarks/bench_async.py --skip-seed --threads 16 --output threads16.json
+
+The load generator is one asyncio process; make sure it isn't the
+bottleneck (it should use well under one core) before trusting a result.
+Seeding drops and recreates every table in --database-url.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_routes import git_commit, percentile, seed  # noqa: E402
+
+TIERS = ['sync', 'async']
+ROUTES = ['api_fish', 'api_one_fish', 'api_user_fish', 'toggle']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare the sync and async API tiers.")
+    parser.add_argument('--database-url', default='postgresql:///acnh-bench')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--fish', type=int, default=80, help="catalog size")
+    parser.add_argument('--caught-ratio', type=float, default=0.3)
+    parser.add_argument('--connections', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=10, help="seconds per route")
+    parser.add_argument('--warmup', type=float, default=1, help="unmeasured seconds per route")
+    parser.add_argument('--workers', type=int, default=2, help="server processes per tier")
+    parser.add_argument('--threads', type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--tiers', nargs='+', choices=TIERS, default=TIERS)
+    parser.add_argument('--routes', nargs='+', choices=ROUTES, default=ROUTES)
+    parser.add_argument('--seed', type=int, default=1234, help="random seed")
+    parser.add_argument('--skip-seed', action='store_true', help="reuse an already seeded database")
+    parser.add_argument('--output', default='bench_async_results.json')
+    return parser.parse_args()
+
+
+def server_command(tier, args):
+    if tier == 'sync':
+        return ['gunicorn', 'app:create_app()', '--bind', f'127.0.0.1:{args.port}',
+                '--workers', str(args.workers)]
+    return ['uvicorn', '--factory', 'async_api:create_async_app', '--host', '127.0.0.1',
+            '--port', str(args.port), '--workers', str(args.workers), '--no-access-log']
+
+
+def start_server(tier, args):
+    """Start `tier` and wait until it answers; return the process."""
+
+    env = dict(os.environ, WEB_THREADS=str(args.threads), PYTHONPATH=ROOT)
+    proc = subprocess.Popen(server_command(tier, args), cwd=ROOT, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"{tier} server exited with {proc.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', args.port), timeout=1) as sock:
+                sock.sendall(b'GET /api/fish HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n')
+                if sock.recv(12).startswith(b'HTTP/1.1 200'):
+                    return proc
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    sys.exit(f"{tier} server did not start")
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def session_cookies(args):
+    """A signed Flask session cookie per connection, each for a random user."""
+
+    from app import create_app, CURR_USER_KEY
+
+    app = create_app()
+    sessions = app.session_interface.get_signing_serializer(app)
+    rng = random.Random(args.seed)
+    users = [rng.randint(1, args.users) for _ in range(args.connections)]
+    return [(user_id, f'{app.session_cookie_name}={sessions.dumps({CURR_USER_KEY: user_id})}')
+            for user_id in users]
+
+
+def build_request(route, user_id, cookie, rng, fish_count):
+    if route == 'api_fish':
+        method, path = 'GET', '/api/fish'
+    elif route == 'api_one_fish':
+        method, path = 'GET', f'/api/fish/{rng.randint(1, fish_count)}'
+    elif route == 'api_user_fish':
+        method, path = 'GET', f'/api/users/{user_id}/fish'
+    else:
+        method, path = 'PATCH', f'/api/users/{user_id}/fish/{rng.randint(1, fish_count)}'
+    return (f'{method} {path} HTTP/1.1\r\nHost: bench\r\nCookie: {cookie}\r\n'
+            f'Content-Length: 0\r\n\r\n').encode()
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response; return (status, keep_alive)."""
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed")
+    status = int(status_line.split()[1])
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif status not in (204, 304):
+        await reader.read()
+        return status, False
+    return status, headers.get('connection') != 'close'
+
+
+async def connection(port, route, user_id, cookie, rng, args, measure_from, stop_at, samples):
+    """Send `route` requests back to back over one connection (reopened if
+    the server closes it) until `stop_at`."""
+
+    reader = writer = None
+    while time.monotonic() < stop_at:
+        if writer is None:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        start = time.monotonic()
+        writer.write(build_request(route, user_id, cookie, rng, args.fish))
+        try:
+            status, keep_alive = await read_response(reader)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            status, keep_alive = 0, False
+        if start >= measure_from:
+            samples.append((time.monotonic() - start, status))
+        if not keep_alive:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def drive(route, cookies, args):
+    """Drive `route` from every connection at once; return its result dict."""
+
+    samples = []
+    measure_from = time.monotonic() + args.warmup
+    stop_at = measure_from + args.duration
+    await asyncio.gather(*(connection(args.port, route, user_id, cookie, random.Random(args.seed + n),
+                                      args, measure_from, stop_at, samples)
+                           for n, (user_id, cookie) in enumerate(cookies)))
+
+    latencies = sorted(s[0] * 1000 for s in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for s in samples if s[1] != 200),
+        'throughput_rps': round(len(samples) / args.duration, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+    }
+
+
+def print_results(results):
+    print(f"{'route':<15}{'tier':<7}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for route in results['routes']:
+        for tier in results['tiers']:
+            r = results['tiers'][tier][route]
+            print(f"{route:<15}{tier:<7}{r['throughput_rps']:>9}{r['p50_ms']:>9}"
+                  f"{r['p95_ms']:>9}{r['p99_ms']:>9}{r['errors']:>8}")
+        if set(results['tiers']) == set(TIERS):
+            sync_rps = results['tiers']['sync'][route]['throughput_rps']
+            if sync_rps:
+                speedup = results['tiers']['async'][route]['throughput_rps'] / sync_rps
+                print(f"{'':<15}{'async/sync':<16}{speedup:>.2f}x")
+
+
+def main():
+    args = parse_args()
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('APP_CONFIG', 'production')
+    os.environ.setdefault('DB_STATEMENT_TIMEOUT', '0')
+
+    if not args.skip_seed:
+        from app import create_app
+
+        app = create_app()
+        with app.app_context():
+            start = time.perf_counter()
+            seed(app, args)
+            print(f"Seeded {args.users} users x {args.fish} fish in {time.perf_counter() - start:.1f}s")
+
+    cookies = session_cookies(args)
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'users': args.users,
+        'fish': args.fish,
+        'connections': args.connections,
+        'workers': args.workers,
+        'threads': args.threads,
+        'routes': args.routes,
+        'tiers': {},
+    }
+    for tier in args.tiers:
+        proc = start_server(tier, args)
+        try:
+            results['tiers'][tier] = {route: asyncio.run(drive(route, cookies, args))
+                                      for route in args.routes}
+        finally:
+            stop_server(proc)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print_results(results)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
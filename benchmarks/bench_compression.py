@@ -0,0 +1,98 @@
+"""Bytes saved and CPU cost of response compression.
+
+Renders the tracker page, the full collection JSON (buffered and streamed
+in chunks the way /api/users/<id>/fish streams it) and the /api/fish
+catalog for a synthetic catalog, then compresses each with gzip and
+brotli at several levels through compression.make_stream, the same code
+the app uses. No database needed.
+
+Run like:
+
+    python benchmarks/bench_compression.py --fish 80 --iterations 200
+"""
+import argparse
+import os
+import sys
+import time
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+GZIP_LEVELS = (1, 6, 9)
+BROTLI_QUALITIES = (1, 4, 11)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark response compression.")
+    parser.add_argument('--fish', type=int, default=80, help="catalog size")
+    parser.add_argument('--iterations', type=int, default=200, help="compressions per case")
+    return parser.parse_args()
+
+
+def make_bodies(fish_count):
+    """Return [(name, [chunks])] of representative response bodies."""
+
+    from app import create_app
+    from flask import render_template
+    from fragments import card_grid
+    from icons import EMPTY_MANIFEST
+    from listing import encode, stream_json
+
+    fish = [{'id': i, 'name': f'fish number {i}',
+             'icon_url': f'https://acnhapi.com/v1/icons/fish/{i}',
+             'catchphrase': f'I caught fish number {i}! Whoa, what a catch!'}
+            for i in range(1, fish_count + 1)]
+    Catalog = namedtuple('Catalog', ['version', 'ids', 'fish'])
+    catalog = Catalog(version=-1, ids=[f['id'] for f in fish], fish={f['id']: f for f in fish})
+    collection = [{'user_id': 1, 'fish_id': f['id'], 'name': f['name'], 'icon_url': f['icon_url'],
+                   'catchphrase': f['catchphrase'], 'is_caught': f['id'] % 3 == 0}
+                  for f in fish]
+
+    with create_app().test_request_context():
+        page = render_template('users/index.html', user_id=1, sprite_css=None,
+                               card_grid=card_grid(catalog, EMPTY_MANIFEST,
+                                                   {i for i in catalog.ids if i % 3 == 0}))
+
+    return [
+        ('tracker page', [page.encode()]),
+        ('collection json', [encode({'fish': collection})]),
+        ('collection stream', list(stream_json('fish', collection))),
+        ('catalog json', [encode({'fish': fish})]),
+    ]
+
+
+def measure(chunks, encoding, level, iterations):
+    """Return (compressed size, CPU microseconds per response)."""
+
+    from compression import make_stream
+
+    start = time.process_time()
+    for _ in range(iterations):
+        stream = make_stream(encoding, level)
+        size = sum(len(stream.compress(chunk)) for chunk in chunks) + len(stream.finish())
+    return size, (time.process_time() - start) / iterations * 1e6
+
+
+def main():
+    args = parse_args()
+    os.environ.setdefault('APP_CONFIG', 'production')
+
+    from compression import brotli
+
+    cases = [('gzip', level) for level in GZIP_LEVELS]
+    if brotli is not None:
+        cases += [('br', quality) for quality in BROTLI_QUALITIES]
+    else:
+        print("brotli not installed; gzip only")
+
+    print(f"{'body':<19}{'encoding':<10}{'bytes':>9}{'saved':>8}{'cpu us':>9}")
+    for name, chunks in make_bodies(args.fish):
+        raw = sum(len(chunk) for chunk in chunks)
+        print(f"{name:<19}{'identity':<10}{raw:>9}{'':>8}{'':>9}")
+        for encoding, level in cases:
+            size, cpu = measure(chunks, encoding, level, args.iterations)
+            print(f"{'':<19}{f'{encoding}-{level}':<10}{size:>9}{1 - size / raw:>8.0%}{cpu:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Microbenchmark: bcrypt logins/sec per core at each cost setting.
+
+Run like:
+
+    python benchmarks/bench_password_hashing.py
+    python benchmarks/bench_password_hashing.py --rounds 10 11 12 --seconds 5
+
+Each cost is measured on a single thread, so the result is logins/sec per
+core. Multiply by HASH_POOL_WORKERS for a host's ceiling.
+"""
+import argparse
+import time
+
+import bcrypt
+
+
+def logins_per_sec(rounds, seconds):
+    """Check a password against a hash of cost `rounds` for ~`seconds`."""
+
+    pw_hash = bcrypt.hashpw(b"password", bcrypt.gensalt(rounds))
+    count = 0
+    start = time.perf_counter()
+    while True:
+        bcrypt.checkpw(b"password", pw_hash)
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return count / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, nargs='+', default=[8, 10, 11, 12, 13])
+    parser.add_argument('--seconds', type=float, default=2)
+    args = parser.parse_args()
+
+    print(f"{'rounds':>6}  {'ms/login':>9}  {'logins/sec/core':>15}")
+    for rounds in args.rounds:
+        rate = logins_per_sec(rounds, args.seconds)
+        print(f"{rounds:>6}  {1000 / rate:>9.1f}  {rate:>15.1f}")
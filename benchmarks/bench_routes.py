@@ -0,0 +1,251 @@
+"""Load and latency benchmark for the main routes.
+
+Seeds a synthetic dataset into a local database, then drives the hot
+routes through the WSGI app (Flask test clients, no network) at a given
+concurrency and writes p50/p95/p99 latency, throughput and SQL queries per
+request to a JSON file.
+
+Run like:
+
+    createdb acnh-bench
+    python benchmarks/bench_routes.py --users 100000 --concurrency 8
+    python benchmarks/bench_routes.py --skip-seed --output after.json --compare before.json
+
+Seeding drops and recreates every table in --database-url.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+ROUTES = ['login', 'tracker', 'api_fish', 'api_user_fish', 'toggle']
+PASSWORD = "benchpassword"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the main routes.")
+    parser.add_argument('--database-url', default='postgresql:///acnh-bench')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--fish', type=int, default=80, help="catalog size")
+    parser.add_argument('--caught-ratio', type=float, default=0.3)
+    parser.add_argument('--requests', type=int, default=500, help="requests per route")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--routes', nargs='+', choices=ROUTES, default=ROUTES)
+    parser.add_argument('--seed', type=int, default=1234, help="random seed")
+    parser.add_argument('--skip-seed', action='store_true', help="reuse an already seeded database")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help="earlier results file to print deltas against")
+    return parser.parse_args()
+
+
+def copy_rows(table, columns, rows):
+    """Bulk load `rows` into `table` with COPY."""
+
+    from models import db
+
+    buf = io.StringIO()
+    for row in rows:
+        buf.write('\t'.join(str(value) for value in row) + '\n')
+    buf.seek(0)
+
+    conn = db.engine.raw_connection()
+    try:
+        conn.cursor().copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buf)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def seed(app, args):
+    """Create a synthetic catalog, users and collections."""
+
+    import bcrypt
+    from app import load_database
+    from models import db
+    from stats import reconcile_catch_counts
+
+    rng = random.Random(args.seed)
+    db.drop_all()
+    db.create_all()
+
+    load_database([{'name': f'benchfish{i}', 'icon_url': f'/icons/benchfish{i}.png',
+                    'catchphrase': f'I caught benchfish {i}!'}
+                   for i in range(1, args.fish + 1)])
+
+    # Every user shares one hash; hashing 100k passwords would dominate seeding.
+    pw_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(app.config['BCRYPT_LOG_ROUNDS'])).decode()
+    copy_rows('users', ['id', 'username', 'email', 'password', 'profile_img'],
+              ((i, f'bench{i}', f'bench{i}@example.com', pw_hash, '/static/images/default-pic.png')
+               for i in range(1, args.users + 1)))
+    db.session.execute("SELECT setval('users_id_seq', :n)", {'n': args.users})
+    db.session.commit()
+
+    # load_database numbers the fish 0..n-1, so bit i is the i-th fish
+    copy_rows('collections', ['user_id', 'category', 'caught'],
+              ((user_id, 'fish', ''.join('1' if rng.random() < args.caught_ratio else '0'
+                                         for _ in range(args.fish)))
+               for user_id in range(1, args.users + 1)))
+    # COPY bypasses the statements that keep catch_counts up to date
+    reconcile_catch_counts()
+    db.session.execute("ANALYZE")
+    db.session.commit()
+
+
+class QueryCounter:
+    """Count SQL statements per thread."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def take(self):
+        count = getattr(self._local, 'count', 0)
+        self._local.count = 0
+        return count
+
+
+def make_request(client, route, user_id, rng, fish_count):
+    """Issue one request for `route` and return its status code."""
+
+    if route == 'login':
+        resp = client.post('/login', data={'username': f'bench{user_id}', 'password': PASSWORD})
+    elif route == 'tracker':
+        resp = client.get('/fish')
+    elif route == 'api_fish':
+        resp = client.get('/api/fish')
+    elif route == 'api_user_fish':
+        resp = client.get(f'/api/users/{user_id}/fish')
+    else:
+        resp = client.patch(f'/api/users/{user_id}/fish/{rng.randint(1, fish_count)}')
+    resp.get_data()
+    return resp.status_code
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+
+    if not sorted_values:
+        return None
+    index = max(0, int(round(pct / 100 * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+def run_route(app, counter, route, args):
+    """Drive `route` with args.concurrency threads; return its result dict."""
+
+    from app import CURR_USER_KEY
+
+    per_thread = args.requests // args.concurrency
+
+    def worker(n):
+        rng = random.Random(args.seed + n)
+        client = app.test_client()
+        user_id = rng.randint(1, args.users)
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+        samples = []
+        for _ in range(per_thread):
+            counter.take()
+            start = time.perf_counter()
+            status = make_request(client, route, user_id, rng, args.fish)
+            samples.append((time.perf_counter() - start, counter.take(), status))
+        return samples
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        samples = [s for result in pool.map(worker, range(args.concurrency)) for s in result]
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(s[0] * 1000 for s in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for s in samples if s[2] >= 400),
+        'throughput_rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'queries_per_request': round(sum(s[1] for s in samples) / len(samples), 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    print(f"{'route':<14}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'q/req':>7}{'errors':>8}")
+    for route, r in results['routes'].items():
+        print(f"{route:<14}{r['throughput_rps']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+              f"{r['p99_ms']:>9}{r['queries_per_request']:>7}{r['errors']:>8}")
+        old = (baseline or {}).get('routes', {}).get(route)
+        if old:
+            print(f"{'  vs baseline':<14}"
+                  f"{r['throughput_rps'] - old['throughput_rps']:>+9.1f}"
+                  f"{r['p50_ms'] - old['p50_ms']:>+9.2f}{r['p95_ms'] - old['p95_ms']:>+9.2f}"
+                  f"{r['p99_ms'] - old['p99_ms']:>+9.2f}"
+                  f"{r['queries_per_request'] - old['queries_per_request']:>+7.2f}")
+
+
+def main():
+    args = parse_args()
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('APP_CONFIG', 'production')
+    # One pooled connection per client thread, like a gunicorn worker with
+    # that many threads; seeding runs statements longer than any request.
+    os.environ.setdefault('WEB_THREADS', str(args.concurrency))
+    os.environ.setdefault('DB_STATEMENT_TIMEOUT', '0')
+
+    from app import create_app
+    from models import db
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    with app.app_context():
+        if not args.skip_seed:
+            start = time.perf_counter()
+            seed(app, args)
+            print(f"Seeded {args.users} users x {args.fish} fish in {time.perf_counter() - start:.1f}s")
+
+        counter = QueryCounter(db.engine)
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'users': args.users,
+        'fish': args.fish,
+        'concurrency': args.concurrency,
+        'routes': {route: run_route(app, counter, route, args) for route in args.routes},
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
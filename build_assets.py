@@ -0,0 +1,12 @@
+"""Build fingerprinted, precompressed static assets into static/dist.
+
+Run after changing anything in static/ (Heroku runs it from
+bin/post_compile on every deploy):
+
+    python build_assets.py
+"""
+import assets
+
+manifest = assets.build()
+print(f"Built {len(manifest)} assets into {assets.DIST_DIR}"
+      + ("" if assets.brotli else " (brotli not installed, gzip only)"))
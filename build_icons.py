@@ -0,0 +1,30 @@
+"""Cache the icons of every fish in the database into the icon store
+(icons.ICON_STORE_DIR) and rebuild the sprite sheet.
+
+Heroku runs it from bin/post_compile on every deploy, so the store is
+part of the slug and every dyno serves the same icons. After a seed
+changes the catalog, the next deploy picks up its icons:
+
+    python build_icons.py
+
+Without a reachable database it builds nothing and the deploy goes on;
+cards then link to acnhapi.com.
+"""
+from sqlalchemy.exc import SQLAlchemyError
+
+from api_client import get_client
+from app import create_app
+from icons import ICON_STORE_DIR, sync_icons
+from models import Fish
+
+with create_app().app_context():
+    try:
+        fish = Fish.query.order_by(Fish.id).all()
+    except SQLAlchemyError as exc:
+        fish = None
+        print(f"Skipped icons, could not read the fish: {str(exc).splitlines()[0]}")
+
+    if fish is not None:
+        report = sync_icons(fish, get_client())
+        print(f"Icons in {ICON_STORE_DIR}: {len(report['downloaded'])} downloaded, "
+              f"{len(report['failed'])} failed, sprite {report['sprite'] or 'not built'}")
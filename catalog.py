@@ -0,0 +1,300 @@
+"""Fish catalog for the ACNH Fish Tracker.
+
+Keeps the fish in the creatures table in step with the ACNH API payload
+(one read of the current rows, then batched deletes and upserts in a
+single transaction) and holds an in-memory, pre-serialized copy of them
+for the fish API and for reading collection bitmaps.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from itertools import chain
+
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Creature, Fish, CatalogVersion, CreatureCategory
+from listing import encode
+from search import FishSearchIndex, to_mask
+
+# Columns sync_fish keeps up to date (matched by name), with their value
+# for fish dicts that don't have them.
+SYNC_FIELDS = {'icon_url': None, 'catchphrase': None, 'price': None, 'location': None,
+               'months_north': 0, 'months_south': 0, 'hours': 0}
+
+
+def parse_fish(data):
+    """Turn the ACNH API fish payload into a list of fish dicts.
+
+    Return [{'name': name, 'icon_url': icon_url, 'catchphrase': catchphrase,
+    'price': price, 'location': location, 'months_north': mask,
+    'months_south': mask, 'hours': mask }]."""
+
+    all_fish = []
+    for d in data:
+        availability = d.get('availability', {})
+        fish = {'name': d['name']['name-USen'],
+                'icon_url': d['icon_uri'],
+                'catchphrase': d['catch-phrase'],
+                'price': d.get('price'),
+                'location': availability.get('location'),
+                'months_north': to_mask(availability.get('month-array-northern', []), offset=1),
+                'months_south': to_mask(availability.get('month-array-southern', []), offset=1),
+                'hours': to_mask(availability.get('time-array', []))}
+        all_fish.append(fish)
+    return all_fish
+
+
+def load_fish_file(path):
+    """Read a recorded ACNH API fish payload from a JSON file."""
+
+    with open(path) as f:
+        return parse_fish(json.load(f))
+
+
+def sync_fish(all_fish, source_etag=None):
+    """Make the fish in the catalog match `all_fish`; see sync_creatures."""
+
+    return sync_creatures('fish', all_fish, source_etag)
+
+
+def sync_creatures(category, all_creatures, source_etag=None):
+    """Make the `category` creatures match `all_creatures`, matching rows by name.
+
+    New creatures are inserted with fresh ordinals, changed ones
+    updated and ones missing from `all_creatures` deleted (and cleared
+    from every collection bitmap), all in one transaction. Safe to run
+    repeatedly. The same transaction records `source_etag`, the API ETag
+    of the payload, as the one the category was last synced from (see
+    CreatureCategory).
+
+    Returns {'inserted': [names], 'updated': [names], 'deleted': [names],
+    'unchanged': count}.
+    """
+
+    wanted = {c['name']: dict(SYNC_FIELDS, **c) for c in all_creatures}
+    columns = [getattr(Creature, field) for field in SYNC_FIELDS]
+    existing = {}
+    ordinals = {}
+    for row in (db.session.query(Creature.name, Creature.ordinal, *columns)
+                .filter(Creature.category == category)):
+        existing[row[0]] = tuple(row[2:])
+        ordinals[row[0]] = row[1]
+
+    inserted = [name for name in wanted if name not in existing]
+    updated = [name for name in wanted if name in existing
+               and existing[name] != tuple(wanted[name][field] for field in SYNC_FIELDS)]
+    deleted = [name for name in existing if name not in wanted]
+
+    table = Creature.__table__
+    try:
+        # Taken before deleting, so the high-water mark covers the
+        # deleted ordinals even on a database that never recorded one.
+        next_ordinal = CreatureCategory.take_ordinals(category, len(inserted)) if inserted else None
+        if deleted:
+            db.session.execute(CLEAR_BIT_SQL, [{'category': category, 'ordinal': ordinals[name]}
+                                               for name in deleted])
+            db.session.execute(table.delete().where(db.and_(table.c.category == category,
+                                                            table.c.name.in_(deleted))))
+
+        # Ordinals are never reused, so a bit cleared now or in an earlier
+        # sync can't come back as a different creature.
+        for name in inserted:
+            ordinals[name] = next_ordinal
+            next_ordinal += 1
+
+        rows = [dict(wanted[name], category=category, ordinal=ordinals[name])
+                for name in inserted + updated]
+        if rows:
+            stmt = insert(table).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.category, table.c.name],
+                set_={field: stmt.excluded[field] for field in SYNC_FIELDS})
+            db.session.execute(stmt)
+
+        if deleted or rows:
+            CatalogVersion.bump()
+            db.session.info['fish_changed'] = True
+
+        CreatureCategory.record_sync(category, source_etag)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {
+        'inserted': inserted,
+        'updated': updated,
+        'deleted': deleted,
+        'unchanged': len(wanted) - len(inserted) - len(updated),
+    }
+
+
+CLEAR_BIT_SQL = db.text("""
+    UPDATE collections SET caught = set_bit(caught, :ordinal, 0)
+    WHERE category = :category AND length(caught) > :ordinal AND get_bit(caught, :ordinal) = 1
+""")
+
+
+def format_report(report):
+    """One-line summary of a sync_fish report."""
+
+    return (f"{len(report['inserted'])} inserted, {len(report['updated'])} updated, "
+            f"{len(report['deleted'])} deleted, {report['unchanged']} unchanged")
+
+
+##############################################################################
+# In-memory catalog
+
+CatalogSnapshot = namedtuple('CatalogSnapshot',
+                             ['version', 'ids', 'fish', 'all_json', 'all_etag', 'one_json',
+                              'search', 'ordinals', 'live_bits'])
+
+
+def _etag(body):
+    return hashlib.sha1(body).hexdigest()
+
+
+class FishCatalog:
+    """In-memory copy of the fish table with pre-encoded JSON.
+
+    Writes in this process mark it stale as soon as they commit. Writes in
+    other workers are noticed by polling CatalogVersion at most once every
+    `poll_interval` seconds, so requests in between never touch the database.
+    """
+
+    def __init__(self, poll_interval=5):
+        self.poll_interval = poll_interval
+        self._snapshot = None
+        self._stale = True
+        self._reload = False
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Reload on next use, even if the version looks unchanged: the
+        counter starts over when catalog_version is re-created."""
+
+        self._reload = True
+        self._stale = True
+
+    def get(self):
+        """Return the current CatalogSnapshot, reloading it if stale."""
+
+        if self._stale or time.monotonic() - self._checked_at >= self.poll_interval:
+            with self._lock:
+                if self._stale or time.monotonic() - self._checked_at >= self.poll_interval:
+                    self._refresh()
+        return self._snapshot
+
+    def _refresh(self):
+        reload, self._reload = self._reload, False
+        self._stale = False
+        # Always from the primary: a lagging replica could hand back an
+        # older version and make workers flip between catalogs.
+        with db.reading(use_replica=False):
+            version = CatalogVersion.current()
+            if reload or self._snapshot is None or version != self._snapshot.version:
+                self._snapshot = self._load(version)
+        self._checked_at = time.monotonic()
+
+    def _load(self, version):
+        return build_snapshot(version, Fish.query.order_by(Fish.id).all())
+
+
+def build_snapshot(version, rows):
+    """CatalogSnapshot of Fish `rows` (in id order) at catalog `version`."""
+
+    fish = [f.serialize() for f in rows]
+    all_json = encode({'fish': fish})
+    one_json = {}
+    for f in fish:
+        body = encode({'fish': f})
+        one_json[f['id']] = (body, _etag(body))
+
+    return CatalogSnapshot(version=version,
+                           ids=[f['id'] for f in fish],
+                           fish={f['id']: f for f in fish},
+                           all_json=all_json,
+                           all_etag=_etag(all_json),
+                           one_json=one_json,
+                           search=FishSearchIndex(rows),
+                           ordinals={f.id: f.ordinal for f in rows},
+                           live_bits=sum(1 << f.ordinal for f in rows))
+
+
+fish_catalog = FishCatalog(poll_interval=float(os.environ.get('CATALOG_POLL_INTERVAL', 5)))
+
+
+##############################################################################
+# Collection bitmaps (see models.Collection) read against a snapshot
+
+def caught_ids(catalog, bits):
+    """Ids of the catalog's fish whose bit is set in the '0'/'1' bitmap `bits`."""
+
+    return {fish_id for fish_id, ordinal in catalog.ordinals.items()
+            if ordinal < len(bits) and bits[ordinal] == '1'}
+
+
+def count_caught(catalog, bits):
+    """Number of the catalog's fish caught in `bits`: a popcount of the bitmap
+    masked to fish that still exist."""
+
+    return bin(int(bits[::-1] or '0', 2) & catalog.live_bits).count('1')
+
+
+def collection_items(catalog, user_id, caught, after=None, caught_filter=None):
+    """Yield the user's collection in fish id order, starting after fish id
+    `after` and optionally only caught (True) or uncaught (False) fish.
+
+    `caught` is the set of caught fish ids. Each item is a dict with
+    user_id, fish_id, name, icon_url, catchphrase and is_caught.
+    """
+
+    ids = catalog.ids
+    start = bisect_right(ids, after) if after is not None else 0
+    for fish_id in ids[start:]:
+        is_caught = fish_id in caught
+        if caught_filter is not None and is_caught != caught_filter:
+            continue
+        fish = catalog.fish[fish_id]
+        yield {'user_id': user_id,
+               'fish_id': fish_id,
+               'name': fish['name'],
+               'icon_url': fish['icon_url'],
+               'catchphrase': fish['catchphrase'],
+               'is_caught': is_caught}
+
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_on_fish_flush(session, flush_context):
+    """Bump the catalog version when ORM writes touch a Creature."""
+
+    if any(isinstance(obj, Creature) for obj in chain(session.new, session.dirty, session.deleted)):
+        CatalogVersion.bump()
+        session.info['fish_changed'] = True
+
+
+@event.listens_for(db.session, 'after_bulk_update')
+@event.listens_for(db.session, 'after_bulk_delete')
+def _bump_on_fish_bulk(context):
+    """Bump the catalog version after Creature/Fish.query.update()/delete()."""
+
+    if issubclass(context.mapper.class_, Creature):
+        CatalogVersion.bump()
+        context.session.info['fish_changed'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop('fish_changed', False):
+        fish_catalog.invalidate()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('fish_changed', None)
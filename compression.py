@@ -0,0 +1,129 @@
+"""Response compression for HTML and JSON.
+
+Compresses responses whose mimetype is in COMPRESS_MIMETYPES with brotli
+(if installed and COMPRESS_BROTLI is on, at COMPRESS_BROTLI_QUALITY) or
+else gzip (at COMPRESS_LEVEL), if the client accepts it. Buffered bodies
+under COMPRESS_MIN_SIZE bytes are left alone. Streamed responses are compressed chunk by chunk, with a flush
+after each chunk so they still stream.
+
+Files sent with send_file (static assets, icons) pass through untouched;
+they are precompressed or already compressed images.
+
+Compressed responses get a weak ETag, like nginx does, because the bytes
+differ from the uncompressed representation.
+"""
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class GzipStream:
+    """Incremental gzip; compress() output can be sent as soon as it's returned."""
+
+    def __init__(self, level):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk):
+        return self._obj.compress(chunk) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._obj.flush()
+
+
+class BrotliStream:
+    """Incremental brotli, same interface as GzipStream."""
+
+    def __init__(self, quality):
+        self._obj = brotli.Compressor(quality=quality)
+
+    def compress(self, chunk):
+        return self._obj.process(chunk) + self._obj.flush()
+
+    def finish(self):
+        return self._obj.finish()
+
+
+def make_stream(encoding, level):
+    """Return a GzipStream or BrotliStream for `encoding` at `level`."""
+
+    if encoding == 'br':
+        return BrotliStream(level)
+    return GzipStream(level)
+
+
+class Compressor:
+    """after_request hook that compresses eligible responses."""
+
+    def init_app(self, app):
+        """Compress `app`'s responses, configured by its COMPRESS_* settings."""
+
+        app.after_request(self.compress_response)
+
+    def choose_encoding(self):
+        """Best encoding the client accepts, or None."""
+
+        config = current_app.config
+        accept = request.accept_encodings
+        if brotli is not None and config['COMPRESS_BROTLI'] and accept['br']:
+            return 'br'
+        if accept['gzip']:
+            return 'gzip'
+        return None
+
+    def stream(self, encoding):
+        config = current_app.config
+        return make_stream(encoding, config['COMPRESS_BROTLI_QUALITY'] if encoding == 'br'
+                           else config['COMPRESS_LEVEL'])
+
+    def compress_response(self, response):
+        if (response.mimetype not in current_app.config['COMPRESS_MIMETYPES']
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = self.choose_encoding()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self._compress_iter(response.response, self.stream(encoding))
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+                return response
+            stream = self.stream(encoding)
+            compressed = stream.compress(data) + stream.finish()
+            if len(compressed) >= len(data):
+                return response
+            response.set_data(compressed)
+
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    @staticmethod
+    def _compress_iter(chunks, stream):
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                data = stream.compress(chunk)
+                if data:
+                    yield data
+            yield stream.finish()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+
+compressor = Compressor()
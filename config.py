@@ -0,0 +1,118 @@
+"""Config profiles for the ACNH Fish Tracker.
+
+Pick one with APP_CONFIG=development|production|testing, or pass it to
+app.create_app. Without it, FLASK_ENV=development selects development and
+anything else gets production, so SQL echo and the debug toolbar stay off
+unless explicitly asked for.
+"""
+import os
+
+
+class Config:
+    """Settings shared by every profile."""
+
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql:///acnhcreatures')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = False
+
+    # One pool per engine per worker process. A gunicorn worker runs
+    # WEB_THREADS requests at a time (see gunicorn.conf.py), each holding
+    # one connection; overflow covers short bursts. Keep
+    # WEB_CONCURRENCY * (DB_POOL_SIZE + DB_MAX_OVERFLOW) under the
+    # database's connection limit (twice that with a replica). Every
+    # statement is cut off after DB_STATEMENT_TIMEOUT ms (0 disables it).
+    DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 5000))
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', os.environ.get('WEB_THREADS', 1))),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 2)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 5)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+        'connect_args': {
+            'options': f"-c statement_timeout={DB_STATEMENT_TIMEOUT}",
+        },
+    }
+
+    # Optional read replica for read-only routes (see models.Database).
+    # A user's reads stay on the primary for REPLICA_STICKY_SECONDS after
+    # they write, so they see their own changes despite replication lag.
+    SQLALCHEMY_BINDS = ({'replica': os.environ['DATABASE_REPLICA_URL']}
+                        if os.environ.get('DATABASE_REPLICA_URL') else None)
+    REPLICA_RETRY_SECONDS = 30
+    REPLICA_STICKY_SECONDS = 5
+
+    # The async API tier (see async_api.py) serves every request in a
+    # process from one asyncpg pool of up to ASYNC_DB_POOL_SIZE connections.
+    ASYNC_DB_POOL_SIZE = int(os.environ.get('ASYNC_DB_POOL_SIZE', 10))
+
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'hellosecret1')
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+
+    # Part of collection ETags, so a deploy invalidates cached pages.
+    RELEASE_ID = os.environ.get('HEROKU_SLUG_COMMIT', os.environ.get('SOURCE_VERSION', ''))
+
+    DEBUG_TB_ENABLED = False
+    DEBUG_TB_INTERCEPT_REDIRECTS = False
+
+    # Per-request instrumentation (see metrics.py), on only with a
+    # METRICS_TOKEN: /metrics then requires "Authorization: Bearer <token>".
+    # Server-Timing headers go to callers with the token, or everyone
+    # with SERVER_TIMING.
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_ENABLED = bool(METRICS_TOKEN)
+    SERVER_TIMING = False
+
+    # Response compression (see compression.py).
+    COMPRESS_ENABLED = True
+    COMPRESS_MIMETYPES = ('text/html', 'text/css', 'text/plain', 'application/json',
+                          'application/javascript')
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+    COMPRESS_BROTLI = True
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+
+    # How long browsers and shared caches may reuse a shared collection
+    # (see share.py) before revalidating it.
+    SHARE_MAX_AGE = int(os.environ.get('SHARE_MAX_AGE', 60))
+
+
+class DevelopmentConfig(Config):
+    SQLALCHEMY_ECHO = True
+    DEBUG_TB_ENABLED = True
+    METRICS_ENABLED = True
+    SERVER_TIMING = True
+
+
+class ProductionConfig(Config):
+    pass
+
+
+class TestingConfig(Config):
+    """The test suite's database, cheap password hashes and no CSRF."""
+
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'postgresql:///test-acnh')
+    SQLALCHEMY_BINDS = None
+    TESTING = True
+    BCRYPT_LOG_ROUNDS = 4
+    WTF_CSRF_ENABLED = False
+    METRICS_ENABLED = True
+    SERVER_TIMING = True
+    # Don't cache user rows between tests
+    USER_CACHE_TTL = 0
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
+
+
+def get_config(name=None):
+    """Return the config class for `name`, APP_CONFIG or FLASK_ENV."""
+
+    if name is None:
+        name = os.environ.get('APP_CONFIG')
+    if name is None:
+        name = 'development' if os.environ.get('FLASK_ENV') == 'development' else 'production'
+    return CONFIGS[name]
@@ -0,0 +1,20 @@
+"""File helpers shared by the on-disk stores (assets, icons, API cache)."""
+import os
+import tempfile
+
+
+def write_atomic(path, data):
+    """Write `data` to `path` through a temp file in the same directory and
+    a rename, so concurrent readers see the old file or the new one, never
+    half of it."""
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
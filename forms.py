@@ -16,4 +16,7 @@ class LoginForm(FlaskForm):
     """Login form."""
 
     username = StringField('Username', validators=[DataRequired()])
-    password = PasswordField('Password', validators=[Length(min=6)])
\ No newline at end of file
+    password = PasswordField('Password', validators=[Length(min=6)])
+
+class ShareForm(FlaskForm):
+    """Share, reshare or stop sharing a collection (CSRF token only)."""
@@ -0,0 +1,96 @@
+"""Fragment cache for the tracker page's fish card grid.
+
+Each fish card is rendered once per catalog version, sprite sheet and
+caught state, then reused. A tracker page becomes a join of cached strings driven by the
+user's caught set instead of a Jinja loop over every fish.
+
+The cache is an LRU capped at FRAGMENT_CACHE_BYTES (default 2 MB) of HTML
+per worker. Cards from an old catalog or sprite are never looked up again
+and age out.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from flask import render_template
+from markupsafe import Markup
+
+from metrics import metrics
+
+
+class FragmentCache:
+    """LRU of rendered HTML fragments with a size cap in bytes."""
+
+    def __init__(self, max_bytes, name='fragment_cache'):
+        self.max_bytes = max_bytes
+        self.name = name
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key, render):
+        """Return the fragment for `key`, calling render() to make it on a miss."""
+
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        html = render()
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = html
+                self.size += len(html)
+                while self.size > self.max_bytes and len(self._entries) > 1:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.size -= len(evicted)
+                    self.evictions += 1
+        return html
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def prometheus_lines(self):
+        """Counters for /metrics."""
+
+        counters = (('hits_total', 'counter', self.hits),
+                    ('misses_total', 'counter', self.misses),
+                    ('evictions_total', 'counter', self.evictions),
+                    ('bytes', 'gauge', self.size))
+        lines = []
+        for suffix, kind, value in counters:
+            metric = f'acnh_{self.name}_{suffix}'
+            lines += [f'# TYPE {metric} {kind}', f'{metric} {value}']
+        return lines
+
+
+card_cache = FragmentCache(int(os.environ.get('FRAGMENT_CACHE_BYTES', 2 * 1024 * 1024)))
+metrics.add_collector(card_cache.prometheus_lines)
+
+
+def fish_card(catalog, icons, fish_id, is_caught):
+    """Rendered card for one fish in one caught state."""
+
+    return card_cache.get_or_render(
+        (catalog.version, icons.sprite, fish_id, is_caught),
+        lambda: render_template('users/_fish_card.html',
+                                fish=catalog.fish[fish_id],
+                                in_sprite=fish_id in icons.icons,
+                                is_caught=is_caught))
+
+
+def card_grid(catalog, icons, caught_ids):
+    """Every fish card in catalog order, caught state taken from `caught_ids`.
+
+    `icons` is the current icons.IconManifest; fish in its sprite sheet get a
+    sprite icon instead of a link to their icon_url."""
+
+    return Markup(''.join(fish_card(catalog, icons, fish_id, fish_id in caught_ids)
+                          for fish_id in catalog.ids))
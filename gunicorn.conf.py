@@ -0,0 +1,59 @@
+"""Gunicorn settings, read automatically by the Procfile's gunicorn (the
+async_api web app on uvicorn workers) and by `gunicorn 'app:create_app()'`.
+
+The app is preloaded: the master creates it and warms the in-memory fish
+catalog once, then forks workers that share those pages copy-on-write and
+take requests warm. Connections the master opened while warming are
+closed before the fork; each worker's pools connect on first use.
+"""
+import gc
+import os
+
+# Each thread holds one database connection; config.py sizes the pool to match.
+# (Uvicorn workers run the Flask app on as many threads; see async_api.py.)
+threads = int(os.environ.get('WEB_THREADS', 1))
+preload_app = True
+
+
+def flask_app(app):
+    """The Flask app `app` is, or serves (async_api's web app)."""
+
+    return getattr(app, 'flask_app', app)
+
+
+def warm(app):
+    """Load the in-memory fish catalog."""
+
+    from catalog import fish_catalog
+
+    with flask_app(app).app_context():
+        fish_catalog.get()
+
+
+def when_ready(server):
+    """Warm the preloaded app in the master, before any worker is forked."""
+
+    if not server.cfg.preload_app:
+        return
+
+    from models import db
+
+    app = server.app.wsgi()
+    try:
+        warm(app)
+    except Exception:
+        server.log.exception("Could not warm the fish catalog; workers will load it")
+    finally:
+        with flask_app(app).app_context():
+            db.dispose()
+
+    # Keep the warmed objects out of collections, which would touch (and
+    # so copy) their pages in every worker.
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    """Without preload, warm each worker before it takes requests."""
+
+    if not worker.cfg.preload_app:
+        warm(worker.wsgi)
@@ -0,0 +1,180 @@
+"""Local icon cache for the fish catalog.
+
+load_database() downloads each fish icon once into a content-addressed
+store (files are named by the SHA-256 of their bytes), makes a square
+thumbnail of it and packs every thumbnail into one sprite sheet with a
+stylesheet of offsets. The tracker grid then needs a single image request
+to our own /icons route instead of one per fish to acnhapi.com.
+
+Stored files are never rewritten or deleted, so they can be served as
+immutable and pages rendered against an older sprite keep working.
+manifest.json in the store maps fish ids to their files.
+
+The store defaults to icon_store/ beside this file, which on Heroku is
+part of the slug: dyno filesystems are per-dyno and reset on restart, so
+bin/post_compile fills it at deploy time (python build_icons.py) and
+every dyno ships the same icons. A store written at runtime, e.g. by
+python seed.py on a one-off dyno, is only seen by that dyno.
+"""
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import namedtuple
+
+from files import write_atomic
+
+log = logging.getLogger(__name__)
+
+ICON_STORE_DIR = os.environ.get('ICON_STORE_DIR',
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'icon_store'))
+THUMB_SIZE = int(os.environ.get('ICON_THUMB_SIZE', 64))
+SPRITE_COLUMNS = 10
+
+# <sha256>.<ext>: the only names /icons will serve
+FILE_NAME = re.compile(r'[0-9a-f]{64}\.(png|css)')
+
+IconManifest = namedtuple('IconManifest', ['sprite', 'css', 'size', 'icons'])
+EMPTY_MANIFEST = IconManifest(sprite=None, css=None, size=THUMB_SIZE, icons={})
+
+
+class IconStore:
+    """Content-addressed files plus the current manifest."""
+
+    def __init__(self, root=ICON_STORE_DIR):
+        self.root = root
+        self._manifest = EMPTY_MANIFEST
+        self._manifest_mtime = None
+        self._lock = threading.Lock()
+
+    def put(self, data, ext):
+        """Store `data` and return its file name."""
+
+        name = f'{hashlib.sha256(data).hexdigest()}.{ext}'
+        path = self.path(name)
+        if not os.path.exists(path):
+            write_atomic(path, data)
+        return name
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def has(self, name):
+        return os.path.exists(self.path(name))
+
+    def manifest(self):
+        """Return the current IconManifest, re-reading it if the file changed."""
+
+        try:
+            mtime = os.stat(self.path('manifest.json')).st_mtime_ns
+        except OSError:
+            return EMPTY_MANIFEST
+        if mtime != self._manifest_mtime:
+            with self._lock:
+                with open(self.path('manifest.json')) as f:
+                    data = json.load(f)
+                self._manifest = IconManifest(
+                    sprite=data['sprite'], css=data['css'], size=data['size'],
+                    icons={int(fish_id): entry for fish_id, entry in data['icons'].items()})
+                self._manifest_mtime = mtime
+        return self._manifest
+
+    def write_manifest(self, manifest):
+        write_atomic(self.path('manifest.json'),
+                     json.dumps(manifest._asdict(), sort_keys=True).encode())
+
+icon_store = IconStore()
+
+
+def make_thumbnail(data, size=THUMB_SIZE):
+    """Return PNG bytes of the image `data` fitted into a size x size square."""
+
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert('RGBA')
+        image.thumbnail((size, size))
+        square = Image.new('RGBA', (size, size))
+        square.paste(image, ((size - image.width) // 2, (size - image.height) // 2))
+    out = io.BytesIO()
+    square.save(out, 'PNG', optimize=True)
+    return out.getvalue()
+
+
+def build_sprite(store, thumbs, size):
+    """Pack `thumbs` ({fish_id: thumbnail name}) into one sprite sheet.
+
+    Returns the sprite and stylesheet file names.
+    """
+
+    from PIL import Image
+
+    columns = min(SPRITE_COLUMNS, len(thumbs))
+    rows = math.ceil(len(thumbs) / columns)
+    sheet = Image.new('RGBA', (columns * size, rows * size))
+    rules = []
+    for n, (fish_id, thumb) in enumerate(sorted(thumbs.items())):
+        x, y = (n % columns) * size, (n // columns) * size
+        with Image.open(store.path(thumb)) as image:
+            sheet.paste(image, (x, y))
+        rules.append(f'.fish-icon-{fish_id}{{background-position:-{x}px -{y}px}}')
+
+    out = io.BytesIO()
+    sheet.save(out, 'PNG', optimize=True)
+    sprite = store.put(out.getvalue(), 'png')
+
+    css = (f'.fish-icon{{display:block;width:{size}px;height:{size}px;margin:0 auto;'
+           f'background:url(/icons/{sprite}) no-repeat}}\n' + '\n'.join(rules) + '\n')
+    return sprite, store.put(css.encode(), 'css')
+
+
+def sync_icons(fish, client, store=icon_store, size=THUMB_SIZE):
+    """Cache icons for `fish` (rows with id and icon_url) and rebuild the sprite.
+
+    An icon is only downloaded when its icon_url is new; icons that fail to
+    download are skipped, so those cards keep linking to icon_url.
+    Returns {'downloaded': [...], 'failed': [...], 'sprite': name}.
+    """
+
+    import requests
+
+    previous = store.manifest()
+    icons = {}
+    report = {'downloaded': [], 'failed': [], 'sprite': None}
+
+    for f in fish:
+        if not f.icon_url.startswith(('http://', 'https://')):
+            continue
+
+        entry = previous.icons.get(f.id)
+        if (entry and entry['source'] == f.icon_url and previous.size == size
+                and store.has(entry['icon']) and store.has(entry['thumb'])):
+            icons[f.id] = entry
+            continue
+
+        try:
+            data = client.get_bytes(f.icon_url)
+            icons[f.id] = {'source': f.icon_url,
+                           'icon': store.put(data, 'png'),
+                           'thumb': store.put(make_thumbnail(data, size), 'png')}
+        except (requests.RequestException, OSError) as exc:
+            log.warning("Could not cache icon for fish %s: %s", f.id, exc)
+            report['failed'].append(f.name)
+            continue
+        report['downloaded'].append(f.name)
+
+    if not icons:
+        return report
+
+    if icons == previous.icons and previous.size == size:
+        report['sprite'] = previous.sprite
+        return report
+
+    sprite, css = build_sprite(store, {fish_id: e['thumb'] for fish_id, e in icons.items()}, size)
+    store.write_manifest(IconManifest(sprite=sprite, css=css, size=size, icons=icons))
+    report['sprite'] = sprite
+    return report
@@ -0,0 +1,73 @@
+"""Short-lived per-worker cache of logged-in users' display fields.
+
+Saves the users lookup on pages that show the current user. Entries live
+for USER_CACHE_TTL seconds (0 disables the cache).
+
+Only DISPLAY_FIELDS are cached. Anything else on the User (password,
+share_token, collection_version) is left unloaded and read from the
+database when touched, so another worker's write to it (which can't
+reach this cache) is never served stale. Call forget() after writing a
+user anyway, for this worker's display fields.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy.orm import make_transient_to_detached
+
+from models import db, User
+
+# What g.user shows on every page (see templates/base.html)
+DISPLAY_FIELDS = ('id', 'username', 'profile_img')
+
+
+class IdentityCache:
+    """LRU of users' DISPLAY_FIELDS, keyed by user id, with a TTL."""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Return the User for `user_id` attached to db.session, or None.
+
+        On a hit the User is rebuilt from cached display fields and merged
+        into the session without a query; its other columns load on access.
+        """
+
+        ttl = current_app.config.get('USER_CACHE_TTL', 60)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                values = entry[1]
+            else:
+                values = None
+
+        if values is not None:
+            user = User(**values)
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
+
+        user = User.query.get(user_id)
+        if user and ttl > 0:
+            values = {field: getattr(user, field) for field in DISPLAY_FIELDS}
+            with self._lock:
+                self._entries[user_id] = (now + ttl, values)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return user
+
+    def forget(self, user_id):
+        """Drop `user_id` so the next lookup reads the database."""
+
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+identity_cache = IdentityCache()
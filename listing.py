@@ -0,0 +1,86 @@
+"""Helpers shared by the list API endpoints.
+
+Keyset pagination (?after=<id>&limit=), field projection (?fields=id,name),
+caught-state filtering (?caught=true|false) and streamed JSON output.
+"""
+import json
+from collections import namedtuple
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+ListArgs = namedtuple('ListArgs', ['after', 'limit', 'fields', 'caught', 'paginated'])
+
+
+def parse_list_args(args, allowed_fields):
+    """Parse list query string `args` (request.args).
+
+    Raises ValueError with a message fit for a 400 response.
+    """
+
+    paginated = 'after' in args or 'limit' in args
+
+    try:
+        after = int(args['after']) if 'after' in args else None
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError("after and limit must be integers")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+
+    fields = None
+    if args.get('fields'):
+        fields = args['fields'].split(',')
+        unknown = set(fields) - set(allowed_fields)
+        if unknown:
+            raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+
+    caught = args.get('caught')
+    if caught not in (None, 'true', 'false'):
+        raise ValueError("caught must be true or false")
+    if caught is not None:
+        caught = caught == 'true'
+
+    return ListArgs(after=after, limit=limit if paginated else None, fields=fields,
+                    caught=caught, paginated=paginated)
+
+
+def project(item, fields):
+    """Return only `fields` of dict `item` (all of it if `fields` is None)."""
+
+    if fields is None:
+        return item
+    return {field: item[field] for field in fields}
+
+
+def encode(obj):
+    """Compact JSON bytes."""
+
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def page_json(key, items, next_after):
+    """Encode one page: {key: [...], "next_after": id or null}."""
+
+    return encode({key: items, 'next_after': next_after})
+
+
+def stream_json(key, items, chunk_size=100):
+    """Yield the JSON document {key: [...]} in chunks of `chunk_size` items.
+
+    Items are encoded as they are produced, so memory stays flat however
+    long `items` is.
+    """
+
+    yield b'{"' + key.encode() + b'":['
+    chunk = []
+    first = True
+    for item in items:
+        chunk.append(encode(item))
+        if len(chunk) == chunk_size:
+            yield (b'' if first else b',') + b','.join(chunk)
+            chunk = []
+            first = False
+    if chunk:
+        yield (b'' if first else b',') + b','.join(chunk)
+    yield b']}'
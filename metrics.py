@@ -0,0 +1,180 @@
+"""Per-request performance instrumentation.
+
+Collects, per worker process:
+
+- request latency histograms by route
+- SQL statement count and time per request (and by route)
+- external API call timings
+
+Totals are served in Prometheus text format at /metrics, and responses
+get a Server-Timing header with their own app, db and api time when
+SERVER_TIMING is on or the caller sends the METRICS_TOKEN.
+
+Timings stop when the view returns, so the body of a streamed response is
+not included.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class Metrics:
+    """Process-wide metric registry."""
+
+    # name -> (type, help, buckets or None)
+    METRICS = {
+        'acnh_request_duration_seconds': ('histogram', "Request latency by route.", LATENCY_BUCKETS),
+        'acnh_requests_total': ('counter', "Requests by route and status.", None),
+        'acnh_db_queries_per_request': ('histogram', "SQL statements per request by route.", QUERY_COUNT_BUCKETS),
+        'acnh_db_seconds_per_request': ('histogram', "SQL time per request by route.", LATENCY_BUCKETS),
+        'acnh_external_request_duration_seconds': ('histogram', "External API call latency.", LATENCY_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {name: {} for name in self.METRICS}
+        self._collectors = []
+
+    def observe(self, name, labels, value):
+        """Add `value` to the histogram `name` with `labels` (a tuple of pairs)."""
+
+        with self._lock:
+            series = self._series[name]
+            if labels not in series:
+                series[labels] = Histogram(self.METRICS[name][2])
+            series[labels].observe(value)
+
+    def inc(self, name, labels, amount=1):
+        """Increment the counter `name` with `labels`."""
+
+        with self._lock:
+            series = self._series[name]
+            series[labels] = series.get(labels, 0) + amount
+
+    def add_collector(self, collector):
+        """Register a callable returning extra Prometheus text lines."""
+
+        self._collectors.append(collector)
+
+    def render(self):
+        """Return everything in Prometheus text exposition format."""
+
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, _) in self.METRICS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in sorted(self._series[name].items()):
+                    label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+                    if kind == 'histogram':
+                        lines.extend(value.lines(name, label_text))
+                    else:
+                        lines.append(f'{name}{{{label_text}}} {value}')
+        for collector in self._collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+    def observe_external(self, service, seconds):
+        """Record one external API call, also charging it to the current request."""
+
+        self.observe('acnh_external_request_duration_seconds', (('service', service),), seconds)
+        if has_request_context() and 'metrics_start' in g:
+            g.metrics_api_time += seconds
+
+    def init_app(self, app):
+        """Time every request and serve /metrics."""
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self._metrics_view)
+
+    def _start_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_db_count = 0
+        g.metrics_db_time = 0.0
+        g.metrics_api_time = 0.0
+
+    def _finish_request(self, response):
+        if 'metrics_start' not in g:
+            return response
+
+        elapsed = time.perf_counter() - g.metrics_start
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = (('route', route), ('method', request.method))
+
+        self.observe('acnh_request_duration_seconds', labels, elapsed)
+        self.inc('acnh_requests_total', labels + (('status', str(response.status_code)),))
+        self.observe('acnh_db_queries_per_request', labels, g.metrics_db_count)
+        self.observe('acnh_db_seconds_per_request', labels, g.metrics_db_time)
+
+        timing = [f'app;dur={elapsed * 1000:.1f}',
+                  f'db;dur={g.metrics_db_time * 1000:.1f};desc="{g.metrics_db_count} queries"']
+        if g.metrics_api_time:
+            timing.append(f'api;dur={g.metrics_api_time * 1000:.1f}')
+        if current_app.config.get('SERVER_TIMING') or self._has_token():
+            response.headers['Server-Timing'] = ', '.join(timing)
+        return response
+
+    def _has_token(self):
+        token = current_app.config.get('METRICS_TOKEN')
+        return bool(token) and request.headers.get('Authorization') == f'Bearer {token}'
+
+    def _metrics_view(self):
+        if current_app.config.get('METRICS_TOKEN') and not self._has_token():
+            # Not abort(403): the app's error pages are HTML with status 200
+            return Response('Forbidden\n', status=403, mimetype='text/plain')
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_start' in g:
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _finish_query(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if starts and has_request_context() and 'metrics_start' in g:
+        g.metrics_db_count += 1
+        g.metrics_db_time += time.perf_counter() - starts.pop()
+
+
+@event.listens_for(Engine, 'handle_error')
+def _fail_query(context):
+    starts = context.connection.info.get('metrics_query_start') if context.connection else None
+    if starts:
+        starts.pop()
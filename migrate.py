@@ -0,0 +1,171 @@
+"""One-shot data migrations for the ACNH Fish Tracker database.
+
+Run a migration like:
+
+    python migrate.py sparse_collections
+    python migrate.py collection_version
+    python migrate.py fish_availability
+    python migrate.py creature_catalog
+    python migrate.py share_tokens
+    python migrate.py catch_counts
+    python migrate.py creature_categories
+    python migrate.py ordinal_high_water
+    python migrate.py creature_category_check
+"""
+import os
+import sys
+
+# Migrations may run longer than any web request is allowed to.
+os.environ.setdefault('DB_STATEMENT_TIMEOUT', '0')
+
+from models import db, CATEGORIES
+from app import create_app
+
+
+def sparse_collections():
+    """Delete stored uncaught fish.
+
+    Users_Fish only keeps caught fish now; a missing row means uncaught,
+    so rows with is_caught = false are redundant.
+    """
+
+    result = db.session.execute("DELETE FROM users_fish WHERE is_caught = false")
+    db.session.commit()
+    print(f"Removed {result.rowcount} uncaught users_fish rows.")
+
+
+def collection_version():
+    """Add users.collection_version, which drives collection ETags."""
+
+    db.session.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS "
+                       "collection_version bigint NOT NULL DEFAULT 0")
+    db.session.commit()
+    print("Added users.collection_version.")
+
+
+def fish_availability():
+    """Add fish price, location and availability bitmasks.
+
+    Run `python seed.py --force` afterwards to fill them in.
+    """
+
+    db.session.execute("""
+        ALTER TABLE fish
+            ADD COLUMN IF NOT EXISTS price integer,
+            ADD COLUMN IF NOT EXISTS location text,
+            ADD COLUMN IF NOT EXISTS months_north integer NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS months_south integer NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS hours integer NOT NULL DEFAULT 0""")
+    db.session.commit()
+    print("Added fish availability columns; run `python seed.py --force` to fill them.")
+
+
+def creature_catalog():
+    """Move fish into creatures and caught state into collection bitmaps.
+
+    Fish keep their ids and are numbered (ordinal) in id order; each
+    user's users_fish rows become one bitmap with bit n set for the fish
+    with ordinal n. The old fish and users_fish tables are dropped.
+    """
+
+    db.create_all()
+    db.session.execute("""
+        INSERT INTO creatures (id, category, ordinal, name, icon_url, catchphrase,
+                               price, location, months_north, months_south, hours)
+        SELECT id, 'fish', row_number() OVER (ORDER BY id) - 1, name, icon_url, catchphrase,
+               price, location, months_north, months_south, hours
+        FROM fish""")
+    db.session.execute("SELECT setval(pg_get_serial_sequence('creatures', 'id'), "
+                       "COALESCE((SELECT MAX(id) FROM creatures), 0) + 1, false)")
+
+    caught = {}
+    rows = db.session.execute("""
+        SELECT uf.user_id, c.ordinal
+        FROM users_fish uf JOIN creatures c ON c.id = uf.fish_id
+        WHERE uf.is_caught""")
+    for user_id, ordinal in rows:
+        caught.setdefault(user_id, set()).add(ordinal)
+    for user_id, ordinals in caught.items():
+        bits = ''.join('1' if n in ordinals else '0' for n in range(max(ordinals) + 1))
+        db.session.execute("INSERT INTO collections (user_id, category, caught) "
+                           "VALUES (:user_id, 'fish', CAST(:bits AS varbit))",
+                           {'user_id': user_id, 'bits': bits})
+
+    db.session.execute("DROP TABLE users_fish, fish")
+    db.session.commit()
+    print(f"Moved fish into creatures and {len(caught)} collections into bitmaps.")
+
+
+def share_tokens():
+    """Add users.share_token, the public link to a shared collection."""
+
+    db.session.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS share_token text UNIQUE")
+    db.session.commit()
+    print("Added users.share_token.")
+
+
+def catch_counts():
+    """Add catch_counts and fill it in from the collection bitmaps."""
+
+    from stats import reconcile_catch_counts
+
+    db.create_all()
+    fixed = reconcile_catch_counts()
+    print(f"Added catch_counts for {len(fixed)} caught creatures.")
+
+
+def creature_categories():
+    """Add creature_categories, which records the API ETag each category
+    was last synced from. Until the next sync no category has one, so it
+    syncs even if the API reports no change."""
+
+    db.create_all()
+    print("Added creature_categories; the next `python seed.py` syncs in full.")
+
+
+def ordinal_high_water():
+    """Add creature_categories.next_ordinal, the ordinal high-water mark,
+    starting each category one past its highest ordinal in use. (Ordinals
+    of creatures deleted before now can't be recovered; their bits were
+    cleared when they were deleted.)"""
+
+    db.session.execute("ALTER TABLE creature_categories "
+                       "ADD COLUMN IF NOT EXISTS next_ordinal integer NOT NULL DEFAULT 0")
+    result = db.session.execute("""
+        INSERT INTO creature_categories (category, next_ordinal)
+        SELECT category, MAX(ordinal) + 1 FROM creatures GROUP BY category
+        ON CONFLICT (category) DO UPDATE
+        SET next_ordinal = greatest(creature_categories.next_ordinal, EXCLUDED.next_ordinal)""")
+    db.session.commit()
+    print(f"Set the ordinal high-water mark of {result.rowcount} categories.")
+
+
+def creature_category_check():
+    """Reject creatures of categories without a Creature subclass (see
+    models.CATEGORIES); the ORM couldn't load them."""
+
+    db.session.execute("ALTER TABLE creatures DROP CONSTRAINT IF EXISTS creatures_category_check")
+    db.session.execute(f"ALTER TABLE creatures ADD CONSTRAINT creatures_category_check "
+                       f"CHECK (category IN ({', '.join(repr(c) for c in CATEGORIES)}))")
+    db.session.commit()
+    print(f"Creatures are limited to: {', '.join(CATEGORIES)}.")
+
+
+MIGRATIONS = {
+    'sparse_collections': sparse_collections,
+    'collection_version': collection_version,
+    'fish_availability': fish_availability,
+    'creature_catalog': creature_catalog,
+    'share_tokens': share_tokens,
+    'catch_counts': catch_counts,
+    'creature_categories': creature_categories,
+    'ordinal_high_water': ordinal_high_water,
+    'creature_category_check': creature_category_check,
+}
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2 or sys.argv[1] not in MIGRATIONS:
+        sys.exit(f"usage: python migrate.py [{'|'.join(MIGRATIONS)}]")
+
+    with create_app().app_context():
+        MIGRATIONS[sys.argv[1]]()
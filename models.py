@@ -1,14 +1,106 @@
 """Models for ACNH Creature Tracker app."""
+import secrets
+import time
+from contextlib import contextmanager
+
 from flask_bcrypt import Bcrypt
-from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.dialects.postgresql import BIT
+
+from passwords import hash_pool
+
+REPLICA = 'replica'
+
+
+class RoutingSession(SignallingSession):
+    """Session that sends queries to the read replica while `use_replica`
+    is set (see Database.reading). Flushes always go to the primary."""
+
+    use_replica = False
+
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.use_replica and not self._flushing:
+            replica = self.db.replica_engine()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper, clause)
+
+
+class Database(SQLAlchemy):
+    """Flask-SQLAlchemy with an optional read replica.
+
+    Engines are tuned by SQLALCHEMY_ENGINE_OPTIONS (pool size, pre-ping,
+    statement timeout; see config.py). With SQLALCHEMY_BINDS['replica'] set,
+    queries inside `reading()` go to that database. If connecting to it
+    fails, it is skipped for REPLICA_RETRY_SECONDS and everything reads
+    from the primary.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._replica_down_until = 0
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def replica_engine(self):
+        """The replica's engine, or None if there is none or it recently failed."""
+
+        app = self.get_app()
+        if REPLICA not in (app.config['SQLALCHEMY_BINDS'] or {}):
+            return None
+        if time.monotonic() < self._replica_down_until:
+            return None
+        engine = self.get_engine(app, bind=REPLICA)
+        if not event.contains(engine, 'handle_error', self._replica_error):
+            event.listen(engine, 'handle_error', self._replica_error)
+        return engine
+
+    def _replica_error(self, context):
+        # Failing to connect (no connection yet) or losing the connection
+        # means the replica is unusable, not that the query was wrong.
+        if context.connection is None or context.is_disconnect:
+            self._replica_down_until = (time.monotonic()
+                                        + self.get_app().config.get('REPLICA_RETRY_SECONDS', 30))
+
+    def replica_failed(self):
+        """Is the replica currently being skipped after a failure?"""
+
+        return time.monotonic() < self._replica_down_until
+
+    def dispose(self, app=None):
+        """Close the pooled connections of every engine of `app`, e.g.
+        before forking, so no two processes share a connection."""
+
+        app = self.get_app(app)
+        for bind in [None] + list(app.config['SQLALCHEMY_BINDS'] or ()):
+            self.get_engine(app, bind).dispose()
+
+    @contextmanager
+    def reading(self, use_replica=True):
+        """Route this block's queries to the replica (or, with
+        use_replica=False, back to the primary)."""
+
+        session = self.session()
+        previous = session.use_replica
+        session.use_replica = use_replica
+        try:
+            yield
+        finally:
+            session.use_replica = previous
+
 
 bcrypt = Bcrypt()
-db = SQLAlchemy()
+db = Database()
 
 def connect_db(app):
     """Connect to database."""
 
-    db.app = app
     db.init_app(app)
 
 class User(db.Model):
@@ -29,12 +121,67 @@ class User(db.Model):
                 nullable=False)
     profile_img = db.Column(db.Text,
                 default="/static/images/default-pic.png")
-
-    fish = db.relationship('Fish', secondary='users_fish', backref='user')
+    collection_version = db.Column(db.BigInteger,
+                nullable=False,
+                default=0,
+                server_default='0')
+    # Public, read-only link to the collection (see share.py); None if not shared.
+    share_token = db.Column(db.Text,
+                unique=True)
 
     def __repr__(self):
         return f"<User {self.username} {self.email} >"
 
+    @classmethod
+    def collection_version_of(cls, user_id):
+        """Return the user's collection version (None if no such user).
+
+        Bumped by every write to the user's caught fish, so it can drive
+        ETags without reading the collection.
+        """
+
+        return db.session.query(cls.collection_version).filter(cls.id == user_id).scalar()
+
+    @classmethod
+    def shared_by(cls, token):
+        """Return (id, username, collection_version) of the user sharing
+        `token`, or None if no one is."""
+
+        return (db.session.query(cls.id, cls.username, cls.collection_version)
+                .filter(cls.share_token == token)
+                .first())
+
+    def share(self):
+        """Give the user a new share token, revoking any old one."""
+
+        self.share_token = secrets.token_urlsafe(16)
+
+    def unshare(self):
+        """Revoke the user's share token."""
+
+        self.share_token = None
+
+    @staticmethod
+    def bcrypt_rounds():
+        """Configured bcrypt cost (BCRYPT_LOG_ROUNDS, default 12)."""
+
+        return db.get_app().config.get('BCRYPT_LOG_ROUNDS', 12)
+
+    @classmethod
+    def hash_password(cls, password):
+        """Hash `password` on the hashing pool at the configured cost.
+
+        Raises passwords.HashingBusy if the pool is saturated.
+        """
+
+        return hash_pool.run(bcrypt.generate_password_hash, password,
+                             cls.bcrypt_rounds()).decode('UTF-8')
+
+    def needs_rehash(self):
+        """Is the stored hash at a different cost than configured?"""
+
+        return int(self.password.split('$')[2]) != self.bcrypt_rounds()
+
     @classmethod
     def register(cls, username, email, password, profile_img):
         """Sign up user.
@@ -42,7 +189,7 @@ class User(db.Model):
         Hashes password and adds user to system.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = cls.hash_password(password)
 
         user = User(
             username=username,
@@ -63,39 +210,98 @@ class User(db.Model):
         and, if it finds such a user, returns that user object.
 
         If can't find matching user (or if password is wrong), returns False.
+
+        If the stored hash uses an outdated cost, it is replaced with a
+        fresh hash at the configured cost (commit to save it).
         """
 
         user = cls.query.filter_by(username=username).first()
 
         if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
+            is_auth = hash_pool.run(bcrypt.check_password_hash, user.password, password)
             if is_auth:
+                if user.needs_rehash():
+                    user.password = cls.hash_password(password)
                 return user
 
         return False
 
-class Fish(db.Model):
-    """Fish."""
+# Categories with a Creature subclass (polymorphic_identity); creatures of
+# any other category couldn't be loaded, so the table rejects them.
+CATEGORIES = ('fish',)
+
+
+def _next_ordinal(context):
+    """Default ordinal: the next from the category's high-water mark (see
+    CreatureCategory.take_ordinals), past rows earlier in the same
+    executemany batch."""
+
+    current = context.get_current_parameters()
+    category = current['category']
+    floor = 0
+    for params in context.compiled_parameters:
+        if params is current:
+            break
+        if params.get('category') == category and params.get('ordinal') is not None:
+            floor = max(floor, params['ordinal'] + 1)
+    return context.connection.execute(TAKE_ORDINALS_SQL,
+                                      {'category': category, 'floor': floor, 'count': 1}).scalar()
+
+
+class Creature(db.Model):
+    """A catalog entry of one of CATEGORIES (only fish so far; bugs, sea
+    creatures and fossils each need a subclass first).
 
-    __tablename__ = "fish"
+    `ordinal` numbers creatures within their category, starting at 0, and
+    never changes once assigned, nor is it reused after the creature is
+    deleted; it is the creature's bit in collection bitmaps (see
+    Collection).
+    """
+
+    __tablename__ = "creatures"
+    __table_args__ = (
+        db.UniqueConstraint('category', 'ordinal'),
+        db.UniqueConstraint('category', 'name'),
+        db.CheckConstraint(f"category IN ({', '.join(repr(c) for c in CATEGORIES)})",
+                           name='creatures_category_check'),
+    )
 
     id = db.Column(db.Integer,
                 primary_key=True,
                 autoincrement=True)
-    name = db.Column(db.Text,
+    category = db.Column(db.Text,
+                nullable=False)
+    ordinal = db.Column(db.Integer,
                 nullable=False,
-                unique=True)
+                default=_next_ordinal)
+    name = db.Column(db.Text,
+                nullable=False)
     icon_url = db.Column(db.Text,
                 nullable=False,
                 unique=True)
     catchphrase = db.Column(db.Text,
                 nullable=False)
-    
-    user_fish = db.relationship('User_Fish', backref='fish')
+    price = db.Column(db.Integer)
+    location = db.Column(db.Text)
+    # Availability bitmasks (see search.py): bit m-1 for month m, bit h for hour h
+    months_north = db.Column(db.Integer,
+                nullable=False,
+                default=0,
+                server_default='0')
+    months_south = db.Column(db.Integer,
+                nullable=False,
+                default=0,
+                server_default='0')
+    hours = db.Column(db.Integer,
+                nullable=False,
+                default=0,
+                server_default='0')
+
+    __mapper_args__ = {'polymorphic_on': category}
 
     def __repr__(self):
-        return f"<Fish {self.name} {self.icon_url} >"
-    
+        return f"<{type(self).__name__} {self.name} {self.icon_url} >"
+
     def serialize(self):
         return {
             'id': self.id,
@@ -104,25 +310,380 @@ class Fish(db.Model):
             'catchphrase': self.catchphrase
         }
 
-class User_Fish(db.Model):
-    """User_Fish relationship."""
+class Fish(Creature):
+    """Fish."""
+
+    __mapper_args__ = {'polymorphic_identity': 'fish'}
 
-    __tablename__ = "users_fish"
+class CatalogVersion(db.Model):
+    """Single-row counter bumped whenever the creature catalog changes.
+
+    Workers poll it to know when their in-memory catalog is stale.
+    """
+
+    __tablename__ = "catalog_version"
+
+    id = db.Column(db.Integer,
+                primary_key=True)
+    version = db.Column(db.BigInteger,
+                nullable=False,
+                default=0)
+
+    @classmethod
+    def current(cls):
+        """Return the current catalog version (0 if never bumped)."""
+
+        version = db.session.query(cls.version).filter(cls.id == 1).scalar()
+        return version or 0
+
+    @classmethod
+    def bump(cls):
+        """Increment the catalog version in the current transaction."""
+
+        db.session.execute(
+            "INSERT INTO catalog_version (id, version) VALUES (1, 1) "
+            "ON CONFLICT (id) DO UPDATE SET version = catalog_version.version + 1")
+
+class CreatureCategory(db.Model):
+    """Sync state of one creature category.
+
+    `source_etag` is the ACNH API ETag of the payload the category was
+    last synced from, written in the sync's own transaction, so a fresh,
+    restored or failed database never looks up to date.
+
+    `next_ordinal` is the category's ordinal high-water mark: every ordinal
+    below it has been handed out, even if its creature is gone since.
+    """
+
+    __tablename__ = "creature_categories"
+
+    category = db.Column(db.Text,
+                primary_key=True)
+    source_etag = db.Column(db.Text)
+    next_ordinal = db.Column(db.Integer,
+                nullable=False,
+                server_default='0')
+
+    @classmethod
+    def synced_etag(cls, category):
+        """Return the ETag `category` was last synced from, or None."""
+
+        return db.session.query(cls.source_etag).filter(cls.category == category).scalar()
+
+    @classmethod
+    def record_sync(cls, category, source_etag):
+        """Record in the current transaction that `category` now matches
+        the payload with ETag `source_etag` (None: unknown)."""
+
+        db.session.execute(
+            "INSERT INTO creature_categories (category, source_etag) VALUES (:category, :etag) "
+            "ON CONFLICT (category) DO UPDATE SET source_etag = EXCLUDED.source_etag",
+            {'category': category, 'etag': source_etag})
+
+    @classmethod
+    def take_ordinals(cls, category, count):
+        """Hand out `count` new ordinals for `category` in the current
+        transaction and return the first; they follow each other. The
+        category row stays locked until commit, so concurrent callers
+        wait rather than share ordinals."""
+
+        return db.session.execute(TAKE_ORDINALS_SQL,
+                                  {'category': category, 'floor': 0, 'count': count}).scalar()
+
+
+# Ordinals start past both the high-water mark and every ordinal in use,
+# so rows inserted with explicit ordinals are never collided with.
+TAKE_ORDINALS_SQL = db.text("""
+    INSERT INTO creature_categories (category, next_ordinal)
+    SELECT :category, greatest(COALESCE(MAX(ordinal) + 1, 0), :floor) + :count
+    FROM creatures WHERE category = :category
+    ON CONFLICT (category) DO UPDATE
+    SET next_ordinal = greatest(creature_categories.next_ordinal, EXCLUDED.next_ordinal - :count) + :count
+    RETURNING next_ordinal - :count
+""")
+
+def _padded(bits, width):
+    """SQL for varbit `bits` zero-padded on the right to at least `width` bits."""
+
+    return f"({bits} || CAST(repeat('0', greatest(0, {width} - length({bits}))) AS varbit))"
+
+
+class Collection(db.Model):
+    """A user's caught creatures in one category, as a bitmap.
+
+    Bit n of `caught` (counting from the left, like get_bit) is set if the
+    user caught the creature with ordinal n. Bits past the end of the
+    bitmap, and users with no row, are uncaught.
+    """
+
+    __tablename__ = "collections"
 
     user_id = db.Column(
         db.Integer,
         db.ForeignKey('users.id', ondelete="cascade"),
         primary_key=True)
-    fish_id = db.Column(
+    category = db.Column(db.Text,
+            primary_key=True)
+    caught = db.Column(BIT(varying=True),
+            nullable=False,
+            default='')
+
+    @classmethod
+    def bitmap(cls, user_id, category='fish'):
+        """Return the user's caught bitmap as a '0'/'1' string ('' if none)."""
+
+        bits = (db.session.query(cls.caught)
+                .filter(cls.user_id == user_id, cls.category == category)
+                .scalar())
+        return bits or ''
+
+    @classmethod
+    def set_caught(cls, user_id, fish_id, is_caught=None, category='fish'):
+        """Set (or with is_caught=None, flip) caught state of one creature for a user.
+
+        Runs as a single statement that sets one bit, so double clicks and
+        concurrent tabs cannot lose an update. Returns {'user_id',
+        'fish_id', 'is_caught', 'catchphrase'}, or None if there is no such
+        creature.
+        """
+
+        row = db.session.execute(SET_CAUGHT_SQL, {
+            'user_id': user_id,
+            'fish_id': fish_id,
+            'category': category,
+            'state': is_caught,
+        }).first()
+        db.session.commit()
+        return cls.caught_change(user_id, fish_id, is_caught, row)
+
+    @staticmethod
+    def caught_change(user_id, fish_id, is_caught, row):
+        """Result of set_caught from the (catchphrase, is_caught) `row` of
+        SET_CAUGHT_SQL: None if there is no such creature."""
+
+        if row is None:
+            return None
+
+        return {
+            'user_id': user_id,
+            'fish_id': fish_id,
+            'is_caught': row['is_caught'] if row['is_caught'] is not None else is_caught,
+            'catchphrase': row['catchphrase']
+        }
+
+    @classmethod
+    def set_many(cls, user_id, states, category='fish'):
+        """Set caught state for many creatures at once.
+
+        `states` maps fish_id -> is_caught. Applied in one statement as a
+        set mask and a clear mask; unknown ids are skipped. Returns a list
+        of {'user_id', 'fish_id', 'is_caught', 'catchphrase'} ordered by id.
+        """
+
+        fish_ids = list(states)
+        rows = db.session.execute(SET_MANY_CAUGHT_SQL, {
+            'user_id': user_id,
+            'category': category,
+            'fish_ids': fish_ids,
+            'states': [states[fish_id] for fish_id in fish_ids],
+        }).fetchall()
+        db.session.commit()
+
+        return [{'user_id': user_id,
+                 'fish_id': row.fish_id,
+                 'is_caught': row.is_caught,
+                 'catchphrase': row.catchphrase}
+                for row in rows]
+
+    @classmethod
+    def merge_staged(cls, category='fish'):
+        """Apply the staged_caught temp table (see transfer.py) to collections
+        in one statement, in the current transaction.
+
+        Staged names are matched to `category` creatures ignoring case and
+        surrounding spaces; the last row for a user and creature wins and
+        creatures with no row keep their state. Returns (rows, users,
+        changed): the matched rows, the users in them and how many of
+        those users' collections changed.
+        """
+
+        row = db.session.execute(MERGE_STAGED_CAUGHT_SQL, {'category': category}).first()
+        return row.rows, row.users, row.changed
+
+
+class CatchCount(db.Model):
+    """How many users have caught a creature.
+
+    Kept up to date by the same statements that change collections
+    (SET_CAUGHT_SQL, SET_MANY_CAUGHT_SQL, MERGE_STAGED_CAUGHT_SQL), so reading it never scans
+    collections. Deleting users or creatures' bits some other way lets it
+    drift until stats.reconcile_catch_counts runs.
+    """
+
+    __tablename__ = "catch_counts"
+
+    creature_id = db.Column(
         db.Integer,
-        db.ForeignKey('fish.id', ondelete="cascade"),
+        db.ForeignKey('creatures.id', ondelete="cascade"),
         primary_key=True)
-    is_caught = db.Column(db.Boolean,
-            nullable=False)
-    
-    def serialize(self):
-        return {
-            'user_id': self.user_id,
-            'fish_id': self.fish_id,
-            'is_caught': self.is_caught
-        }
\ No newline at end of file
+    caught = db.Column(db.Integer,
+            nullable=False,
+            default=0)
+
+    @classmethod
+    def most_caught(cls, category='fish', limit=10):
+        """Return (creature_id, caught) of the `limit` most caught creatures
+        in `category`, most caught first."""
+
+        return (db.session.query(cls.creature_id, cls.caught)
+                .join(Creature, Creature.id == cls.creature_id)
+                .filter(Creature.category == category, cls.caught > 0)
+                .order_by(cls.caught.desc(), cls.creature_id)
+                .limit(limit)
+                .all())
+
+_ORDINAL = "(SELECT ordinal FROM target)"
+_OLD_BITS = _padded("c.caught", f"{_ORDINAL} + 1")
+_STATE_BIT = "CAST(CAST(:state AS boolean) AS integer)"
+
+# :state is true/false to set, NULL to toggle. A missing row is only
+# created to set a bit; `changed` is empty when nothing changed, and
+# `counted` adds a change to the creature's CatchCount.
+SET_CAUGHT_SQL = db.text(f"""
+    WITH target AS (
+        SELECT ordinal, catchphrase FROM creatures
+        WHERE id = :fish_id AND category = :category
+    ), changed AS (
+        INSERT INTO collections AS c (user_id, category, caught)
+        SELECT :user_id, :category, set_bit(CAST(repeat('0', ordinal + 1) AS varbit), ordinal, 1)
+        FROM target
+        WHERE CAST(:state AS boolean) IS NOT FALSE
+           OR EXISTS (SELECT 1 FROM collections
+                      WHERE user_id = :user_id AND category = :category)
+        ON CONFLICT (user_id, category) DO UPDATE
+        SET caught = set_bit({_OLD_BITS}, {_ORDINAL},
+                             COALESCE({_STATE_BIT}, 1 - get_bit({_OLD_BITS}, {_ORDINAL})))
+        WHERE CAST(:state AS boolean) IS NULL
+           OR get_bit({_OLD_BITS}, {_ORDINAL}) <> {_STATE_BIT}
+        RETURNING get_bit(caught, {_ORDINAL}) = 1 AS is_caught
+    ), bumped AS (
+        UPDATE users SET collection_version = collection_version + 1
+        WHERE id = :user_id AND EXISTS (SELECT 1 FROM changed)
+    ), counted AS (
+        INSERT INTO catch_counts AS t (creature_id, caught)
+        SELECT :fish_id, CASE WHEN is_caught THEN 1 ELSE -1 END FROM changed
+        ON CONFLICT (creature_id) DO UPDATE SET caught = t.caught + EXCLUDED.caught
+    )
+    SELECT target.catchphrase, (SELECT is_caught FROM changed) AS is_caught
+    FROM target
+""")
+
+_WIDTH = "greatest(length(c.caught), length(EXCLUDED.caught))"
+_NEW_BITS = (f"(({_padded('c.caught', _WIDTH)} | {_padded('EXCLUDED.caught', _WIDTH)})"
+             f" & ~{_padded('(SELECT clear_bits FROM masks)', _WIDTH)})")
+
+# `old` locks the user's row before `changed` (which reads it) writes it,
+# so the CatchCount deltas come from the bits actually replaced. Counts
+# are locked in id order so concurrent bulk changes can't deadlock.
+SET_MANY_CAUGHT_SQL = db.text(f"""
+    WITH input AS (
+        SELECT t.fish_id, t.is_caught, creatures.ordinal, creatures.catchphrase
+        FROM unnest(CAST(:fish_ids AS integer[]), CAST(:states AS boolean[]))
+             AS t(fish_id, is_caught)
+        JOIN creatures ON creatures.id = t.fish_id AND creatures.category = :category
+    ), masks AS (
+        SELECT CAST(string_agg(CASE WHEN EXISTS (SELECT 1 FROM input WHERE ordinal = i AND is_caught)
+                                    THEN '1' ELSE '0' END, '' ORDER BY i) AS varbit) AS set_bits,
+               CAST(string_agg(CASE WHEN EXISTS (SELECT 1 FROM input WHERE ordinal = i AND NOT is_caught)
+                                    THEN '1' ELSE '0' END, '' ORDER BY i) AS varbit) AS clear_bits
+        FROM generate_series(0, (SELECT max(ordinal) FROM input)) AS i
+    ), old AS (
+        SELECT caught FROM collections
+        WHERE user_id = :user_id AND category = :category
+        FOR UPDATE
+    ), changed AS (
+        INSERT INTO collections AS c (user_id, category, caught)
+        SELECT :user_id, :category, set_bits FROM masks LEFT JOIN old ON true
+        WHERE set_bits IS NOT NULL
+          AND (strpos(CAST(set_bits AS text), '1') > 0 OR old.caught IS NOT NULL)
+        ON CONFLICT (user_id, category) DO UPDATE
+        SET caught = {_NEW_BITS}
+        WHERE {_NEW_BITS} <> {_padded('c.caught', _WIDTH)}
+        RETURNING 1
+    ), bumped AS (
+        UPDATE users SET collection_version = collection_version + 1
+        WHERE id = :user_id AND EXISTS (SELECT 1 FROM changed)
+    ), counted AS (
+        INSERT INTO catch_counts AS t (creature_id, caught)
+        SELECT fish_id, delta FROM (
+            SELECT fish_id, CAST(is_caught AS integer)
+                   - COALESCE((SELECT get_bit(caught, ordinal) FROM old
+                               WHERE length(caught) > ordinal), 0) AS delta
+            FROM input) AS deltas
+        WHERE delta <> 0
+        ORDER BY fish_id
+        ON CONFLICT (creature_id) DO UPDATE SET caught = t.caught + EXCLUDED.caught
+    )
+    SELECT fish_id, is_caught, catchphrase FROM input ORDER BY fish_id
+""")
+
+_STAGED_CLEAR_BITS = "(SELECT clear_bits FROM masks WHERE masks.user_id = c.user_id)"
+_MERGED_BITS = (f"(({_padded('c.caught', _WIDTH)} | {_padded('EXCLUDED.caught', _WIDTH)})"
+                f" & ~{_padded(_STAGED_CLEAR_BITS, _WIDTH)})")
+
+# SET_MANY_CAUGHT_SQL for many users at once, from staged_caught rows
+# (line, user_id, name, is_caught). Collections are locked in user order
+# and counts in id order, like the single-user statements.
+MERGE_STAGED_CAUGHT_SQL = db.text(f"""
+    WITH input AS (
+        SELECT DISTINCT ON (s.user_id, creatures.id)
+               s.user_id, creatures.id AS creature_id, creatures.ordinal, s.is_caught
+        FROM staged_caught s
+        JOIN creatures ON creatures.category = :category
+                      AND lower(creatures.name) = lower(btrim(s.name))
+        ORDER BY s.user_id, creatures.id, s.line DESC
+    ), masks AS (
+        SELECT u.user_id,
+               CAST(string_agg(CASE WHEN input.is_caught THEN '1' ELSE '0' END, ''
+                               ORDER BY i) AS varbit) AS set_bits,
+               CAST(string_agg(CASE WHEN NOT input.is_caught THEN '1' ELSE '0' END, ''
+                               ORDER BY i) AS varbit) AS clear_bits
+        FROM (SELECT DISTINCT user_id FROM input) AS u
+        CROSS JOIN generate_series(0, (SELECT max(ordinal) FROM input)) AS i
+        LEFT JOIN input ON input.user_id = u.user_id AND input.ordinal = i
+        GROUP BY u.user_id
+    ), old AS (
+        SELECT collections.user_id, collections.caught FROM collections
+        JOIN masks ON masks.user_id = collections.user_id
+        WHERE collections.category = :category
+        ORDER BY collections.user_id
+        FOR UPDATE OF collections
+    ), changed AS (
+        INSERT INTO collections AS c (user_id, category, caught)
+        SELECT masks.user_id, :category, masks.set_bits
+        FROM masks LEFT JOIN old ON old.user_id = masks.user_id
+        WHERE strpos(CAST(masks.set_bits AS text), '1') > 0 OR old.caught IS NOT NULL
+        ORDER BY masks.user_id
+        ON CONFLICT (user_id, category) DO UPDATE
+        SET caught = {_MERGED_BITS}
+        WHERE {_MERGED_BITS} <> {_padded('c.caught', _WIDTH)}
+        RETURNING c.user_id
+    ), bumped AS (
+        UPDATE users SET collection_version = collection_version + 1
+        WHERE id IN (SELECT user_id FROM changed)
+    ), counted AS (
+        INSERT INTO catch_counts AS t (creature_id, caught)
+        SELECT creature_id, sum(delta) FROM (
+            SELECT input.creature_id, CAST(input.is_caught AS integer)
+                   - CASE WHEN length(old.caught) > input.ordinal
+                          THEN get_bit(old.caught, input.ordinal) ELSE 0 END AS delta
+            FROM input LEFT JOIN old ON old.user_id = input.user_id) AS deltas
+        GROUP BY creature_id
+        HAVING sum(delta) <> 0
+        ORDER BY creature_id
+        ON CONFLICT (creature_id) DO UPDATE SET caught = t.caught + EXCLUDED.caught
+    )
+    SELECT count(*) AS rows, count(DISTINCT user_id) AS users,
+           (SELECT count(*) FROM changed) AS changed
+    FROM input
+""")
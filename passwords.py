@@ -0,0 +1,116 @@
+"""Bounded worker pool for password hashing.
+
+bcrypt is deliberately slow, and its C code releases the GIL, so hashes
+run on a small thread pool instead of the request thread. The limit on
+hashes in flight is shared by every worker process on the host (one
+flock'd file per slot; see HashSlots), since gunicorn's sync workers
+each take one request at a time and a per-process limit could never
+fill. A request that can't get a slot within the wait, or whose hash
+outlives the timeout, gets HashingBusy so the view can answer 503
+instead of stalling.
+
+Size the pool with HASH_POOL_WORKERS (default: CPU count),
+HASH_POOL_WAIT (seconds to wait for a slot, default 1) and
+HASH_POOL_TIMEOUT (seconds to wait for a hash, default 10).
+HASH_POOL_DIR holds the slot files (default: a temp directory).
+"""
+import fcntl
+import os
+import tempfile
+import threading
+import time
+from concurrent import futures
+
+SLOTS_DIR = os.environ.get('HASH_POOL_DIR', os.path.join(tempfile.gettempdir(), 'acnh-hash-slots'))
+
+
+class HashingBusy(Exception):
+    """No hashing slot came free in time, or the hash took too long."""
+
+
+class HashSlots:
+    """At most `size` holders at once across every process using `directory`.
+
+    Each slot is an exclusive flock on its own file. The kernel drops a
+    process's locks when it exits, so a killed worker never leaks a slot.
+    """
+
+    def __init__(self, size, directory=SLOTS_DIR, poll_interval=0.005):
+        self.size = size
+        self.directory = directory
+        self.poll_interval = poll_interval
+
+    def acquire(self, wait):
+        """Take a free slot, waiting up to `wait` seconds; return its token
+        for release(), or None if none came free."""
+
+        os.makedirs(self.directory, exist_ok=True)
+        deadline = time.monotonic() + wait
+        while True:
+            for n in range(self.size):
+                fd = os.open(os.path.join(self.directory, f'slot-{n}'), os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except BlockingIOError:
+                    os.close(fd)
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def release(self, fd):
+        os.close(fd)
+
+
+class HashPool:
+    """Run CPU-heavy calls on at most `workers` threads per host."""
+
+    def __init__(self, workers=None, wait=1, timeout=10, slots_dir=SLOTS_DIR):
+        self.workers = workers or os.cpu_count() or 1
+        self.wait = wait
+        self.timeout = timeout
+        self._slots = HashSlots(self.workers, slots_dir)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def run(self, fn, *args):
+        """Call fn(*args) on the pool and return its result.
+
+        Raises HashingBusy if no slot is free within `wait` seconds or the
+        call takes over `timeout` seconds. A call that times out keeps its
+        slot until it actually finishes.
+        """
+
+        fd = self._slots.acquire(self.wait)
+        if fd is None:
+            raise HashingBusy()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release(fd)
+            raise
+        future.add_done_callback(lambda _: self._slots.release(fd))
+
+        try:
+            return future.result(timeout=self.timeout)
+        except futures.TimeoutError:
+            raise HashingBusy()
+
+    def _get_executor(self):
+        # Created on first use so threads are never started before a fork.
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = futures.ThreadPoolExecutor(max_workers=self.workers,
+                                                                thread_name_prefix='hash')
+        return self._executor
+
+
+def _env_number(name, default=None):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+hash_pool = HashPool(workers=int(_env_number('HASH_POOL_WORKERS', 0)),
+                     wait=_env_number('HASH_POOL_WAIT', 1),
+                     timeout=_env_number('HASH_POOL_TIMEOUT', 10))
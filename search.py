@@ -0,0 +1,152 @@
+"""In-memory search over the fish catalog.
+
+Built once per catalog version (see catalog.FishCatalog) so a search is
+a handful of integer operations, not a scan of every fish:
+
+- availability: for each hemisphere, one bitset per (month, hour) slot
+  with a bit set for every fish catchable then
+- names: a bitset per trigram of every name, plus the sorted names for
+  prefix lookups of one- and two-letter queries
+
+Bit i stands for the i-th fish in catalog order. Availability itself is
+stored on Fish as bitmasks: months_north/months_south (bit m-1 for month
+m) and hours (bit h for hour h).
+"""
+import datetime
+from bisect import bisect_left
+from collections import namedtuple
+
+HEMISPHERES = ('north', 'south')
+
+SearchArgs = namedtuple('SearchArgs', ['q', 'hemisphere', 'month', 'hour'])
+
+
+def to_mask(values, offset=0):
+    """Bitmask with bit (v - offset) set for each v in `values`."""
+
+    mask = 0
+    for value in values:
+        mask |= 1 << (value - offset)
+    return mask
+
+
+def from_mask(mask, offset=0):
+    """Inverse of to_mask: the sorted values whose bits are set."""
+
+    return [bit + offset for bit in range(mask.bit_length()) if mask >> bit & 1]
+
+
+def trigrams(text):
+    """Set of three-letter substrings of lower-cased `text`."""
+
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class FishSearchIndex:
+    """Availability and name index over a list of Fish rows."""
+
+    def __init__(self, rows):
+        self.items = [{'id': f.id,
+                       'name': f.name,
+                       'icon_url': f.icon_url,
+                       'catchphrase': f.catchphrase,
+                       'price': f.price,
+                       'location': f.location}
+                      for f in rows]
+        self.positions = {item['id']: i for i, item in enumerate(self.items)}
+        self.all = (1 << len(self.items)) - 1
+
+        self.slots = {hemisphere: [0] * (12 * 24) for hemisphere in HEMISPHERES}
+        self.trigrams = {}
+        for i, f in enumerate(rows):
+            bit = 1 << i
+            hours = from_mask(f.hours)
+            for hemisphere, months in (('north', f.months_north), ('south', f.months_south)):
+                slots = self.slots[hemisphere]
+                for month in from_mask(months, offset=1):
+                    for hour in hours:
+                        slots[(month - 1) * 24 + hour] |= bit
+            for gram in trigrams(f.name):
+                self.trigrams[gram] = self.trigrams.get(gram, 0) | bit
+
+        self.names = sorted((f.name.lower(), i) for i, f in enumerate(rows))
+
+    def available(self, hemisphere, month, hour):
+        """Bitset of fish catchable in `hemisphere` at `month` (1-12) and `hour` (0-23)."""
+
+        return self.slots[hemisphere][(month - 1) * 24 + hour]
+
+    def matching(self, q):
+        """Bitset of fish whose name contains `q` (starts with it, if shorter than 3)."""
+
+        q = q.lower()
+        if len(q) < 3:
+            bits = 0
+            start = bisect_left(self.names, (q,))
+            for name, i in self.names[start:]:
+                if not name.startswith(q):
+                    break
+                bits |= 1 << i
+            return bits
+
+        bits = self.all
+        for gram in trigrams(q):
+            bits &= self.trigrams.get(gram, 0)
+            if not bits:
+                return 0
+        # Trigrams can match out of order; confirm the few candidates.
+        return sum(1 << i for i in self._members(bits) if q in self.items[i]['name'].lower())
+
+    def ids_bits(self, fish_ids):
+        """Bitset of the fish in `fish_ids`."""
+
+        return sum(1 << self.positions[fish_id] for fish_id in fish_ids if fish_id in self.positions)
+
+    def search(self, args, exclude_ids=()):
+        """Fish matching SearchArgs `args`, minus `exclude_ids`, in catalog order."""
+
+        bits = self.all
+        if args.month is not None:
+            bits &= self.available(args.hemisphere, args.month, args.hour)
+        if args.q:
+            bits &= self.matching(args.q)
+        if exclude_ids:
+            bits &= ~self.ids_bits(exclude_ids)
+        return [self.items[i] for i in self._members(bits)]
+
+    @staticmethod
+    def _members(bits):
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+
+
+def parse_search_args(args, default_now=False):
+    """Parse search query string `args` (request.args).
+
+    ?q= filters by name, ?hemisphere=north|south (default north) and
+    ?month=1-12&hour=0-23 by availability; ?now=true, or `default_now`,
+    uses the server's current month and hour instead.
+
+    Raises ValueError with a message fit for a 400 response.
+    """
+
+    hemisphere = args.get('hemisphere', 'north')
+    if hemisphere not in HEMISPHERES:
+        raise ValueError("hemisphere must be north or south")
+
+    month = hour = None
+    if 'month' in args or 'hour' in args:
+        try:
+            month, hour = int(args['month']), int(args['hour'])
+        except (KeyError, ValueError):
+            raise ValueError("month and hour must both be integers")
+        if not (1 <= month <= 12 and 0 <= hour <= 23):
+            raise ValueError("month must be 1-12 and hour 0-23")
+    elif args.get('now') == 'true' or default_now:
+        now = datetime.datetime.now()
+        month, hour = now.month, now.hour
+
+    return SearchArgs(q=args.get('q', '').strip(), hemisphere=hemisphere, month=month, hour=hour)
@@ -1,4 +1,39 @@
+"""Sync the fish table with the ACNH API.
+
+Safe to run repeatedly. Run like:
+
+    python seed.py                       # fetch from acnhapi.com
+    python seed.py --file fish.json      # use a recorded API payload
+    python seed.py --api-url http://localhost:8000/v1a
+    python seed.py --force               # sync even if the API reports no change
+"""
+import argparse
+
 from models import db
-from app import app, load_database
+from app import create_app, load_database, get_all_fish
+from api_client import API_BASE_URL
+from catalog import load_fish_file, format_report
+
+parser = argparse.ArgumentParser(description="Sync the fish table with the ACNH API.")
+parser.add_argument('--file', help="recorded API fish payload to load instead of the API")
+parser.add_argument('--api-url', default=API_BASE_URL, help="ACNH API base URL")
+parser.add_argument('--force', action='store_true',
+                    help="sync even if the API reports no change since the last sync")
+args = parser.parse_args()
+
+with create_app().app_context():
+    db.create_all()
+
+    if args.file:
+        all_fish, etag = load_fish_file(args.file), None
+    else:
+        all_fish, etag = get_all_fish(args.api_url, only_if_changed=not args.force)
 
-load_database()
\ No newline at end of file
+    if all_fish is None:
+        print("Fish catalog unchanged upstream; nothing to sync.")
+    else:
+        report = load_database(all_fish, source_etag=etag)
+        print(format_report(report))
+        icons = report['icons']
+        print(f"Icons: {len(icons['downloaded'])} downloaded, {len(icons['failed'])} failed, "
+              f"sprite {icons['sprite'] or 'not built'}")
@@ -0,0 +1,76 @@
+"""Public, read-only snapshots of users' collections behind share tokens.
+
+A user who shares their collection gets a random token; /share/<token>
+shows it as a page and /api/share/<token> as JSON. Each snapshot is
+rendered once per collection version, catalog version and sprite sheet,
+then served from a per-worker cache (SHARE_CACHE_BYTES, default 4 MB).
+The owner's next change bumps users.collection_version, so the next view
+renders a fresh snapshot and the old one ages out. A view costs one
+token lookup and no joins.
+
+Snapshots hold nothing about the viewer, so the share routes never read
+the session cookie and are sent public, with a strong ETag, for CDNs and
+proxies to cache and revalidate (see public_etag in app.py). A revoked
+or rotated token can live on in those caches for up to SHARE_MAX_AGE
+seconds.
+"""
+import hashlib
+import os
+
+from flask import render_template
+
+from catalog import caught_ids, collection_items, count_caught
+from fragments import FragmentCache
+from listing import encode
+from metrics import metrics
+from models import Collection, User
+
+snapshot_cache = FragmentCache(int(os.environ.get('SHARE_CACHE_BYTES', 4 * 1024 * 1024)),
+                               name='share_cache')
+metrics.add_collector(snapshot_cache.prometheus_lines)
+
+
+def find_share(token):
+    """Return (id, username, collection_version) of `token`'s owner, or None."""
+
+    return User.shared_by(token)
+
+
+def snapshot_etag(share, catalog, icons, release_id):
+    """Opaque ETag of a share's snapshot; changes with everything it shows."""
+
+    key = f'{share.id}.{share.collection_version}.{catalog.version}.{icons.sprite}.{release_id}'
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def snapshot_items(share, catalog):
+    """Return (caught count, items) of a share's collection in fish id order."""
+
+    bits = Collection.bitmap(share.id)
+    items = [{key: value for key, value in item.items() if key != 'user_id'}
+             for item in collection_items(catalog, share.id, caught_ids(catalog, bits))]
+    return count_caught(catalog, bits), items
+
+
+def snapshot_json(token, share, catalog, etag):
+    """The shared collection as JSON bytes:
+    {username, caught, total, fish: [{fish_id, name, icon_url, catchphrase, is_caught}]}."""
+
+    def render():
+        caught, items = snapshot_items(share, catalog)
+        return encode({'username': share.username, 'caught': caught,
+                       'total': len(catalog.ids), 'fish': items})
+
+    return snapshot_cache.get_or_render(('json', token, etag), render)
+
+
+def snapshot_html(token, share, catalog, icons, etag):
+    """The shared collection as a read-only page."""
+
+    def render():
+        caught, items = snapshot_items(share, catalog)
+        return render_template('share/index.html', username=share.username, fish=items,
+                               caught=caught, total=len(catalog.ids),
+                               icons=icons.icons, sprite_css=icons.css)
+
+    return snapshot_cache.get_or_render(('html', token, etag), render)
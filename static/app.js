@@ -1,29 +1,95 @@
-$(".card").on('click', ".btn", async function processForm(evt){
+// Clicks update the card right away and are sent to the server in batches:
+// changes made less than FLUSH_DELAY ms apart go out as one bulk PATCH.
+const FLUSH_DELAY = 400;
+let pendingChanges = new Map();
+let flushTimer = null;
+let pendingUserId = null;
+// Batches are sent one after another so a later batch can't be overtaken.
+let inFlight = Promise.resolve();
+
+$(".card").on('click', ".btn", function processForm(evt){
     evt.preventDefault();
-    let userId = $(evt.target.parentElement).data('user-id');
-    let dataFishId = $(evt.target.parentElement).data('fish-id');
-    let fishId = getSecondPart(dataFishId);
-
-    const resp = await axios.patch(`/api/users/${userId}/fish/${fishId}`);
-    if(resp.data.fish.is_caught === true){
-        $(evt.target).hide();
-        $(evt.target.parentElement).append(`<a href="/fish/${fishId}" class="btn btn-danger fish-uncaught-btn">Uncaught</a>`);
-        showCatchphraseAlert(fishId);
-    }   else {
-        $(evt.target).hide();
-        $(evt.target.parentElement).append(`<a href="/fish/${fishId}" class="btn btn-success fish-caught-btn">Caught!</a>`);
+    let card = $(evt.target.parentElement);
+    let userId = $('#fish-grid').data('user-id');
+    let fishId = getSecondPart(card.data('fish-id'));
+    let isCaught = $(evt.target).hasClass('fish-caught-btn');
+
+    renderFishButton(card, fishId, isCaught);
+    if(!isCaught){
         showWarningAlert();
     }
+
+    // Re-setting a key keeps its original position, so delete first to
+    // remember which fish was clicked last.
+    pendingChanges.delete(fishId);
+    pendingChanges.set(fishId, isCaught);
+    pendingUserId = userId;
+    clearTimeout(flushTimer);
+    flushTimer = setTimeout(flushChanges, FLUSH_DELAY);
 });
 
+// Don't lose a pending batch when the user navigates away.
+window.addEventListener('pagehide', function(){
+    if(pendingChanges.size === 0) return;
+    fetch(`/api/users/${pendingUserId}/fish`, {
+        method: 'PATCH',
+        keepalive: true,
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({fish: takeChanges()})
+    });
+});
+
+function takeChanges(){
+    let changes = Array.from(pendingChanges, ([fishId, isCaught]) => ({fish_id: Number(fishId), is_caught: isCaught}));
+    pendingChanges = new Map();
+    clearTimeout(flushTimer);
+    return changes;
+}
+
+function flushChanges(){
+    if(pendingChanges.size === 0) return;
+    let changes = takeChanges();
+    inFlight = inFlight.then(() => sendChanges(changes));
+}
+
+async function sendChanges(changes){
+    try {
+        const resp = await fetch(`/api/users/${pendingUserId}/fish`, {
+            method: 'PATCH',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({fish: changes})
+        });
+        if(!resp.ok) throw new Error(`PATCH failed with ${resp.status}`);
+        const data = await resp.json();
+        let lastCaught = changes.filter(c => c.is_caught).pop();
+        if(lastCaught){
+            let fish = data.fish.find(f => f.fish_id === lastCaught.fish_id);
+            if(fish) showCatchphraseAlert(fish.catchphrase);
+        }
+    } catch(err) {
+        // Undo the optimistic update for the whole batch.
+        for(let change of changes){
+            renderFishButton($(`#fishcard-${change.fish_id}`), change.fish_id, !change.is_caught);
+        }
+        showErrorAlert();
+    }
+}
+
+function renderFishButton(card, fishId, isCaught){
+    card.children('.btn').remove();
+    if(isCaught){
+        card.append(`<a href="/fish/${fishId}" class="btn btn-danger fish-uncaught-btn">Uncaught</a>`);
+    } else {
+        card.append(`<a href="/fish/${fishId}" class="btn btn-success fish-caught-btn">Caught!</a>`);
+    }
+}
+
 // copied this getSecondPart function from artlung in https://stackoverflow.com/questions/573145/get-everything-after-the-dash-in-a-string-in-javascript/35236900
 function getSecondPart(str) {
     return str.split('-')[1];
 }
 
-async function showCatchphraseAlert(fishId){
-    const fishResp = await axios.get(`/api/fish/${fishId}`);
-    const catchphrase = fishResp.data.fish.catchphrase;
+function showCatchphraseAlert(catchphrase){
     $('#message-container').empty();
     $('#message-container').append(`<div class="alert alert-success alert-dismissible fade show" role="alert">${catchphrase}
     <button type="button" class="close" data-dismiss="alert" aria-label="Close">
@@ -40,4 +106,14 @@ function showWarningAlert(){
     </button>
     </div>`);
     $('.alert').alert()
-}
\ No newline at end of file
+}
+
+function showErrorAlert(){
+    $('#message-container').empty();
+    $('#message-container').append(`<div class="alert alert-danger alert-dismissible fade show" role="alert">
+    Sorry, we couldn\'t save your last changes. Please try again.<button type="button" class="close" data-dismiss="alert" aria-label="Close">
+    <span aria-hidden="true">&times;</span>
+    </button>
+    </div>`);
+    $('.alert').alert()
+}
@@ -0,0 +1,102 @@
+"""Catch statistics: a user's progress and the most caught fish.
+
+A user's caught count is a popcount of their collection bitmap (see
+catalog.count_caught): one primary key read however many users there
+are. How many users caught each fish is kept in catch_counts by the
+statements that change collections (see models.CatchCount), so the
+most caught list reads one row per fish and never scans collections.
+
+Changes to collections made any other way (deleting a user, a data
+migration) let catch_counts drift until reconcile_catch_counts recounts
+them from the bitmaps. Schedule it, e.g. nightly:
+
+    python stats.py
+"""
+from catalog import count_caught
+from models import db, CatchCount, Collection
+
+MOST_CAUGHT_LIMIT = 10
+MAX_MOST_CAUGHT_LIMIT = 100
+
+
+def user_progress(catalog, user_id):
+    """{'caught': n, 'total': m}: how many of the catalog's fish the user caught."""
+
+    return {'caught': count_caught(catalog, Collection.bitmap(user_id)),
+            'total': len(catalog.ids)}
+
+
+def most_caught(catalog, limit=MOST_CAUGHT_LIMIT):
+    """The `limit` most caught fish, most caught first:
+    [{'fish_id', 'name', 'icon_url', 'caught'}]."""
+
+    return [{'fish_id': fish_id,
+             'name': catalog.fish[fish_id]['name'],
+             'icon_url': catalog.fish[fish_id]['icon_url'],
+             'caught': caught}
+            for fish_id, caught in CatchCount.most_caught(limit=limit)
+            if fish_id in catalog.fish]
+
+
+def parse_limit(args):
+    """Parse ?limit= for the most caught list.
+
+    Raises ValueError with a message fit for a 400 response.
+    """
+
+    try:
+        limit = int(args.get('limit', MOST_CAUGHT_LIMIT))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= MAX_MOST_CAUGHT_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_MOST_CAUGHT_LIMIT}")
+    return limit
+
+
+def reconcile_catch_counts():
+    """Correct catch_counts from the collection bitmaps; return the ids of
+    the creatures whose count was off.
+
+    One statement counts the bitmaps and the stored counts in the same
+    snapshot and adds the difference, so toggles committed while it runs
+    are kept and nothing is locked beyond the rows it corrects.
+    """
+
+    try:
+        fixed = [row[0] for row in db.session.execute(RECONCILE_SQL)]
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return fixed
+
+
+RECONCILE_SQL = db.text("""
+    WITH counted AS (
+        SELECT c.category, i AS ordinal, count(*) AS caught
+        FROM collections c, generate_series(0, length(c.caught) - 1) AS i
+        WHERE get_bit(c.caught, i) = 1
+        GROUP BY c.category, i
+    ), drift AS (
+        SELECT creatures.id AS creature_id,
+               COALESCE(counted.caught, 0) - COALESCE(catch_counts.caught, 0) AS delta
+        FROM creatures
+        LEFT JOIN counted ON counted.category = creatures.category
+                         AND counted.ordinal = creatures.ordinal
+        LEFT JOIN catch_counts ON catch_counts.creature_id = creatures.id
+    )
+    INSERT INTO catch_counts AS t (creature_id, caught)
+    SELECT creature_id, delta FROM drift WHERE delta <> 0 ORDER BY creature_id
+    ON CONFLICT (creature_id) DO UPDATE SET caught = t.caught + EXCLUDED.caught
+    RETURNING creature_id
+""")
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    with create_app().app_context():
+        # Counting every bitmap can take longer than a web request may.
+        db.session.execute("SET statement_timeout = 0")
+        fixed = reconcile_catch_counts()
+    print(f"Reconciled catch counts: {len(fixed)} creatures corrected.")
@@ -0,0 +1,116 @@
+"""ACNH API client tests, run against a local stand-in server."""
+
+# run these tests like:
+#
+#    python -m unittest test_api_client.py
+
+import os
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import TestCase
+
+import requests
+
+from api_client import ACNHClient
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'fish.json')
+
+
+class FakeACNHHandler(BaseHTTPRequestHandler):
+    """Serve the recorded fish payload with an ETag."""
+
+    etag = '"fish-v1"'
+
+    def do_GET(self):
+        server = self.server
+        server.hits.append(self.headers.get('If-None-Match'))
+
+        if server.failures:
+            server.failures -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        with open(FIXTURE, 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ACNHClientTestCase(TestCase):
+    """Test caching, conditional requests and retries."""
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), FakeACNHHandler)
+        self.server.hits = []
+        self.server.failures = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.cache_dir = tempfile.mkdtemp()
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}/v1a'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir)
+
+    def client(self, **kwargs):
+        kwargs.setdefault('ttl', 0)
+        return ACNHClient(self.base_url, cache_dir=self.cache_dir, backoff=0, **kwargs)
+
+    def test_fresh_cache_skips_request(self):
+        client = self.client(ttl=60)
+
+        first = client.get_json('/fish')
+        second = client.get_json('/fish')
+
+        self.assertEqual(len(first), 4)
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.server.hits), 1)
+
+    def test_unchanged_upstream_costs_one_304(self):
+        client = self.client()
+        _, etag = client.fetch_json('/fish')
+        self.assertEqual(etag, '"fish-v1"')
+
+        self.assertEqual(client.fetch_json('/fish', unless_etag=etag), (None, etag))
+        self.assertEqual(len(client.get_json('/fish')), 4)
+        self.assertEqual(self.server.hits, [None, '"fish-v1"', '"fish-v1"'])
+
+    def test_cache_never_claims_a_sync(self):
+        client = self.client(ttl=60)
+        client.get_json('/fish')
+
+        # A cached, fresh response still has a body for a caller that
+        # synced an older payload, or never synced at all
+        body, etag = client.fetch_json('/fish', unless_etag='"fish-v0"')
+        self.assertEqual((len(body), etag), (4, '"fish-v1"'))
+        self.assertEqual(len(self.client(ttl=60).fetch_json('/fish')[0]), 4)
+        self.assertEqual(len(self.server.hits), 1)
+
+    def test_retries_server_errors(self):
+        self.server.failures = 2
+
+        self.assertEqual(len(self.client(retries=3).get_json('/fish')), 4)
+        self.assertEqual(len(self.server.hits), 3)
+
+    def test_gives_up_after_retries(self):
+        self.server.failures = 5
+
+        with self.assertRaises(requests.HTTPError):
+            self.client(retries=1).get_json('/fish')
+        self.assertEqual(len(self.server.hits), 2)
@@ -0,0 +1,79 @@
+"""Static asset pipeline tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_assets.py
+
+import gzip
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import brotli
+from flask import Flask, render_template_string
+
+from assets import Assets, build
+
+SCRIPT = b"console.log('caught');\n" * 50
+
+
+class AssetsTestCase(TestCase):
+    """Test building, resolving and serving assets."""
+
+    def setUp(self):
+        self.static_dir = tempfile.mkdtemp()
+        self.dist_dir = os.path.join(self.static_dir, 'dist')
+        os.makedirs(os.path.join(self.static_dir, 'images'))
+        with open(os.path.join(self.static_dir, 'app.js'), 'wb') as f:
+            f.write(SCRIPT)
+        with open(os.path.join(self.static_dir, 'images', 'pic.png'), 'wb') as f:
+            f.write(b'\x89PNG not really')
+
+        self.manifest = build(self.static_dir, self.dist_dir)
+
+        self.app = Flask(__name__)
+        self.assets = Assets(self.dist_dir)
+        self.assets.init_app(self.app)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.static_dir)
+
+    def test_build_fingerprints_and_precompresses(self):
+        self.assertRegex(self.manifest['app.js'], r'^app\.[0-9a-f]{12}\.js$')
+        self.assertRegex(self.manifest['images/pic.png'], r'^images/pic\.[0-9a-f]{12}\.png$')
+
+        hashed = os.path.join(self.dist_dir, self.manifest['app.js'])
+        with open(hashed + '.gz', 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), SCRIPT)
+        with open(hashed + '.br', 'rb') as f:
+            self.assertEqual(brotli.decompress(f.read()), SCRIPT)
+        self.assertFalse(os.path.exists(os.path.join(self.dist_dir, self.manifest['images/pic.png']) + '.gz'))
+
+    def test_rebuild_is_stable(self):
+        self.assertEqual(build(self.static_dir, self.dist_dir), self.manifest)
+
+    def test_asset_url(self):
+        with self.app.test_request_context():
+            self.assertEqual(render_template_string("{{ asset_url('app.js') }}"),
+                             f"/assets/{self.manifest['app.js']}")
+            self.assertEqual(render_template_string("{{ asset_url('missing.css') }}"),
+                             "/static/missing.css")
+
+    def test_serves_accepted_encoding(self):
+        url = f"/assets/{self.manifest['app.js']}"
+
+        for accept, encoding in [('gzip, deflate, br', 'br'), ('gzip', 'gzip'), ('', None)]:
+            resp = self.client.get(url, headers={'Accept-Encoding': accept})
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.headers.get('Content-Encoding'), encoding)
+            self.assertIn('javascript', resp.content_type)
+            self.assertEqual(resp.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+            self.assertEqual(resp.headers['Vary'], 'Accept-Encoding')
+            resp.close()
+
+    def test_unknown_asset(self):
+        self.assertEqual(self.client.get('/assets/app.js').status_code, 404)
+        self.assertEqual(self.client.get('/assets/manifest.json').status_code, 404)
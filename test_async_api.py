@@ -0,0 +1,179 @@
+"""Async API tier tests: the same answers as the Flask routes."""
+
+# run these tests like:
+#
+#    python -m unittest test_async_api.py
+
+from unittest import TestCase
+
+from starlette.testclient import TestClient
+
+from app import create_app, CURR_USER_KEY, WROTE_AT_KEY
+from async_api import create_async_app, create_web_app
+from catalog import fish_catalog, caught_ids
+from models import db, User, Fish, Collection
+
+app = create_app('testing')
+async_app = create_async_app('testing')
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+
+
+class AsyncApiTestCase(TestCase):
+    """Test the async routes against the Flask ones."""
+
+    def setUp(self):
+        ctx = app.app_context()
+        ctx.push()
+        self.addCleanup(ctx.pop)
+
+        db.drop_all()
+        db.create_all()
+
+        user = User.register(username="asyncuser", email="async@test.com",
+                             password="asyncuser", profile_img=None)
+        other = User.register(username="otheruser", email="other@test.com",
+                              password="otheruser", profile_img=None)
+        db.session.add_all([Fish(id=id, name=f"fish{id}", icon_url=f"fish{id}.png",
+                                 catchphrase=f"caught fish{id}!")
+                            for id in (11, 12, 13)])
+        db.session.commit()
+        self.user_id = user.id
+        self.other_id = other.id
+
+        # The same logged-in session for both tiers
+        self.flask = app.test_client()
+        with self.flask.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+        cookie = next(c.value for c in self.flask.cookie_jar if c.name == app.session_cookie_name)
+
+        self.client = TestClient(async_app)
+        self.client.__enter__()
+        self.addCleanup(self.client.__exit__, None, None, None)
+        self.client.cookies.set(app.session_cookie_name, cookie)
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def assertSameAsFlask(self, url):
+        flask_resp = self.flask.get(url)
+        resp = self.client.get(url, headers={'Accept-Encoding': 'identity'})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), flask_resp.json)
+        self.assertEqual(resp.headers.get('etag'), flask_resp.headers.get('ETag'))
+        return resp
+
+    def test_fish_json(self):
+        resp = self.assertSameAsFlask('/api/fish')
+        self.assertSameAsFlask('/api/fish/12')
+        self.assertSameAsFlask('/api/fish?limit=2')
+        self.assertSameAsFlask('/api/fish?after=11&fields=id,name')
+        # Unpaginated lists are streamed, as on the Flask tier
+        streamed = self.client.get('/api/fish?fields=id', headers={'Accept-Encoding': 'identity'})
+        self.assertNotIn('content-length', streamed.headers)
+
+        self.assertEqual(self.client.get('/api/fish', headers={'If-None-Match': resp.headers['etag']})
+                         .status_code, 304)
+        self.assertEqual(self.client.get('/api/fish/99').status_code, 404)
+        self.assertEqual(self.client.get('/api/fish?limit=0').status_code, 400)
+
+    def test_gzip_weakens_etag_like_flask(self):
+        # Enough fish for a body over COMPRESS_MIN_SIZE
+        db.session.add_all([Fish(id=id, name=f"fish{id}", icon_url=f"fish{id}.png",
+                                 catchphrase=f"caught fish{id}!")
+                            for id in range(20, 30)])
+        db.session.commit()
+        async_app.state.catalog.invalidate()
+        headers = {'Accept-Encoding': 'gzip'}
+        flask_resp = self.flask.get('/api/fish', headers=headers)
+        resp = self.client.get('/api/fish', headers=headers)
+
+        self.assertEqual(resp.headers['content-encoding'], 'gzip')
+        self.assertTrue(resp.headers['etag'].startswith('W/'))
+        self.assertEqual(resp.headers['etag'], flask_resp.headers['ETag'])
+        # The weak ETag still revalidates
+        self.assertEqual(self.client.get('/api/fish', headers={'If-None-Match': resp.headers['etag']})
+                         .status_code, 304)
+
+    def test_fish_json_sees_catalog_changes(self):
+        self.client.get('/api/fish')
+        db.session.add(Fish(id=14, name="fish14", icon_url="fish14.png", catchphrase="caught fish14!"))
+        db.session.commit()
+        async_app.state.catalog.invalidate()
+
+        self.assertEqual([f['id'] for f in self.client.get('/api/fish').json()['fish']],
+                         [11, 12, 13, 14])
+
+    def test_user_fish_json(self):
+        Collection.set_caught(self.user_id, 12, True)
+
+        resp = self.assertSameAsFlask(f'/api/users/{self.user_id}/fish')
+        self.assertEqual([f['fish_id'] for f in resp.json()['fish'] if f['is_caught']], [12])
+        self.assertEqual(resp.headers['cache-control'], 'private, no-cache')
+        self.assertSameAsFlask(f'/api/users/{self.user_id}/fish?caught=false&limit=1')
+
+        resp = self.client.get(f'/api/users/{self.user_id}/fish',
+                               headers={'If-None-Match': resp.headers['etag']})
+        self.assertEqual(resp.status_code, 304)
+
+    def test_user_fish_json_without_collection(self):
+        resp = self.assertSameAsFlask(f'/api/users/{self.user_id}/fish')
+        self.assertFalse(any(f['is_caught'] for f in resp.json()['fish']))
+
+    def test_toggle(self):
+        resp = self.client.patch(f'/api/users/{self.user_id}/fish/13')
+
+        self.assertEqual(resp.json(), {'fish': {'user_id': self.user_id, 'fish_id': 13,
+                                                'is_caught': True, 'catchphrase': "caught fish13!"}})
+        self.assertEqual(caught_ids(fish_catalog.get(), Collection.bitmap(self.user_id)), {13})
+        self.assertEqual(User.collection_version_of(self.user_id), 1)
+        # No replica configured, so no write time to remember
+        self.assertNotIn('set-cookie', resp.headers)
+
+        resp = self.client.patch(f'/api/users/{self.user_id}/fish/13', json={'is_caught': True})
+        self.assertTrue(resp.json()['fish']['is_caught'])
+        resp = self.client.patch(f'/api/users/{self.user_id}/fish/13')
+        self.assertFalse(resp.json()['fish']['is_caught'])
+        db.session.expire_all()
+        self.assertEqual(caught_ids(fish_catalog.get(), Collection.bitmap(self.user_id)), set())
+
+    def test_toggle_invalid(self):
+        url = f'/api/users/{self.user_id}/fish'
+        self.assertEqual(self.client.patch(f'{url}/99').status_code, 404)
+        self.assertEqual(self.client.patch(f'{url}/13', json={'is_caught': 'yes'}).status_code, 400)
+
+    def test_toggle_remembers_write_for_replica_reads(self):
+        async_app.state.config['SQLALCHEMY_BINDS'] = {'replica': 'postgresql:///test-acnh-replica'}
+        self.addCleanup(async_app.state.config.__setitem__, 'SQLALCHEMY_BINDS', None)
+
+        resp = self.client.patch(f'/api/users/{self.user_id}/fish/13')
+        cookie = resp.cookies[app.session_cookie_name]
+
+        session = async_app.state.sessions.loads(cookie)
+        self.assertEqual(session[CURR_USER_KEY], self.user_id)
+        self.assertIn(WROTE_AT_KEY, session)
+
+    def test_other_users_are_redirected(self):
+        for resp in (self.client.get(f'/api/users/{self.other_id}/fish', allow_redirects=False),
+                     self.client.patch(f'/api/users/{self.other_id}/fish/13', allow_redirects=False)):
+            self.assertEqual(resp.status_code, 302)
+            self.assertEqual(resp.headers['location'], '/')
+
+        self.client.cookies.set(app.session_cookie_name, 'forged')
+        resp = self.client.get(f'/api/users/{self.user_id}/fish', allow_redirects=False)
+        self.assertEqual(resp.status_code, 302)
+
+    def test_web_app_passes_other_requests_to_flask(self):
+        with TestClient(create_web_app('testing')) as client:
+            client.cookies.set(app.session_cookie_name, self.client.cookies[app.session_cookie_name])
+
+            self.assertEqual(client.get('/api/fish').json(), self.flask.get('/api/fish').json)
+            self.assertIn('Log in', client.get('/login').text)
+            # Another method on an async path goes to the Flask route
+            resp = client.patch(f'/api/users/{self.user_id}/fish',
+                                json={'fish': [{'fish_id': 12, 'is_caught': True}]})
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json()['fish'][0]['fish_id'], 12)
@@ -0,0 +1,184 @@
+"""Fish catalog sync tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_catalog.py
+
+import os
+from unittest import TestCase
+
+from sqlalchemy.exc import IntegrityError
+
+from app import create_app
+from models import db, Fish, User, Collection, CatalogVersion, CreatureCategory
+from catalog import load_fish_file, sync_fish, FishCatalog, fish_catalog, caught_ids, count_caught
+from search import from_mask
+
+app = create_app('testing')
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'fish.json')
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+
+
+class CatalogSyncTestCase(TestCase):
+    """Test syncing the fish table from a recorded API payload."""
+
+    def setUp(self):
+        ctx = app.app_context()
+        ctx.push()
+        self.addCleanup(ctx.pop)
+
+        db.drop_all()
+        db.create_all()
+
+        self.all_fish = load_fish_file(FIXTURE)
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_initial_sync(self):
+        report = sync_fish(self.all_fish)
+
+        self.assertEqual(len(report['inserted']), 4)
+        self.assertEqual(report['unchanged'], 0)
+        self.assertEqual(Fish.query.count(), 4)
+        bitterling = Fish.query.filter_by(name="bitterling").one()
+        self.assertEqual(bitterling.icon_url, "https://acnhapi.com/v1/icons/fish/1")
+        self.assertEqual((bitterling.price, bitterling.location), (900, "River"))
+        self.assertEqual(from_mask(bitterling.months_north, offset=1), [1, 2, 3, 11, 12])
+        self.assertEqual(from_mask(bitterling.months_south, offset=1), [5, 6, 7, 8, 9])
+        self.assertEqual(from_mask(bitterling.hours), list(range(24)))
+
+    def test_sync_is_idempotent(self):
+        sync_fish(self.all_fish)
+        report = sync_fish(self.all_fish)
+
+        self.assertEqual(report, {'inserted': [], 'updated': [], 'deleted': [], 'unchanged': 4})
+        self.assertEqual(Fish.query.count(), 4)
+
+    def test_sync_records_source_etag(self):
+        self.assertIsNone(CreatureCategory.synced_etag('fish'))
+        sync_fish(self.all_fish, '"fish-v1"')
+        self.assertEqual(CreatureCategory.synced_etag('fish'), '"fish-v1"')
+
+        # A failed sync records nothing
+        broken = [dict(self.all_fish[0], catchphrase=None)]
+        with self.assertRaises(IntegrityError):
+            sync_fish(broken, '"fish-v2"')
+        self.assertEqual(CreatureCategory.synced_etag('fish'), '"fish-v1"')
+
+        # A payload of unknown origin (e.g. seed.py --file) forgets it
+        sync_fish(self.all_fish)
+        self.assertIsNone(CreatureCategory.synced_etag('fish'))
+
+    def test_sync_updates_and_deletes(self):
+        sync_fish(self.all_fish)
+        dace_id = Fish.query.filter_by(name="dace").one().id
+
+        u = User.register("syncuser", "sync@test.com", "password", None)
+        db.session.commit()
+        bitterling_id = Fish.query.filter_by(name="bitterling").one().id
+        Collection.set_many(u.id, {dace_id: True, bitterling_id: True})
+
+        changed = [dict(f) for f in self.all_fish if f['name'] != "dace"]
+        changed[0]['catchphrase'] = "A new catchphrase!"
+        changed[1]['price'] = 1
+        report = sync_fish(changed)
+
+        self.assertEqual(report['updated'], ["bitterling", "pale chub"])
+        self.assertEqual(report['deleted'], ["dace"])
+        self.assertEqual(report['unchanged'], 1)
+        self.assertEqual(Fish.query.filter_by(name="bitterling").one().catchphrase,
+                         "A new catchphrase!")
+        self.assertEqual(Fish.query.filter_by(name="pale chub").one().price, 1)
+        # The deleted fish's bit is cleared; the other catch survives
+        bits = Collection.bitmap(u.id)
+        self.assertEqual(bits.count('1'), 1)
+        self.assertEqual(caught_ids(fish_catalog.get(), bits), {bitterling_id})
+
+    def test_sync_never_reuses_ordinals(self):
+        sync_fish(self.all_fish)
+        last = Fish.query.order_by(Fish.ordinal.desc()).first()
+        self.assertEqual(last.ordinal, 3)
+
+        kept = [f for f in self.all_fish if f['name'] != last.name]
+        sync_fish(kept)
+        new_fish = dict(self.all_fish[0], name="koi", icon_url="koi.png")
+        sync_fish(kept + [new_fish])
+        self.assertEqual(Fish.query.filter_by(name="koi").one().ordinal, 4)
+
+        # Creatures added outside a sync take from the same high-water mark
+        db.session.delete(Fish.query.filter_by(name="koi").one())
+        db.session.commit()
+        f = Fish(name="carp", icon_url="carp.png", catchphrase="carp!")
+        db.session.add(f)
+        db.session.commit()
+        self.assertEqual(f.ordinal, 5)
+
+
+class FishCatalogTestCase(TestCase):
+    """Test the in-memory catalog and its version polling."""
+
+    def setUp(self):
+        ctx = app.app_context()
+        ctx.push()
+        self.addCleanup(ctx.pop)
+
+        db.drop_all()
+        db.create_all()
+
+        sync_fish(load_fish_file(FIXTURE))
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_snapshot(self):
+        snapshot = FishCatalog().get()
+
+        self.assertEqual(len(snapshot.fish), 4)
+        bitterling_id = Fish.query.filter_by(name="bitterling").one().id
+        self.assertIn(b'"bitterling"', snapshot.one_json[bitterling_id][0])
+        self.assertIn(b'"dace"', snapshot.all_json)
+        self.assertEqual(sorted(snapshot.ordinals.values()), [0, 1, 2, 3])
+
+    def test_count_caught(self):
+        snapshot = FishCatalog().get()
+        by_ordinal = {ordinal: fish_id for fish_id, ordinal in snapshot.ordinals.items()}
+
+        self.assertEqual(count_caught(snapshot, ''), 0)
+        self.assertEqual(count_caught(snapshot, '0101'), 2)
+        self.assertEqual(caught_ids(snapshot, '0101'), {by_ordinal[1], by_ordinal[3]})
+        # Bits past the live fish (deleted or not yet loaded) don't count
+        self.assertEqual(count_caught(snapshot, '10000001'), 1)
+        self.assertEqual(caught_ids(snapshot, '10000001'), {by_ordinal[0]})
+
+    def test_sees_writes_from_other_workers(self):
+        catalog = FishCatalog(poll_interval=0)
+        version = catalog.get().version
+
+        # Another worker's write: no local invalidation, only the version row
+        with db.engine.begin() as conn:
+            conn.execute("INSERT INTO creatures (category, ordinal, name, icon_url, catchphrase) "
+                         "VALUES ('fish', 4, 'koi', 'koi.png', 'koi!')")
+            conn.execute("UPDATE catalog_version SET version = version + 1")
+
+        snapshot = catalog.get()
+        self.assertEqual(snapshot.version, version + 1)
+        self.assertEqual(len(snapshot.fish), 5)
+
+    def test_invalidate_reloads_a_restarted_version(self):
+        catalog = FishCatalog(poll_interval=60)
+        version = catalog.get().version
+
+        # The tables are re-created and refilled up to the same version
+        db.session.rollback()
+        db.drop_all()
+        db.create_all()
+        sync_fish(load_fish_file(FIXTURE)[:2])
+        self.assertEqual(CatalogVersion.current(), version)
+
+        catalog.invalidate()
+        self.assertEqual(len(catalog.get().fish), 2)
@@ -0,0 +1,112 @@
+"""Database engine tests: pool settings and read-replica routing.
+
+Needs a second database standing in for the replica:
+
+    createdb test-acnh-replica
+"""
+
+# run these tests like:
+#
+#    python -m unittest test_engine.py
+
+from unittest import TestCase
+
+from app import create_app, CURR_USER_KEY, WROTE_AT_KEY
+from catalog import fish_catalog
+from models import db, User
+
+app = create_app('testing')
+
+REPLICA_URL = "postgresql:///test-acnh-replica"
+
+
+class EngineTestCase(TestCase):
+    """Test engine options."""
+
+    def setUp(self):
+        ctx = app.app_context()
+        ctx.push()
+        self.addCleanup(ctx.pop)
+
+    def test_engine_options(self):
+        options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+
+        self.assertEqual(db.engine.pool.size(), options['pool_size'])
+        self.assertTrue(db.engine.pool._pre_ping)
+        self.assertEqual(db.session.execute("SHOW statement_timeout").scalar(), '5s')
+        db.session.rollback()
+
+
+class ReplicaRoutingTestCase(TestCase):
+    """Test read-only routes against a primary and a replica database.
+
+    The two databases hold the same user and fish id with different fish
+    names, so each response shows which one it was read from."""
+
+    def setUp(self):
+        ctx = app.app_context()
+        ctx.push()
+        self.addCleanup(ctx.pop)
+
+        app.config['SQLALCHEMY_BINDS'] = {'replica': REPLICA_URL}
+        replica = db.get_engine(app, bind='replica')
+        db.drop_all()
+        db.create_all()
+        db.metadata.drop_all(bind=replica)
+        db.metadata.create_all(bind=replica)
+
+        for engine, name in ((db.engine, 'primaryfish'), (replica, 'replicafish')):
+            with engine.begin() as conn:
+                conn.execute("INSERT INTO users (id, username, email, password) "
+                             "VALUES (1, 'reader', 'reader@test.com', 'x')")
+                conn.execute("INSERT INTO creatures (id, category, ordinal, name, icon_url, catchphrase) "
+                             "VALUES (1, 'fish', 0, %s, 'fish.png', 'caught!')", (name,))
+
+        fish_catalog.invalidate()
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 1
+
+    def tearDown(self):
+        db.session.rollback()
+        app.config['SQLALCHEMY_BINDS'] = None
+        db._replica_down_until = 0
+        fish_catalog.invalidate()
+
+    def test_reads_go_to_replica(self):
+        self.assertIn("replicafish", self.client.get('/fish/1').get_data(as_text=True))
+
+    def test_writes_go_to_primary(self):
+        resp = self.client.patch('/api/users/1/fish/1', json={'is_caught': True})
+
+        self.assertTrue(resp.json['fish']['is_caught'])
+        self.assertEqual(User.collection_version_of(1), 1)
+        with db.reading():
+            self.assertEqual(User.collection_version_of(1), 0)
+
+    def test_read_your_writes(self):
+        self.client.patch('/api/users/1/fish/1', json={'is_caught': True})
+        self.assertIn("primaryfish", self.client.get('/fish/1').get_data(as_text=True))
+
+        # Once the sticky window has passed, reads go back to the replica
+        with self.client.session_transaction() as sess:
+            sess[WROTE_AT_KEY] -= app.config['REPLICA_STICKY_SECONDS']
+        self.assertIn("replicafish", self.client.get('/fish/1').get_data(as_text=True))
+
+    def test_catalog_loads_from_primary(self):
+        self.assertEqual(self.client.get('/api/fish/1').json['fish']['name'], 'primaryfish')
+
+    def test_falls_back_to_primary(self):
+        app.config['SQLALCHEMY_BINDS'] = {'replica': "postgresql:///test-acnh-no-such-replica"}
+
+        self.assertIn("primaryfish", self.client.get('/fish/1').get_data(as_text=True))
+        self.assertTrue(db.replica_failed())
+        # Later requests skip the replica without trying it again
+        self.assertIsNone(db.replica_engine())
+        self.assertIn("primaryfish", self.client.get('/fish/1').get_data(as_text=True))
+
+    def test_no_replica(self):
+        app.config['SQLALCHEMY_BINDS'] = None
+
+        self.assertIsNone(db.replica_engine())
+        self.assertIn("primaryfish", self.client.get('/fish/1').get_data(as_text=True))
@@ -0,0 +1,49 @@
+"""Fragment cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_fragments.py
+
+from unittest import TestCase
+
+from fragments import FragmentCache
+
+
+class FragmentCacheTestCase(TestCase):
+    """Test the card fragment LRU."""
+
+    def test_hits_and_misses(self):
+        cache = FragmentCache(max_bytes=1000)
+        renders = []
+
+        def render():
+            renders.append(1)
+            return "<div>card</div>"
+
+        self.assertEqual(cache.get_or_render((1, 5, True), render), "<div>card</div>")
+        self.assertEqual(cache.get_or_render((1, 5, True), render), "<div>card</div>")
+
+        self.assertEqual(len(renders), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cache.hit_rate(), 0.5)
+
+    def test_evicts_least_recently_used(self):
+        cache = FragmentCache(max_bytes=20)
+
+        cache.get_or_render('a', lambda: "x" * 10)
+        cache.get_or_render('b', lambda: "y" * 10)
+        cache.get_or_render('a', lambda: "x" * 10)
+        cache.get_or_render('c', lambda: "z" * 10)
+
+        self.assertEqual(cache.size, 20)
+        self.assertEqual(cache.evictions, 1)
+        cache.get_or_render('a', lambda: "x" * 10)
+        self.assertEqual(cache.hits, 2)
+        cache.get_or_render('b', lambda: "y" * 10)
+        self.assertEqual(cache.misses, 4)
+
+    def test_metrics_lines(self):
+        cache = FragmentCache(max_bytes=100)
+        cache.get_or_render('a', lambda: "x")
+
+        self.assertIn("acnh_fragment_cache_misses_total 1", cache.prometheus_lines())
@@ -0,0 +1,110 @@
+"""Icon cache tests, run against a local stand-in image server."""
+
+# run these tests like:
+#
+#    python -m unittest test_icons.py
+
+import io
+import shutil
+import tempfile
+import threading
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import TestCase
+
+from PIL import Image
+
+from api_client import ACNHClient
+from icons import IconStore, sync_icons
+
+FishRow = namedtuple('FishRow', ['id', 'name', 'icon_url'])
+
+
+def png(color, size=(128, 96)):
+    out = io.BytesIO()
+    Image.new('RGBA', size, color).save(out, 'PNG')
+    return out.getvalue()
+
+
+class FakeIconHandler(BaseHTTPRequestHandler):
+    """Serve /icons/<n> as a solid PNG; /missing is a 404."""
+
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        if not self.path.startswith('/icons/'):
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        body = png((int(self.path.rsplit('/', 1)[1]) * 40, 0, 0, 255))
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SyncIconsTestCase(TestCase):
+    """Test downloading, thumbnailing and sprite building."""
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), FakeIconHandler)
+        self.server.hits = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.root = tempfile.mkdtemp()
+        self.store = IconStore(self.root)
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+        self.client = ACNHClient(self.base_url, cache_dir=self.root, retries=0)
+        self.fish = [FishRow(id, f'fish{id}', f'{self.base_url}/icons/{id}') for id in (1, 2, 3)]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.root)
+
+    def test_builds_thumbnails_and_sprite(self):
+        report = sync_icons(self.fish, self.client, self.store, size=32)
+
+        self.assertEqual(report['downloaded'], ['fish1', 'fish2', 'fish3'])
+        manifest = self.store.manifest()
+        self.assertEqual(manifest.sprite, report['sprite'])
+        self.assertEqual(sorted(manifest.icons), [1, 2, 3])
+
+        with Image.open(self.store.path(manifest.icons[2]['thumb'])) as thumb:
+            self.assertEqual(thumb.size, (32, 32))
+        with Image.open(self.store.path(manifest.sprite)) as sprite:
+            self.assertEqual(sprite.size, (96, 32))
+
+        with open(self.store.path(manifest.css)) as f:
+            css = f.read()
+        self.assertIn(f'url(/icons/{manifest.sprite})', css)
+        self.assertIn('.fish-icon-3{background-position:-64px -0px}', css)
+
+    def test_unchanged_icons_are_not_downloaded_again(self):
+        first = sync_icons(self.fish, self.client, self.store)
+        self.server.hits.clear()
+
+        second = sync_icons(self.fish, self.client, self.store)
+
+        self.assertEqual(self.server.hits, [])
+        self.assertEqual(second['downloaded'], [])
+        self.assertEqual(second['sprite'], first['sprite'])
+
+    def test_failed_download_is_skipped(self):
+        fish = self.fish + [FishRow(4, 'fish4', f'{self.base_url}/missing'),
+                            FishRow(5, 'fish5', '/static/local.png')]
+
+        report = sync_icons(fish, self.client, self.store)
+
+        self.assertEqual(report['failed'], ['fish4'])
+        self.assertEqual(sorted(self.store.manifest().icons), [1, 2, 3])
+
+    def test_store_is_content_addressed(self):
+        name = self.store.put(b'same bytes', 'png')
+
+        self.assertEqual(self.store.put(b'same bytes', 'png'), name)
+        self.assertRegex(name, r'^[0-9a-f]{64}\.png$')
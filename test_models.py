@@ -4,29 +4,31 @@
 #
 #    python -m unittest test_models.py
 
+import shutil
+import tempfile
+import threading
 from unittest import TestCase
 from sqlalchemy import exc
 
-from app import app
-from models import db, User, Fish, User_Fish
+from app import create_app
+from models import db, User, Fish, Collection
+from passwords import HashPool, HashingBusy
 
-app.config['SQLALCHEMY_DATABASE_URI'] = "postgresql:///test-acnh"
-app.config['SQLALCHEMY_ECHO'] = False
+app = create_app('testing')
 
-# Make Flask errors be real errors, rather than HTML pages with error info
-app.config['TESTING'] = True
-
-# This is a bit of hack, but don't use Flask DebugToolbar
-app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
-
-db.drop_all()
-db.create_all()
+with app.app_context():
+    db.drop_all()
+    db.create_all()
 
 class UserModelTestCase(TestCase):
     """Test views for user."""
 
     def setUp(self):
         """Create test client, add sample data."""
+        ctx = app.app_context()
+        ctx.push()
+        self.addCleanup(ctx.pop)
+
         db.drop_all()
         db.create_all()
 
@@ -68,8 +70,8 @@ class UserModelTestCase(TestCase):
         db.session.add(u)
         db.session.commit()
 
-        # User should have 1 fish registered
-        self.assertEqual(len(u.fish), 0)
+        # User should have no fish caught yet
+        self.assertEqual(Collection.bitmap(u.id), '')
     
     ###### Signup Tests ######
     def test_valid_signup(self):
@@ -119,11 +121,68 @@ class UserModelTestCase(TestCase):
     def test_wrong_password(self):
         self.assertFalse(User.authenticate(self.u1.username, "badpassword"))
 
+    def test_rehash_on_login(self):
+        self.assertTrue(self.u1.password.startswith("$2b$04$"))
+
+        app.config['BCRYPT_LOG_ROUNDS'] = 5
+        try:
+            u = User.authenticate(self.u1.username, "password")
+            db.session.commit()
+        finally:
+            app.config['BCRYPT_LOG_ROUNDS'] = 4
+
+        self.assertTrue(u.password.startswith("$2b$05$"))
+        self.assertEqual(User.authenticate(self.u1.username, "password").id, self.uid1)
+
+    def test_hash_pool_backpressure(self):
+        slots_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, slots_dir)
+        # Two pools on one slot directory stand in for two worker processes
+        pool = HashPool(workers=1, wait=0, slots_dir=slots_dir)
+        other_worker = HashPool(workers=1, wait=0, slots_dir=slots_dir)
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait()
+
+        t = threading.Thread(target=pool.run, args=(slow,))
+        t.start()
+        started.wait()
+        try:
+            with self.assertRaises(HashingBusy):
+                other_worker.run(lambda: None)
+        finally:
+            release.set()
+            t.join()
+
+        self.assertEqual(other_worker.run(lambda: 42), 42)
+
+    def test_hash_pool_timeout(self):
+        slots_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, slots_dir)
+        pool = HashPool(workers=1, wait=0, timeout=0.05, slots_dir=slots_dir)
+        release = threading.Event()
+
+        with self.assertRaises(HashingBusy):
+            pool.run(release.wait)
+        # The timed out hash keeps its slot until it finishes
+        with self.assertRaises(HashingBusy):
+            pool.run(lambda: None)
+
+        release.set()
+        pool.wait = 5
+        self.assertEqual(pool.run(lambda: 42), 42)
+
 class FishModelTestCase(TestCase):
     """Test views for fish."""
 
     def setUp(self):
         """Make demo data."""
+        ctx = app.app_context()
+        ctx.push()
+        self.addCleanup(ctx.pop)
 
         Fish.query.delete()
         db.session.commit()
@@ -151,8 +210,17 @@ class FishModelTestCase(TestCase):
         db.session.add(f)
         db.session.commit()
 
-        # Fish should have 0 user_fish relationship
-        self.assertEqual(len(f.user_fish), 0)
+        # Fish are creatures of the fish category, numbered in order
+        self.assertEqual(f.category, 'fish')
+        self.assertEqual(f.ordinal, Fish.query.get(self.fish_id).ordinal + 1)
+
+
+    def test_unmapped_category_rejected(self):
+        # No Creature subclass loads bugs yet, so they can't be stored
+        with self.assertRaises(exc.IntegrityError):
+            db.session.execute("INSERT INTO creatures (category, ordinal, name, icon_url, catchphrase) "
+                               "VALUES ('bugs', 0, 'common butterfly', 'butterfly.png', 'caught!')")
+        db.session.rollback()
     
     def test_duplicate_fish_iconurl(self):
         
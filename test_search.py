@@ -0,0 +1,77 @@
+"""Fish search index tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_search.py
+
+import os
+from collections import namedtuple
+from unittest import TestCase
+
+from werkzeug.datastructures import MultiDict
+
+from catalog import load_fish_file
+from search import FishSearchIndex, parse_search_args, SearchArgs
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'fish.json')
+
+FishRow = namedtuple('FishRow', ['id', 'name', 'icon_url', 'catchphrase', 'price', 'location',
+                                 'months_north', 'months_south', 'hours'])
+
+
+def search_args(q='', hemisphere='north', month=None, hour=None):
+    return SearchArgs(q=q, hemisphere=hemisphere, month=month, hour=hour)
+
+
+class FishSearchIndexTestCase(TestCase):
+    """Test availability and name lookups against the recorded payload."""
+
+    def setUp(self):
+        # bitterling, pale chub, crucian carp, dace
+        self.index = FishSearchIndex([FishRow(id=i, **fish) for i, fish
+                                      in enumerate(load_fish_file(FIXTURE), start=1)])
+
+    def names(self, args, exclude_ids=()):
+        return [f['name'] for f in self.index.search(args, exclude_ids)]
+
+    def test_availability(self):
+        # Bitterling is northern winter only; pale chub 9am-4pm; dace 4pm-9am
+        self.assertEqual(self.names(search_args(month=1, hour=10)),
+                         ["bitterling", "pale chub", "crucian carp"])
+        self.assertEqual(self.names(search_args(month=6, hour=20)), ["crucian carp", "dace"])
+        self.assertEqual(self.names(search_args(hemisphere='south', month=6, hour=20)),
+                         ["bitterling", "crucian carp", "dace"])
+
+    def test_name_search(self):
+        self.assertEqual(self.names(search_args(q="CARP")), ["crucian carp"])
+        self.assertEqual(self.names(search_args(q="a")), [])
+        self.assertEqual(self.names(search_args(q="pa")), ["pale chub"])
+        self.assertEqual(self.names(search_args(q="d")), ["dace"])
+        self.assertEqual(self.names(search_args(q="ter")), ["bitterling"])
+        self.assertEqual(self.names(search_args(q="zzz")), [])
+
+    def test_excludes_caught(self):
+        self.assertEqual(self.names(search_args(month=6, hour=20), exclude_ids={3}), ["dace"])
+
+    def test_items_have_price_and_location(self):
+        self.assertEqual(self.index.search(search_args(q="bitter"))[0]['price'], 900)
+        self.assertEqual(self.index.search(search_args(q="bitter"))[0]['location'], "River")
+
+
+class ParseSearchArgsTestCase(TestCase):
+    """Test query string validation."""
+
+    def test_parse(self):
+        args = parse_search_args(MultiDict({'q': ' carp ', 'hemisphere': 'south',
+                                            'month': '6', 'hour': '20'}))
+        self.assertEqual(args, SearchArgs(q='carp', hemisphere='south', month=6, hour=20))
+
+        self.assertIsNone(parse_search_args(MultiDict()).month)
+        self.assertIsNotNone(parse_search_args(MultiDict({'now': 'true'})).month)
+        self.assertIsNotNone(parse_search_args(MultiDict(), default_now=True).hour)
+
+    def test_invalid(self):
+        for query in [{'hemisphere': 'east'}, {'month': '6'}, {'month': '13', 'hour': '1'},
+                      {'month': 'june', 'hour': '1'}, {'month': '6', 'hour': '24'}]:
+            with self.assertRaises(ValueError):
+                parse_search_args(MultiDict(query))
@@ -0,0 +1,104 @@
+"""Startup tests: import and boot time budgets, and gunicorn preload.
+
+Each measurement runs in a fresh interpreter (best of three), so it counts
+every module the app pulls in.
+"""
+
+# run these tests like:
+#
+#    python -m unittest test_startup.py
+
+import json
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+# Seconds to `import app`, and from create_app() to the first response
+# with the catalog warmed. Roughly 3x what a laptop measures.
+IMPORT_BUDGET = 1.0
+BOOT_BUDGET = 0.5
+
+# Only needed in development, by forms or by the API sync
+LAZY_MODULES = ('flask_debugtoolbar', 'wtforms', 'email_validator', 'requests', 'PIL')
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app
+print(json.dumps({'seconds': time.perf_counter() - start, 'modules': sorted(sys.modules)}))
+"""
+
+BOOT_SCRIPT = """
+import json, time
+from app import create_app
+from catalog import fish_catalog
+from models import db
+
+with create_app('testing').app_context():
+    db.create_all()
+
+start = time.perf_counter()
+app = create_app('testing')
+with app.app_context():
+    fish_catalog.get()
+status = app.test_client().get('/api/fish').status_code
+print(json.dumps({'seconds': time.perf_counter() - start, 'status': status}))
+"""
+
+PRELOAD_SCRIPT = """
+import gc, json, runpy
+from types import SimpleNamespace
+from app import create_app
+from catalog import fish_catalog
+from models import db
+
+app = create_app('testing')
+with app.app_context():
+    db.create_all()
+    db.dispose()
+
+conf = runpy.run_path('gunicorn.conf.py')
+server = SimpleNamespace(cfg=SimpleNamespace(preload_app=True),
+                         app=SimpleNamespace(wsgi=lambda: app), log=None)
+conf['when_ready'](server)
+with app.app_context():
+    pool = db.engine.pool
+print(json.dumps({'warm': fish_catalog._snapshot is not None,
+                  'open_connections': pool.checkedin() + pool.checkedout(),
+                  'frozen': gc.get_freeze_count()}))
+"""
+
+
+def run(script):
+    """Run `script` in a fresh interpreter; return the JSON it prints."""
+
+    result = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            stdout=subprocess.PIPE, check=True)
+    return json.loads(result.stdout.decode().splitlines()[-1])
+
+
+class StartupTestCase(TestCase):
+    """Test what importing and booting the app costs."""
+
+    def test_import_budget(self):
+        runs = [run(IMPORT_SCRIPT) for _ in range(3)]
+
+        seconds = min(r['seconds'] for r in runs)
+        self.assertLess(seconds, IMPORT_BUDGET, f"import app took {seconds:.3f}s")
+        self.assertEqual([m for m in LAZY_MODULES if m in runs[0]['modules']], [])
+
+    def test_boot_budget(self):
+        runs = [run(BOOT_SCRIPT) for _ in range(3)]
+
+        seconds = min(r['seconds'] for r in runs)
+        self.assertEqual(runs[0]['status'], 200)
+        self.assertLess(seconds, BOOT_BUDGET, f"booting took {seconds:.3f}s")
+
+    def test_preload_warms_then_closes_connections(self):
+        result = run(PRELOAD_SCRIPT)
+
+        self.assertTrue(result['warm'])
+        # Workers must not inherit the master's connections
+        self.assertEqual(result['open_connections'], 0)
+        self.assertGreater(result['frozen'], 0)
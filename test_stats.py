@@ -0,0 +1,123 @@
+"""Catch statistics tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_stats.py
+
+from unittest import TestCase
+
+from app import create_app, CURR_USER_KEY
+from catalog import fish_catalog
+from models import db, User, Fish, Collection, CatchCount
+from stats import most_caught, reconcile_catch_counts, user_progress
+
+app = create_app('testing')
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+
+
+class StatsTestCase(TestCase):
+    """Test caught counts, the stats API and the home page."""
+
+    def setUp(self):
+        ctx = app.app_context()
+        ctx.push()
+        self.addCleanup(ctx.pop)
+
+        db.drop_all()
+        db.create_all()
+
+        self.users = [User.register(username=f"statsuser{i}", email=f"stats{i}@test.com",
+                                    password="statsuser", profile_img=None)
+                      for i in range(3)]
+        db.session.add_all([Fish(id=id, name=f"fish{id}", icon_url=f"fish{id}.png",
+                                 catchphrase=f"caught fish{id}!")
+                            for id in (21, 22, 23)])
+        db.session.commit()
+        self.user_ids = [u.id for u in self.users]
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_ids[0]
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def counts(self):
+        return {row.creature_id: row.caught for row in CatchCount.query if row.caught}
+
+    def test_counts_follow_toggles(self):
+        a, b, c = self.user_ids
+        Collection.set_caught(a, 21, True)
+        Collection.set_caught(b, 21)
+        Collection.set_caught(c, 22, True)
+        # Setting a caught fish again changes nothing
+        Collection.set_caught(a, 21, True)
+        self.assertEqual(self.counts(), {21: 2, 22: 1})
+
+        Collection.set_caught(b, 21)
+        Collection.set_caught(c, 22, False)
+        Collection.set_caught(c, 22, False)
+        self.assertEqual(self.counts(), {21: 1})
+
+    def test_counts_follow_bulk_changes(self):
+        a, b, _ = self.user_ids
+        Collection.set_caught(a, 21, True)
+        Collection.set_caught(b, 21, True)
+
+        Collection.set_many(a, {21: False, 22: True, 23: True})
+        Collection.set_many(b, {21: True, 22: True, 23: False})
+        self.assertEqual(self.counts(), {21: 1, 22: 2, 23: 1})
+        self.assertEqual(reconcile_catch_counts(), [])
+
+    def test_reconcile(self):
+        a, b, _ = self.user_ids
+        Collection.set_caught(a, 21, True)
+        Collection.set_caught(b, 22, True)
+        db.session.execute("UPDATE catch_counts SET caught = 7 WHERE creature_id = 21")
+        db.session.delete(User.query.get(b))
+        db.session.commit()
+
+        self.assertEqual(sorted(reconcile_catch_counts()), [21, 22])
+        self.assertEqual(self.counts(), {21: 1})
+        self.assertEqual(reconcile_catch_counts(), [])
+
+    def test_user_progress_and_most_caught(self):
+        a, b, c = self.user_ids
+        Collection.set_many(a, {21: True, 22: True})
+        Collection.set_many(b, {22: True, 23: True})
+        Collection.set_caught(c, 22, True)
+
+        catalog = fish_catalog.get()
+        self.assertEqual(user_progress(catalog, a), {'caught': 2, 'total': 3})
+        self.assertEqual([(f['fish_id'], f['caught']) for f in most_caught(catalog)],
+                         [(22, 3), (21, 1), (23, 1)])
+        self.assertEqual([f['name'] for f in most_caught(catalog, limit=1)], ['fish22'])
+
+    def test_stats_json(self):
+        a, b, _ = self.user_ids
+        self.client.patch(f'/api/users/{a}/fish/23')
+        Collection.set_caught(b, 23, True)
+
+        resp = self.client.get('/api/stats?limit=2')
+        self.assertEqual(resp.json, {'most_caught': [{'fish_id': 23, 'name': 'fish23',
+                                                      'icon_url': 'fish23.png', 'caught': 2}],
+                                     'total': 3})
+        self.assertEqual(self.client.get('/api/stats?limit=0').status_code, 400)
+
+        resp = self.client.get(f'/api/users/{a}/stats')
+        self.assertEqual(resp.json, {'user_id': a, 'caught': 1, 'total': 3})
+        resp = self.client.get(f'/api/users/{b}/stats')
+        self.assertEqual(resp.status_code, 302)
+
+    def test_home_shows_stats(self):
+        a, b, _ = self.user_ids
+        Collection.set_many(a, {21: True, 22: True})
+        Collection.set_caught(b, 22, True)
+
+        html = self.client.get('/').get_data(as_text=True)
+        self.assertIn("You've caught 2/3 fish.", html)
+        self.assertIn("fish22 (2 players)", html)
+        self.assertIn("fish21 (1 player)", html)
@@ -0,0 +1,165 @@
+"""Collection export and import tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_transfer.py
+
+import io
+import json
+from unittest import TestCase
+
+from app import create_app, CURR_USER_KEY
+from catalog import caught_ids, fish_catalog
+from models import db, User, Fish, Collection
+from stats import reconcile_catch_counts
+from transfer import export_all, import_file
+
+app = create_app('testing')
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+
+
+class TransferTestCase(TestCase):
+    """Test streamed exports and COPY imports."""
+
+    def setUp(self):
+        ctx = app.app_context()
+        ctx.push()
+        self.addCleanup(ctx.pop)
+
+        db.drop_all()
+        db.create_all()
+
+        self.users = [User.register(username=f"transferuser{i}", email=f"transfer{i}@test.com",
+                                    password="transferuser", profile_img=None)
+                      for i in range(2)]
+        db.session.add_all([Fish(id=id, name=name, icon_url=f"fish{id}.png",
+                                 catchphrase=f"caught fish{id}!")
+                            for id, name in ((31, "bitterling"), (32, "pale chub"), (33, "sea bass"))])
+        db.session.commit()
+        self.user_ids = [u.id for u in self.users]
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_ids[0]
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def caught(self, user_id):
+        return caught_ids(fish_catalog.get(), Collection.bitmap(user_id))
+
+    def version(self, user_id):
+        return db.session.query(User.collection_version).filter_by(id=user_id).scalar()
+
+    def test_export_csv_and_json(self):
+        a, _ = self.user_ids
+        Collection.set_caught(a, 32, True)
+
+        resp = self.client.get(f'/api/users/{a}/fish/export')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, 'text/csv')
+        self.assertIn('attachment', resp.headers['Content-Disposition'])
+        self.assertEqual(resp.get_data(as_text=True),
+                         "name,is_caught\nbitterling,false\npale chub,true\nsea bass,false\n")
+
+        resp = self.client.get(f'/api/users/{a}/fish/export?format=json')
+        self.assertEqual(resp.json['fish'][1], {'fish_id': 32, 'name': 'pale chub', 'is_caught': True})
+        self.assertEqual(len(resp.json['fish']), 3)
+
+        resp = self.client.get(f'/api/users/{a}/fish/export', headers={'If-None-Match': resp.headers['ETag']})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(self.client.get(f'/api/users/{a}/fish/export?format=xml').status_code, 400)
+
+    def test_export_requires_owner(self):
+        _, b = self.user_ids
+        self.assertEqual(self.client.get(f'/api/users/{b}/fish/export').status_code, 302)
+        self.assertEqual(self.client.post(f'/api/users/{b}/fish/import', data="name,is_caught\n")
+                         .status_code, 302)
+
+    def test_import_csv(self):
+        a, _ = self.user_ids
+        Collection.set_caught(a, 33, True)
+        version = self.version(a)
+
+        body = "name,is_caught\nBitterling,yes\n pale chub ,true\nbitterling,no\nbitterling,t\nsea bass,0\n"
+        resp = self.client.post(f'/api/users/{a}/fish/import', data=body, content_type='text/csv')
+        # The last row for a fish wins; rows counts the fish applied
+        self.assertEqual(resp.json, {'rows': 3, 'changed': True})
+        self.assertEqual(self.caught(a), {31, 32})
+        self.assertEqual(self.version(a), version + 1)
+        self.assertEqual(reconcile_catch_counts(), [])
+
+        # Importing the same file again changes nothing
+        resp = self.client.post(f'/api/users/{a}/fish/import', data=body, content_type='text/csv')
+        self.assertEqual(resp.json, {'rows': 3, 'changed': False})
+        self.assertEqual(self.version(a), version + 1)
+
+    def test_import_json(self):
+        a, _ = self.user_ids
+        resp = self.client.post(f'/api/users/{a}/fish/import',
+                                json={'fish': [{'name': 'sea bass', 'is_caught': True}]})
+        self.assertEqual(resp.json, {'rows': 1, 'changed': True})
+        self.assertEqual(self.caught(a), {33})
+
+        resp = self.client.post(f'/api/users/{a}/fish/import', json={'fish': [{'name': 'sea bass'}]})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_import_rejects_whole_file(self):
+        a, _ = self.user_ids
+        Collection.set_caught(a, 31, True)
+
+        for body in ("name,is_caught\npale chub,true\nkoi,true\n",
+                     "name,is_caught\npale chub,maybe\n",
+                     "name,is_caught\npale chub\n",
+                     "name,is_caught\npale chub,\n"):
+            resp = self.client.post(f'/api/users/{a}/fish/import', data=body, content_type='text/csv')
+            self.assertEqual(resp.status_code, 400, body)
+        self.assertIn('koi', self.client.post(f'/api/users/{a}/fish/import',
+                                              data="name,is_caught\nkoi,true\n").get_data(as_text=True))
+
+        self.assertEqual(self.caught(a), {31})
+        self.assertEqual(reconcile_catch_counts(), [])
+
+    def test_import_too_large(self):
+        a, _ = self.user_ids
+        body = "name,is_caught\n" + "pale chub,true\n" * 100000
+        resp = self.client.post(f'/api/users/{a}/fish/import', data=body, content_type='text/csv')
+        self.assertEqual(resp.status_code, 413)
+
+        # A chunked upload has no Content-Length; the bytes read are counted
+        resp = self.client.post(f'/api/users/{a}/fish/import', input_stream=io.BytesIO(body.encode()),
+                                content_type='text/csv', headers={'Transfer-Encoding': 'chunked'},
+                                environ_overrides={'wsgi.input_terminated': True})
+        self.assertEqual(resp.status_code, 413)
+        self.assertEqual(self.caught(a), set())
+
+        resp = self.client.post(f'/api/users/{a}/fish/import', input_stream=io.BytesIO(b"name,is_caught\nkoi,true\n"),
+                                content_type='text/csv', headers={'Transfer-Encoding': 'chunked'},
+                                environ_overrides={'wsgi.input_terminated': True})
+        self.assertIn('koi', resp.get_data(as_text=True))
+
+    def test_export_all_round_trip(self):
+        a, b = self.user_ids
+        Collection.set_many(a, {31: True, 33: True})
+        Collection.set_caught(b, 32, True)
+
+        exported = b''.join(export_all(fish_catalog.get(), 'csv'))
+        self.assertEqual(exported.decode().splitlines()[:2], ["user_id,name,is_caught", f"{a},bitterling,true"])
+        self.assertEqual(len(exported.decode().splitlines()), 7)
+
+        Collection.set_many(a, {31: False, 32: True})
+        Collection.set_many(b, {32: False})
+        report = import_file(io.BytesIO(exported))
+        self.assertEqual(report, {'rows': 6, 'users': 2, 'changed': 2})
+        self.assertEqual(self.caught(a), {31, 33})
+        self.assertEqual(self.caught(b), {32})
+        self.assertEqual(reconcile_catch_counts(), [])
+
+        exported = b''.join(export_all(fish_catalog.get(), 'json'))
+        self.assertEqual(json.loads(exported)['fish'][0],
+                         {'user_id': a, 'fish_id': 31, 'name': 'bitterling', 'is_caught': True})
+        with self.assertRaisesRegex(ValueError, "unknown users: 999"):
+            import_file(io.BytesIO(b"user_id,name,is_caught\n999,sea bass,true\n"))
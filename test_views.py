@@ -2,27 +2,34 @@
 
 # run these tests like:
 #
-#    FLASK_ENV=production python -m unittest test_views.py
+#    python -m unittest test_views.py
 
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
 from unittest import TestCase
+from unittest.mock import patch
 
-from app import app, CURR_USER_KEY
-from models import db, connect_db, User, Fish, User_Fish
+import brotli
 
-app.config['SQLALCHEMY_DATABASE_URI'] = "postgresql:///test-acnh"
-app.config['SQLALCHEMY_ECHO'] = False
+from sqlalchemy import event
 
-# Make Flask errors be real errors, rather than HTML pages with error info
-app.config['TESTING'] = True
+from app import create_app, CURR_USER_KEY
+from config import get_config
+from models import db, connect_db, User, Fish, Collection
+from catalog import fish_catalog, caught_ids
+from identity import identity_cache
+from passwords import HashingBusy
+from icons import IconManifest, IconStore
 
-# This is a bit of hack, but don't use Flask DebugToolbar
-app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+app = create_app('testing')
 
-db.drop_all()
-db.create_all()
-
-# Don't have WTForms use CSRF at all, since it's a pain to test
-app.config['WTF_CSRF_ENABLED'] = False
+with app.app_context():
+    db.drop_all()
+    db.create_all()
 
 
 class UserViewTestCase(TestCase):
@@ -30,6 +37,9 @@ class UserViewTestCase(TestCase):
 
     def setUp(self):
         """Create test client, add sample data."""
+        ctx = app.app_context()
+        ctx.push()
+        self.addCleanup(ctx.pop)
 
         db.drop_all()
         db.create_all()
@@ -61,18 +71,17 @@ class UserViewTestCase(TestCase):
         f4 = Fish(name="fish2", icon_url="fish2iconurl.jpg", catchphrase="fish2catchphrase")
         db.session.add_all([f1, f2, f3, f4])
         db.session.commit()
-    
-        uf778 = User_Fish(user_id=self.testuser_id, fish_id=f1.id, is_caught=False)
-        uf884 = User_Fish(user_id=self.testuser_id, fish_id=f2.id, is_caught=False)
-        uf1 = User_Fish(user_id=self.testuser_id, fish_id=f3.id, is_caught=False)
-        uf2 = User_Fish(user_id=self.testuser_id, fish_id=f4.id, is_caught=False)
-        db.session.add_all([uf778, uf884, uf1, uf2])
-        db.session.commit()
+
 
         self.f1 = f1
         self.f2 = f2
         self.f3 = f3
         self.f4 = f4
+
+    def caught(self):
+        """Ids of the test user's caught fish."""
+
+        return caught_ids(fish_catalog.get(), Collection.bitmap(self.testuser_id))
     
     def test_show_home(self):
         with self.client as c:
@@ -151,6 +160,507 @@ class UserViewTestCase(TestCase):
             "fish": {
                 "user_id": self.testuser_id,
                 "fish_id": 778,
-                "is_caught": True
+                "is_caught": True,
+                "catchphrase": "fish778catchphrase"
             }
-        })
\ No newline at end of file
+        })
+    def test_edit_fish_json_uncatch(self):
+        self.load_fish()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            url = f"/api/users/{self.testuser_id}/fish/778"
+            c.patch(url)
+            resp = c.patch(url)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertFalse(resp.json["fish"]["is_caught"])
+            self.assertEqual(self.caught(), set())
+
+    def test_get_user_fish_json(self):
+        self.load_fish()
+        Collection.set_caught(self.testuser_id, 884, True)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            resp = c.get(f"/api/users/{self.testuser_id}/fish")
+
+            self.assertEqual(resp.status_code, 200)
+            fish = {f["fish_id"]: f["is_caught"] for f in resp.json["fish"]}
+            self.assertEqual(len(fish), 4)
+            self.assertTrue(fish[884])
+            self.assertFalse(fish[778])
+
+    def test_signup_stores_no_fish(self):
+        self.load_fish()
+
+        with self.client as c:
+            resp = c.post("/register", data={"username": "newuser",
+                                             "email": "new@test.com",
+                                             "password": "newuser"})
+
+            self.assertEqual(resp.status_code, 302)
+            user = User.query.filter_by(username="newuser").one()
+            self.assertEqual(Collection.query.filter_by(user_id=user.id).count(), 0)
+
+    @contextmanager
+    def recording_statements(self):
+        """Collect the SQL statements run inside the block."""
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+    @contextmanager
+    def warm_catalog(self):
+        """Load the fish catalog and keep it from polling inside the block."""
+
+        fish_catalog.get()
+        poll_interval = fish_catalog.poll_interval
+        fish_catalog.poll_interval = 60
+        try:
+            yield
+        finally:
+            fish_catalog.poll_interval = poll_interval
+
+    def count_queries(self, url, headers=None, status=200):
+        """GET `url` as the test user and return the number of SQL statements run."""
+
+        return len(self.queries_for(url, headers, status))
+
+    def queries_for(self, url, headers=None, status=200):
+        """GET `url` as the test user and return the SQL statements run."""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            with self.warm_catalog(), self.recording_statements() as statements:
+                resp = c.get(url, headers=headers)
+                resp.get_data()
+
+            self.assertEqual(resp.status_code, status)
+        return statements
+
+    def test_collection_query_count_is_constant(self):
+        self.load_fish()
+        Collection.set_caught(self.testuser_id, 778, True)
+
+        urls = ["/fish", f"/api/users/{self.testuser_id}/fish"]
+        small = [self.count_queries(url) for url in urls]
+
+        db.session.add_all([Fish(name=f"extra{i}", icon_url=f"extra{i}.jpg", catchphrase="extra")
+                            for i in range(40)])
+        db.session.commit()
+
+        self.assertEqual([self.count_queries(url) for url in urls], small)
+
+    def test_show_all_fish_ordered_by_id(self):
+        self.load_fish()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            resp = c.get(f"/api/users/{self.testuser_id}/fish")
+
+            ids = [f["fish_id"] for f in resp.json["fish"]]
+            self.assertEqual(ids, sorted(ids))
+            self.assertEqual(resp.json["fish"][-1]["catchphrase"], "fish884catchphrase")
+
+    def test_show_all_fish_json(self):
+        self.load_fish()
+
+        with self.client as c:
+            resp = c.get("/api/fish")
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(len(resp.json["fish"]), 4)
+            self.assertIn({"id": 778, "name": "fish778", "icon_url": "fish778iconurl.jpg",
+                           "catchphrase": "fish778catchphrase"}, resp.json["fish"])
+
+    def test_fish_json_served_from_catalog(self):
+        self.load_fish()
+        self.client.get("/api/fish")
+
+        with self.warm_catalog(), self.recording_statements() as statements:
+            resp = self.client.get("/api/fish")
+            resp_one = self.client.get("/api/fish/778")
+            resp_304 = self.client.get("/api/fish/778", headers={"If-None-Match": resp_one.headers["ETag"]})
+
+        self.assertEqual(statements, [])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp_one.json["fish"]["name"], "fish778")
+        self.assertEqual(resp_304.status_code, 304)
+
+    def test_fish_json_sees_new_fish(self):
+        self.load_fish()
+        self.assertEqual(len(self.client.get("/api/fish").json["fish"]), 4)
+
+        db.session.add(Fish(name="newfish", icon_url="newfish.jpg", catchphrase="new!"))
+        db.session.commit()
+
+        self.assertEqual(len(self.client.get("/api/fish").json["fish"]), 5)
+
+    def test_fish_json_pagination(self):
+        self.load_fish()
+
+        with self.client as c:
+            resp = c.get("/api/fish?limit=3&fields=id,name")
+            self.assertEqual(resp.json["fish"], [{"id": 1, "name": "fish1"},
+                                                 {"id": 2, "name": "fish2"},
+                                                 {"id": 778, "name": "fish778"}])
+            self.assertEqual(resp.json["next_after"], 778)
+
+            resp = c.get("/api/fish?limit=3&fields=id&after=778")
+            self.assertEqual(resp.json, {"fish": [{"id": 884}], "next_after": None})
+
+            self.assertEqual(c.get("/api/fish?fields=bogus").status_code, 400)
+
+    def test_user_fish_json_filters(self):
+        self.load_fish()
+        Collection.set_caught(self.testuser_id, 884, True)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            url = f"/api/users/{self.testuser_id}/fish"
+            resp = c.get(f"{url}?caught=true&fields=fish_id,is_caught")
+            self.assertEqual(resp.json, {"fish": [{"fish_id": 884, "is_caught": True}]})
+
+            resp = c.get(f"{url}?caught=false&limit=2&after=1&fields=fish_id")
+            self.assertEqual(resp.json, {"fish": [{"fish_id": 2}, {"fish_id": 778}], "next_after": None})
+
+    def test_api_skips_user_lookup(self):
+        self.load_fish()
+
+        # Ownership is checked against the session claim: only the collection
+        # version and the collection itself are read, never the user row.
+        statements = self.queries_for(f"/api/users/{self.testuser_id}/fish")
+        self.assertEqual(len(statements), 2)
+        self.assertFalse(any("users.password" in statement for statement in statements))
+
+    def test_identity_cache(self):
+        identity_cache.forget(self.testuser_id)
+        app.config['USER_CACHE_TTL'] = 60
+        try:
+            first = self.count_queries("/login")
+            second = self.count_queries("/login")
+            # Another worker shares the collection; this worker's cache isn't told
+            User.query.get(self.testuser_id).share_token = "sharedelsewhere"
+            db.session.commit()
+            html = self.client.get("/").get_data(as_text=True)
+        finally:
+            app.config['USER_CACHE_TTL'] = 0
+            identity_cache.forget(self.testuser_id)
+
+        # The user's display fields are only loaded once, and never the share token
+        self.assertEqual(first, 1)
+        self.assertEqual(second, 0)
+        self.assertIn("/share/sharedelsewhere", html)
+
+    def test_anonymous_api_access(self):
+        resp = self.client.get(f"/api/users/{self.testuser_id}/fish")
+
+        self.assertEqual(resp.status_code, 302)
+
+    def test_login_when_hashing_saturated(self):
+        with patch("models.hash_pool.run", side_effect=HashingBusy):
+            resp = self.client.post("/login", data={"username": "testuser", "password": "testuser"})
+
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp.headers["Retry-After"], "1")
+
+    def test_edit_fish_json_set_state(self):
+        self.load_fish()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            url = f"/api/users/{self.testuser_id}/fish/884"
+            for is_caught in [True, True, False, False]:
+                resp = c.patch(url, json={"is_caught": is_caught})
+                self.assertEqual(resp.json["fish"]["is_caught"], is_caught)
+
+            self.assertNotIn(884, self.caught())
+            self.assertEqual(c.patch(url, json={"is_caught": "yes"}).status_code, 400)
+
+    def test_edit_fish_json_anonymous(self):
+        self.load_fish()
+
+        resp = self.client.patch(f"/api/users/{self.testuser_id}/fish/778")
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertNotIn(778, self.caught())
+
+    def test_edit_fish_json_is_one_statement(self):
+        self.load_fish()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            with self.recording_statements() as statements:
+                c.patch(f"/api/users/{self.testuser_id}/fish/778")
+
+        self.assertEqual(len(statements), 1)
+
+    def test_edit_many_fish_json(self):
+        self.load_fish()
+        Collection.set_caught(self.testuser_id, 884, True)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            changes = [{"fish_id": 778, "is_caught": True},
+                       {"fish_id": 884, "is_caught": False},
+                       {"fish_id": 1, "is_caught": True},
+                       {"fish_id": 1, "is_caught": False},
+                       {"fish_id": 99999, "is_caught": True}]
+            with self.recording_statements() as statements:
+                resp = c.patch(f"/api/users/{self.testuser_id}/fish", json={"fish": changes})
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(len(statements), 1)
+            self.assertEqual([(f["fish_id"], f["is_caught"]) for f in resp.json["fish"]],
+                             [(1, False), (778, True), (884, False)])
+            self.assertEqual(resp.json["fish"][1]["catchphrase"], "fish778catchphrase")
+            self.assertEqual(self.caught(), {778})
+
+    def test_edit_many_fish_json_invalid(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            url = f"/api/users/{self.testuser_id}/fish"
+            self.assertEqual(c.patch(url, json={"fish": [{"fish_id": "1", "is_caught": True}]}).status_code, 400)
+            self.assertEqual(c.patch(url, json={}).status_code, 400)
+
+    def test_server_timing_header(self):
+        self.load_fish()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            resp = c.patch(f"/api/users/{self.testuser_id}/fish/778")
+
+            self.assertRegex(resp.headers["Server-Timing"], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="1 queries"$')
+
+    def test_metrics(self):
+        self.client.get("/api/fish")
+
+        resp = self.client.get("/metrics")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('acnh_requests_total{route="/api/fish",method="GET",status="200"}', str(resp.data))
+        self.assertIn('acnh_request_duration_seconds_bucket{route="/api/fish",method="GET",le="+Inf"}', str(resp.data))
+
+    def test_metrics_token(self):
+        self.assertFalse(get_config('production').METRICS_ENABLED)
+
+        app.config['METRICS_TOKEN'] = 'sekrit'
+        app.config['SERVER_TIMING'] = False
+        try:
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            resp = self.client.get("/api/fish")
+            self.assertNotIn("Server-Timing", resp.headers)
+
+            auth = {"Authorization": "Bearer sekrit"}
+            self.assertEqual(self.client.get("/metrics", headers=auth).status_code, 200)
+            self.assertIn("Server-Timing", self.client.get("/api/fish", headers=auth).headers)
+        finally:
+            app.config['METRICS_TOKEN'] = None
+            app.config['SERVER_TIMING'] = True
+
+    def test_collection_conditional_get(self):
+        self.load_fish()
+
+        c = self.client
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.testuser_id
+
+        for url in ["/fish", f"/api/users/{self.testuser_id}/fish"]:
+            etag = c.get(url).headers["ETag"]
+            # Only the collection version is read
+            self.assertEqual(self.count_queries(url, headers={"If-None-Match": etag}, status=304), 1)
+
+            c.patch(f"/api/users/{self.testuser_id}/fish/778")
+            resp = c.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(resp.status_code, 200)
+            self.assertNotEqual(resp.headers["ETag"], etag)
+            self.assertEqual(resp.headers["Cache-Control"], "private, no-cache")
+
+    def test_show_all_fish_caught_state(self):
+        self.load_fish()
+        Collection.set_caught(self.testuser_id, 778, True)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            html = c.get('/fish').get_data(as_text=True)
+
+            self.assertIn(f'data-user-id="{self.testuser_id}"', html)
+            card_778 = html[html.index('id="fishcard-778"'):html.index('id="fishcard-884"')]
+            self.assertIn("fish-uncaught-btn", card_778)
+            card_884 = html[html.index('id="fishcard-884"'):]
+            self.assertIn("fish-caught-btn", card_884)
+            self.assertNotIn("fish-uncaught-btn", card_884)
+
+    def test_icon_sprite(self):
+        self.load_fish()
+        store = IconStore(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, store.root)
+        icon = store.put(b'icon', 'png')
+        css = store.put(b'.fish-icon{}', 'css')
+        store.write_manifest(IconManifest(sprite=store.put(b'sprite', 'png'), css=css, size=64,
+                                          icons={778: {'source': 'fish778iconurl.jpg',
+                                                       'icon': icon, 'thumb': icon}}))
+
+        with patch('app.icon_store', store):
+            with self.client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            html = self.client.get('/fish').get_data(as_text=True)
+            self.assertIn(f'href="/icons/{css}"', html)
+            self.assertIn('fish-icon-778', html)
+            self.assertNotIn('fish778iconurl.jpg', html)
+            self.assertIn('fish884iconurl.jpg', html)
+
+            self.assertIn(f'src="/icons/{icon}"', self.client.get('/fish/778').get_data(as_text=True))
+
+            resp = self.client.get(f'/icons/{css}')
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+            self.assertIn("Page not found", self.client.get('/icons/manifest.json').get_data(as_text=True))
+
+            # A rebuilt sprite sheet changes the page's ETag, catalog or not
+            etag = self.client.get('/fish').headers['ETag']
+            self.assertEqual(self.client.get('/fish', headers={'If-None-Match': etag}).status_code, 304)
+            store.write_manifest(store.manifest()._replace(sprite=store.put(b'sprite v2', 'png')))
+            os.utime(store.path('manifest.json'), ns=(0, 0))
+            resp = self.client.get('/fish', headers={'If-None-Match': etag})
+            self.assertEqual(resp.status_code, 200)
+            self.assertNotEqual(resp.headers['ETag'], etag)
+
+    def test_compressed_responses(self):
+        self.load_fish()
+
+        c = self.client
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.testuser_id
+
+        resp = c.get('/fish', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        self.assertIn(b'fish884iconurl.jpg', gzip.decompress(resp.data))
+        etag = resp.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        self.assertEqual(c.get('/fish', headers={'If-None-Match': etag}).status_code, 304)
+
+        resp = c.get(f'/api/users/{self.testuser_id}/fish', headers={'Accept-Encoding': 'br, gzip'})
+        self.assertEqual(resp.headers['Content-Encoding'], 'br')
+        self.assertEqual(len(json.loads(brotli.decompress(resp.data))['fish']), 4)
+
+        # Below COMPRESS_MIN_SIZE
+        resp = c.get('/api/fish/778', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(resp.json['fish']['name'], 'fish778')
+
+        resp = c.get('/fish', headers={'Accept-Encoding': 'identity'})
+        self.assertNotIn('Content-Encoding', resp.headers)
+
+    def test_search_and_catchable_fish_json(self):
+        self.load_fish()
+        # fish778 all year, all day; fish884 January evenings only
+        Fish.query.get(778).months_north = 0b111111111111
+        Fish.query.get(778).hours = (1 << 24) - 1
+        Fish.query.get(884).months_north = 0b1
+        Fish.query.get(884).hours = 1 << 20
+        Collection.set_caught(self.testuser_id, 778, True)
+
+        resp = self.client.get('/api/fish/search?month=1&hour=20')
+        self.assertEqual([f['id'] for f in resp.json['fish']], [778, 884])
+        resp = self.client.get('/api/fish/search?q=fish7')
+        self.assertEqual([f['name'] for f in resp.json['fish']], ['fish778'])
+        self.assertEqual(self.client.get('/api/fish/search?hemisphere=up').status_code, 400)
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.testuser_id
+
+        url = f'/api/users/{self.testuser_id}/fish/catchable'
+        self.assertEqual([f['id'] for f in self.client.get(f'{url}?month=1&hour=20').json['fish']], [884])
+        self.assertEqual(self.client.get(f'{url}?month=2&hour=20').json['fish'], [])
+        # Only the caught fish ids are read
+        self.assertEqual(self.count_queries(f'{url}?month=1&hour=20'), 1)
+
+    def test_share_collection(self):
+        self.load_fish()
+        Collection.set_caught(self.testuser_id, 778, True)
+
+        c = self.client
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.testuser_id
+
+        resp = c.post('/share')
+        self.assertEqual(resp.status_code, 302)
+        token = User.query.get(self.testuser_id).share_token
+        self.assertIsNotNone(token)
+        self.assertIn(f'/share/{token}', c.get('/').get_data(as_text=True))
+
+        # Viewed while logged in, a share still doesn't vary by cookie
+        resp = c.get(f'/share/{token}')
+        html = resp.get_data(as_text=True)
+        self.assertIn("testuser has caught 1 of 4 fish", html)
+        self.assertNotIn("Log out", html)
+        self.assertEqual(resp.headers["Cache-Control"], "public, max-age=60")
+        self.assertNotIn("Cookie", resp.headers.get("Vary", ""))
+        self.assertNotIn("Set-Cookie", resp.headers)
+
+        resp = c.get(f'/api/share/{token}')
+        self.assertEqual(resp.json['username'], 'testuser')
+        self.assertEqual((resp.json['caught'], resp.json['total']), (1, 4))
+        self.assertEqual([f['fish_id'] for f in resp.json['fish'] if f['is_caught']], [778])
+        self.assertNotIn('user_id', resp.json['fish'][0])
+
+        # Cached snapshot: only the token is looked up
+        etag = resp.headers["ETag"]
+        self.assertEqual(self.count_queries(f'/api/share/{token}'), 1)
+        self.assertEqual(self.count_queries(f'/api/share/{token}', headers={"If-None-Match": etag},
+                                            status=304), 1)
+
+        # The owner's changes show up in a new snapshot
+        c.patch(f"/api/users/{self.testuser_id}/fish/884")
+        resp = c.get(f'/api/share/{token}', headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers["ETag"], etag)
+        self.assertEqual(resp.json['caught'], 2)
+
+        # A new link revokes the old one; stopping revokes both
+        c.post('/share')
+        new_token = User.query.get(self.testuser_id).share_token
+        self.assertNotEqual(new_token, token)
+        self.assertIn("Page not found", c.get(f'/share/{token}').get_data(as_text=True))
+        c.post('/share/delete')
+        self.assertIsNone(User.query.get(self.testuser_id).share_token)
+        self.assertIn("Page not found", c.get(f'/share/{new_token}').get_data(as_text=True))
+
+    def test_share_requires_login(self):
+        resp = self.client.post('/share')
+        self.assertEqual(resp.status_code, 302)
+        self.assertIsNone(User.query.get(self.testuser_id).share_token)
@@ -0,0 +1,255 @@
+"""Bulk export and import of collections as CSV or JSON.
+
+Exports are streamed: a user's export is read from the in-memory catalog
+and one bitmap; an export of every user (`python transfer.py export`)
+reads collections through a server-side cursor, so memory stays flat
+however many users there are.
+
+Imports COPY the file into a temporary staged_caught table, check every
+name against the catalog (ignoring case) and every user id, then apply
+the whole file with one statement (Collection.merge_staged). Nothing is
+applied unless every row is valid. Rows set a fish caught or uncaught;
+fish a file doesn't mention keep their state.
+
+CSV files have a header line and the columns, in this order:
+
+    name,is_caught              (one user's file, e.g. from the API)
+    user_id,name,is_caught      (every user, e.g. a nightly export)
+
+is_caught is anything Postgres reads as a boolean: true/false, yes/no,
+t/f, 1/0. JSON files look like exports: {"fish": [{"name": ...,
+"is_caught": true}, ...]}, with "user_id" in each item for every user.
+
+Run like:
+
+    python transfer.py export --output nightly.csv
+    python transfer.py export --user 42 --format json
+    python transfer.py import nightly.csv
+    python transfer.py import --user 42 spreadsheet.csv
+"""
+import csv
+import io
+import json
+
+import psycopg2
+from sqlalchemy import Text, cast, select
+
+from catalog import caught_ids, collection_items
+from listing import stream_json
+from models import db, Collection, User
+
+FORMATS = ('csv', 'json')
+MIMETYPES = {'csv': 'text/csv', 'json': 'application/json'}
+
+USER_COLUMNS = ('name', 'is_caught')
+ALL_COLUMNS = ('user_id', 'name', 'is_caught')
+
+# How many rejected names or users an error message lists
+MAX_REPORTED = 10
+
+
+##############################################################################
+# Export
+
+def csv_chunks(header, rows, chunk_size=500):
+    """Yield CSV bytes for `header` and `rows`, `chunk_size` rows at a time."""
+
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    writer.writerow(header)
+    for n, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if n % chunk_size == 0:
+            yield buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode()
+
+
+def _csv_bool(value):
+    return 'true' if value else 'false'
+
+
+def export_user(catalog, user_id, fmt):
+    """Yield a user's collection as CSV (name,is_caught) or JSON
+    {"fish": [{"fish_id", "name", "is_caught"}]} bytes, in fish id order."""
+
+    items = collection_items(catalog, user_id, caught_ids(catalog, Collection.bitmap(user_id)))
+    if fmt == 'csv':
+        return csv_chunks(USER_COLUMNS, ((i['name'], _csv_bool(i['is_caught'])) for i in items))
+    return stream_json('fish', ({'fish_id': i['fish_id'], 'name': i['name'], 'is_caught': i['is_caught']}
+                                for i in items))
+
+
+def export_all(catalog, fmt, category='fish'):
+    """Yield every user's collection, like export_user with a user_id
+    column, in user and fish id order.
+
+    Streams users and their bitmaps through a server-side cursor on a
+    connection of its own; only one batch of them is in memory at a time.
+    """
+
+    def items():
+        query = (select([User.id, cast(Collection.caught, Text)])
+                 .select_from(User.__table__.outerjoin(
+                     Collection.__table__,
+                     (Collection.user_id == User.id) & (Collection.category == category)))
+                 .order_by(User.id))
+        with db.engine.connect() as conn:
+            for user_id, bits in conn.execution_options(stream_results=True).execute(query):
+                yield from collection_items(catalog, user_id, caught_ids(catalog, bits or ''))
+
+    if fmt == 'csv':
+        return csv_chunks(ALL_COLUMNS, ((i['user_id'], i['name'], _csv_bool(i['is_caught']))
+                                        for i in items()))
+    return stream_json('fish', ({'user_id': i['user_id'], 'fish_id': i['fish_id'], 'name': i['name'],
+                                 'is_caught': i['is_caught']}
+                                for i in items()))
+
+
+##############################################################################
+# Import
+
+def json_to_csv(data, columns):
+    """Turn a JSON import {"fish": [{...}]} into a CSV file with `columns`.
+
+    Raises ValueError with a message fit for a 400 response.
+    """
+
+    items = data.get('fish') if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        raise ValueError("fish must be a list")
+
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    writer.writerow(columns)
+    for n, item in enumerate(items, 1):
+        if (not isinstance(item, dict)
+                or not isinstance(item.get('name'), str)
+                or not isinstance(item.get('is_caught'), bool)
+                or ('user_id' in columns and type(item.get('user_id')) is not int)):
+            raise ValueError(f"fish {n}: needs a name, is_caught true or false"
+                             f"{' and an integer user_id' if 'user_id' in columns else ''}")
+        writer.writerow([_csv_bool(item[c]) if c == 'is_caught' else item[c] for c in columns])
+    buf.seek(0)
+    return buf
+
+
+def import_file(f, fmt='csv', user_id=None, category='fish'):
+    """Apply a CSV or JSON import read from file object `f` (see the module
+    docstring) to one user's collection, or with no `user_id` to the users
+    named in the file. Commits only if every row is valid.
+
+    Returns {'rows', 'users', 'changed'}: fish set (the last row for a
+    user's fish wins), users in the file and users whose collection
+    changed. Raises ValueError with a message fit for a 400 response.
+    """
+
+    columns = USER_COLUMNS if user_id is not None else ALL_COLUMNS
+    if fmt == 'json':
+        try:
+            f = json_to_csv(json.load(f), columns)
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ValueError(f"not valid JSON: {e}")
+
+    try:
+        db.session.execute("CREATE TEMPORARY TABLE staged_caught "
+                           "(line serial, user_id integer, name text, is_caught boolean) "
+                           "ON COMMIT DROP")
+        cursor = db.session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY staged_caught ({', '.join(columns)}) "
+                               f"FROM STDIN WITH (FORMAT csv, HEADER true)", f)
+        except psycopg2.DataError as e:
+            raise ValueError(f"could not read the file: {str(e).splitlines()[0]}")
+        if user_id is not None:
+            db.session.execute("UPDATE staged_caught SET user_id = :user_id", {'user_id': user_id})
+
+        check_staged(category)
+        rows, users, changed = Collection.merge_staged(category)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {'rows': rows, 'users': users, 'changed': changed}
+
+
+def check_staged(category):
+    """Raise ValueError unless every staged row has a known fish name, a
+    caught state and an existing user."""
+
+    line = db.session.execute(
+        "SELECT min(line) FROM staged_caught WHERE is_caught IS NULL OR name IS NULL").scalar()
+    if line is not None:
+        raise ValueError(f"row {line}: name and is_caught are required")
+
+    unknown = [row[0] for row in db.session.execute(
+        """SELECT DISTINCT s.name FROM staged_caught s
+           WHERE NOT EXISTS (SELECT 1 FROM creatures
+                             WHERE category = :category AND lower(name) = lower(btrim(s.name)))
+           ORDER BY s.name LIMIT :limit""",
+        {'category': category, 'limit': MAX_REPORTED})]
+    if unknown:
+        raise ValueError(f"unknown {category}: {', '.join(unknown)}")
+
+    missing = [str(row[0]) for row in db.session.execute(
+        """SELECT DISTINCT s.user_id FROM staged_caught s
+           WHERE NOT EXISTS (SELECT 1 FROM users WHERE id = s.user_id)
+           ORDER BY 1 LIMIT :limit""",
+        {'limit': MAX_REPORTED})]
+    if missing:
+        raise ValueError(f"unknown users: {', '.join(missing)}")
+
+
+def file_format(path, fmt=None):
+    """`fmt`, or the format named by `path`'s extension (default csv)."""
+
+    if fmt:
+        return fmt
+    return 'json' if path.lower().endswith('.json') else 'csv'
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+    import sys
+
+    parser = argparse.ArgumentParser(description="Export or import caught fish.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help="write collections as CSV or JSON")
+    export_parser.add_argument('--user', type=int, help="only this user id (default: everyone)")
+    export_parser.add_argument('--format', choices=FORMATS, help="default: from --output, else csv")
+    export_parser.add_argument('--output', help="file to write (default: stdout)")
+    import_parser = commands.add_parser('import', help="apply a CSV or JSON file")
+    import_parser.add_argument('file')
+    import_parser.add_argument('--user', type=int, help="apply a name,is_caught file to this user id")
+    import_parser.add_argument('--format', choices=FORMATS, help="default: from the file name")
+    args = parser.parse_args()
+
+    # Whole-table exports and imports can take longer than a web request may.
+    os.environ.setdefault('DB_STATEMENT_TIMEOUT', '0')
+
+    from app import create_app
+    from catalog import fish_catalog
+
+    with create_app().app_context():
+        if args.command == 'export':
+            fmt = file_format(args.output or '', args.format)
+            catalog = fish_catalog.get()
+            chunks = export_user(catalog, args.user, fmt) if args.user else export_all(catalog, fmt)
+            out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+            try:
+                for chunk in chunks:
+                    out.write(chunk)
+            finally:
+                if args.output:
+                    out.close()
+        else:
+            try:
+                with open(args.file, 'rb') as f:
+                    report = import_file(f, file_format(args.file, args.format), user_id=args.user)
+            except ValueError as e:
+                sys.exit(f"Import rejected, nothing applied: {e}")
+            print(f"Imported {report['rows']} rows for {report['users']} users; "
+                  f"{report['changed']} collections changed.")